@@ -0,0 +1,115 @@
+"""Сторінка `GET /users/` у miniproject2: час залежить від розміру сторінки, а не таблиці.
+
+Запуск з кореня репозиторію:
+
+    python -m bench_users_listing --sizes 10000 100000 --limits 10 100 1000
+
+Для кожного розміру таблиці створюється окрема тимчасова users.db з
+`--hobbies` хобі на користувача, після чого через ASGI без мережі
+вимірюється перша сторінка і сторінка з середини таблиці (за курсором) для
+кожного `--limit`. Для порівняння `--legacy-users` користувачів читаються
+старим способом - окремий `SELECT ... WHERE user_name = ?` на кожного, без
+індексу на hobbies(user_name).
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+import httpx
+
+import miniproject2
+from miniproject2 import encode_cursor
+
+
+HEADERS = {"Authorization": "Bearer bench"}
+
+
+def seed(path: str, users: int, hobbies: int):
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            "INSERT INTO users (name, year, password) VALUES (?, ?, ?)",
+            ((f"user{i:07d}", 1950 + i % 60, "password123") for i in range(users)),
+        )
+        conn.executemany(
+            "INSERT INTO hobbies (user_name, hobby) VALUES (?, ?)",
+            ((f"user{i:07d}", f"hobby{j}") for i in range(users) for j in range(hobbies)),
+        )
+
+
+async def prepare(directory: str, users: int, hobbies: int) -> str:
+    miniproject2.DB_PATH = os.path.join(directory, f"users-{users}.db")
+    await miniproject2.database()
+    await asyncio.to_thread(seed, miniproject2.DB_PATH, users, hobbies)
+    return miniproject2.DB_PATH
+
+
+async def time_page(client: httpx.AsyncClient, params: dict, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = await client.get("/users/", params=params, headers=HEADERS)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+        assert len(response.json()) == params["limit"]
+    return statistics.median(samples)
+
+
+async def legacy_listing(path: str) -> int:
+    # get_users до змін: усі користувачі, потім запит хобі на кожного
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        users = await (await db.execute("SELECT * FROM users")).fetchall()
+        for user in users:
+            await (await db.execute("SELECT hobby FROM hobbies WHERE user_name = ?", (user["name"],))).fetchall()
+        return len(users)
+
+
+async def main_async(args):
+    directory = tempfile.mkdtemp()
+    transport = httpx.ASGITransport(app=miniproject2.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for users in args.sizes:
+            await prepare(directory, users, args.hobbies)
+            middle = encode_cursor(f"user{users // 2:07d}")
+            for limit in args.limits:
+                first = await time_page(client, {"limit": limit}, args.repeats)
+                deep = await time_page(client, {"limit": limit, "cursor": middle}, args.repeats)
+                print(
+                    f"users {users:>7}  limit {limit:>5}  first page {first * 1000:>8.2f} ms  "
+                    f"middle page {deep * 1000:>8.2f} ms  {first / limit * 1e6:>6.1f} us/user"
+                )
+
+        path = await prepare(directory, args.legacy_users, args.hobbies)
+        with sqlite3.connect(path) as conn:
+            conn.execute("DROP INDEX idx_hobbies_user_name")
+        started = time.perf_counter()
+        count = await legacy_listing(path)
+        legacy = time.perf_counter() - started
+        started = time.perf_counter()
+        response = await client.get("/users/", params={"limit": 1000}, headers=HEADERS)
+        response.raise_for_status()
+        joined = time.perf_counter() - started
+        print(
+            f"legacy N+1 without index: {count} users in {legacy * 1000:.1f} ms "
+            f"({legacy / count * 1e6:.1f} us/user); one joined page of 1000 without index: {joined * 1000:.1f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--limits", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--hobbies", type=int, default=3, help="Хобі на користувача")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--legacy-users", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
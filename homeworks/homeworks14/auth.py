@@ -1,50 +1,80 @@
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
+from typing import Dict, Optional
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from starlette.requests import HTTPConnection
 from .config import SECRET_KEY, ALGORITHM
+from .tokens import InvalidToken, JWTBackend, VerifiedTokenCache
 
 
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
-fake_user = {
-    "username": "user",
-    "hashed_password": pwd_context.hash("password")
-}
+class UserStore:
+    """Користувачі з готовими хешами паролів.
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    Хеші приходять з конфігурації, а не обчислюються при імпорті;
+    `CryptContext` створюється при першій перевірці пароля.
+    """
 
-def authenticate_user(username: str, password: str):
-    if username != fake_user["username"]:
-        return False
-    if not verify_password(password, fake_user["hashed_password"]):
-        return False
-    return fake_user
+    def __init__(self, hashed_passwords: Dict[str, str]):
+        self.hashed_passwords = dict(hashed_passwords)
+        self._pwd_context = None
 
-def create_access_token(data: dict, expires_delta: timedelta = None):
+    @property
+    def pwd_context(self) -> CryptContext:
+        if self._pwd_context is None:
+            self._pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+        return self._pwd_context
+
+    def get(self, username: str) -> Optional[dict]:
+        hashed_password = self.hashed_passwords.get(username)
+        if hashed_password is None:
+            return None
+        return {"username": username, "hashed_password": hashed_password}
+
+    def authenticate(self, username: str, password: str):
+        user = self.get(username)
+        if user is None:
+            return False
+        if not self.pwd_context.verify(password, user["hashed_password"]):
+            return False
+        return user
+
+
+def get_user_store(connection: HTTPConnection) -> UserStore:
+    return connection.app.state.users
+
+def get_token_cache(connection: HTTPConnection) -> VerifiedTokenCache:
+    return connection.app.state.token_cache
+
+def create_access_token(data: dict, backend: JWTBackend, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = backend.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    users: UserStore = Depends(get_user_store),
+    token_cache: VerifiedTokenCache = Depends(get_token_cache),
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # повторний токен - лише пошук у кеші, без перевірки підпису
+        payload = token_cache.decode(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-    except JWTError:
+    except InvalidToken:
         raise credentials_exception
-    if username != fake_user["username"]:
+    user = users.get(username)
+    if user is None:
         raise credentials_exception
-    return fake_user
\ No newline at end of file
+    return user
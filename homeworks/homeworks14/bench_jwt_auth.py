@@ -0,0 +1,92 @@
+"""Вартість перевірки JWT у homeworks14: без кешу і з `VerifiedTokenCache` для кожного бекенду.
+
+Запуск з кореня репозиторію:
+
+    python -m homeworks.homeworks14.bench_jwt_auth --decodes 20000 --requests 2000
+
+Спершу - чиста перевірка токена (мкс на виклик), потім повний запит до
+`/protected` через ASGI без мережі (мкс на запит). "cold" - кожна
+перевірка розбирає й перевіряє підпис, "warm" - той самий токен уже в кеші.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from homeworks.homeworks14.config import ALGORITHM, SECRET_KEY
+from homeworks.homeworks14.main import create_app
+from homeworks.homeworks14.tokens import BACKENDS, VerifiedTokenCache, create_backend
+
+
+def available_backends():
+    for name in BACKENDS:
+        try:
+            yield create_backend(name)
+        except RuntimeError as exc:
+            print(f"{name:<6} skipped: {exc}")
+
+
+def issue(backend) -> str:
+    return backend.encode({"sub": "user", "exp": int(time.time()) + 1800}, SECRET_KEY, ALGORITHM)
+
+
+def bench_decode(backend, token: str, decodes: int):
+    started = time.perf_counter()
+    for _ in range(decodes):
+        backend.decode(token, SECRET_KEY, [ALGORITHM])
+    cold = (time.perf_counter() - started) / decodes
+
+    cache = VerifiedTokenCache(backend, SECRET_KEY, [ALGORITHM])
+    cache.decode(token)
+    started = time.perf_counter()
+    for _ in range(decodes):
+        cache.decode(token)
+    warm = (time.perf_counter() - started) / decodes
+    print(f"{backend.name:<6} decode  cold {cold * 1e6:>8.1f} us  warm {warm * 1e6:>6.2f} us  x{cold / warm:.0f}")
+
+
+async def bench_requests(app, client: httpx.AsyncClient, backend, token: str, requests: int):
+    results = {}
+    for label, max_size in (("cold", 0), ("warm", 10_000)):
+        app.state.token_cache = VerifiedTokenCache(backend, SECRET_KEY, [ALGORITHM], max_size)
+        headers = {"Authorization": f"Bearer {token}"}
+        (await client.get("/protected", headers=headers)).raise_for_status()
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get("/protected", headers=headers)
+            response.raise_for_status()
+        results[label] = (time.perf_counter() - started) / requests
+    print(
+        f"{backend.name:<6} request cold {results['cold'] * 1e6:>8.1f} us  warm {results['warm'] * 1e6:>6.1f} us  "
+        f"auth saved {(results['cold'] - results['warm']) * 1e6:.1f} us/request"
+    )
+
+
+async def main_async(args, backends):
+    # chat.db у homeworks14 - відносний шлях, lifespan створить його тут
+    os.chdir(tempfile.mkdtemp())
+    app = create_app()
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for backend in backends:
+                await bench_requests(app, client, backend, issue(backend), args.requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--decodes", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    backends = list(available_backends())
+    for backend in backends:
+        bench_decode(backend, issue(backend), args.decodes)
+    asyncio.run(main_async(args, backends))
+
+
+if __name__ == "__main__":
+    main()
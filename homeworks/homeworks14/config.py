@@ -1,8 +1,6 @@
+import asyncio
 import sqlite3
 
-from fastapi import FastAPI
-from fastapi.templating import Jinja2Templates
-
 
 def init_db():
     conn = sqlite3.connect(DB_NAME)
@@ -16,10 +14,38 @@ def init_db():
     conn.commit()
     conn.close()
 
-app = FastAPI(on_startup=[init_db])
-templates = Jinja2Templates(directory="homeworks/homeworks14/templates")
+
+def _call(fn, *args):
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        return fn(conn, *args)
+    finally:
+        conn.close()
+
+
+async def run_db(fn, *args):
+    """Виконує `fn(conn, *args)` з окремим з'єднанням у потоці, не блокуючи event loop."""
+    return await asyncio.to_thread(_call, fn, *args)
+
+TEMPLATES_DIR = "homeworks/homeworks14/templates"
 DB_NAME = "chat.db"
 
 SECRET_KEY = "q"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
\ No newline at end of file
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# "jose" (python-jose) або "pyjwt"; перевірені токени кешуються до свого exp
+JWT_BACKEND = "jose"
+TOKEN_CACHE_SIZE = 10000
+# хеш sha256_crypt від "password" обчислено заздалегідь: рахувати 535000 раундів
+# при кожному імпорті - це сотні мілісекунд на старт кожного воркера
+USERS = {
+    "user": "$5$rounds=535000$qt4QjopPy8afdLxO$qN0etIoPh9gfjAW4uQPMxvQX/vP5A7xe50kLx7pQd3B",
+}
+
+# вихідна черга кожного клієнта чату; при переповненні "drop-oldest" або "disconnect"
+CHAT_SEND_QUEUE = 256
+CHAT_OVERFLOW_POLICY = "drop-oldest"
+CHAT_SEND_TIMEOUT = 10.0
+# "local" - один процес; "unix:/tmp/homeworks14-chat.sock" - брокер для кількох воркерів,
+# запускається як `python -m miniproject3.bus /tmp/homeworks14-chat.sock`
+CHAT_BUS = "local"
@@ -1,13 +1,23 @@
-import sqlite3
-
-from fastapi import WebSocket, WebSocketDisconnect, Request, status, Depends, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, WebSocket, WebSocketDisconnect, Request, status, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.templating import Jinja2Templates
 from datetime import timedelta
-from .config import app, templates, DB_NAME
-from .auth import authenticate_user, create_access_token, get_current_user
+from miniproject3.bus import create_bus
+from miniproject3.chat import ChatHub, get_chat_hub
+from miniproject3.rooms import RoomRegistry, get_room_registry
+from .config import (
+    init_db, run_db, TEMPLATES_DIR, USERS, CHAT_SEND_QUEUE, CHAT_OVERFLOW_POLICY, CHAT_SEND_TIMEOUT, CHAT_BUS,
+    SECRET_KEY, ALGORITHM, JWT_BACKEND, TOKEN_CACHE_SIZE,
+)
+from .auth import UserStore, create_access_token, get_current_user, get_token_cache, get_user_store
+from .tokens import VerifiedTokenCache, create_backend
+
+
+router = APIRouter()
 
 
-@app.get(
+@router.get(
     "/chat/",
     summary="Сторінка WebSocket чату",
     description="Повертає HTML-сторінку з WebSocket чатом.",
@@ -15,46 +25,39 @@ from .auth import authenticate_user, create_access_token, get_current_user
     status_code=status.HTTP_200_OK,
 )
 async def get_chat(request: Request):
-    return templates.TemplateResponse("chat.html", {"request": request})
+    return request.app.state.templates.TemplateResponse("chat.html", {"request": request})
 
-def ensure_room_exists(room_name: str):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM rooms WHERE name = ?", (room_name,))
-        if cursor.fetchone() is None:
-            cursor.execute("INSERT INTO rooms (name) VALUES (?)", (room_name,))
-            conn.commit()
-
-connections = {}
-
-@app.websocket(
+@router.websocket(
     "/ws/{room}"
 )
-async def websocket_endpoint(websocket: WebSocket, room: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    room: str,
+    rooms: RoomRegistry = Depends(get_room_registry),
+    hub: ChatHub = Depends(get_chat_hub),
+):
     await websocket.accept()
 
-    ensure_room_exists(room)
-
-    if room not in connections:
-        connections[room] = []
-
-    connections[room].append(websocket)
+    rooms.ensure(room)
 
+    client = hub.join(room, websocket)
     try:
         while True:
             data = await websocket.receive_text()
-
-            for client in connections[room]:
-                await client.send_text(data)
+            hub.broadcast(room, data)
 
     except WebSocketDisconnect:
-        connections[room].remove(websocket)
-        if not connections[room]:
-            del connections[room]
+        pass
+    finally:
+        await hub.leave(room, client)
 
-@app.post("/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+@router.post("/token")
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    users: UserStore = Depends(get_user_store),
+    tokens: VerifiedTokenCache = Depends(get_token_cache),
+):
+    user = users.authenticate(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -63,10 +66,39 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": user["username"]}, expires_delta=access_token_expires
+        data={"sub": user["username"]}, backend=tokens.backend, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/protected")
+@router.get("/protected")
 async def protected_route(current_user: dict = Depends(get_current_user)):
-    return {"message": f"Hello, {current_user['username']}! This is a protected route."}
\ No newline at end of file
+    return {"message": f"Hello, {current_user['username']}! This is a protected route."}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    app.state.templates = Jinja2Templates(directory=TEMPLATES_DIR)
+    app.state.users = UserStore(USERS)
+    app.state.token_cache = VerifiedTokenCache(
+        create_backend(JWT_BACKEND), SECRET_KEY, [ALGORITHM], TOKEN_CACHE_SIZE
+    )
+    app.state.rooms = RoomRegistry(run_db)
+    await app.state.rooms.start()
+    app.state.chat = ChatHub(CHAT_SEND_QUEUE, CHAT_OVERFLOW_POLICY, CHAT_SEND_TIMEOUT, create_bus(CHAT_BUS))
+    await app.state.chat.start()
+    try:
+        yield
+    finally:
+        await app.state.chat.close()
+        await app.state.rooms.close()
+
+
+def create_app() -> FastAPI:
+    """Фабрика застосунку: усе дороге створюється в lifespan, а не при імпорті.
+
+    Запуск: `uvicorn --factory homeworks.homeworks14.main:create_app`.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    return app
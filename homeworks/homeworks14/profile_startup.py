@@ -0,0 +1,113 @@
+"""Профіль холодного старту homeworks14: імпорт модулів, `create_app()` і lifespan.
+
+    python -m homeworks.homeworks14.profile_startup --top 15
+    python -m homeworks.homeworks14.profile_startup --sort cumulative
+
+Старт вимірюється в окремому чистому процесі з `python -X importtime`, тож
+нічого з поточного процесу не потрапляє в кеш модулів. Таблиця - розбір
+виводу importtime по модулях (власний і сумарний час), плюс підсумок по
+пакетах верхнього рівня. lifespan виконується в тимчасовому каталозі, щоб
+`chat.db` не з'являвся поруч.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+from homeworks.homeworks14.main import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+
+async def run_lifespan():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(run_lifespan())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "lifespan_ms": (ready - created) * 1000,
+}))
+"""
+
+
+class ImportRecord(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        module = name.lstrip()
+        records.append(ImportRecord(module, int(self_us), int(cumulative_us), (len(name) - len(module) - 1) // 2))
+    return records
+
+
+def profile_startup() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")]))
+    with tempfile.TemporaryDirectory() as directory:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            cwd=directory,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    return {"phases": phases, "imports": parse_importtime(result.stderr)}
+
+
+def by_package(records: List[ImportRecord]) -> Dict[str, int]:
+    totals: Dict[str, int] = defaultdict(int)
+    for record in records:
+        totals[record.module.split(".")[0]] += record.self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Профіль холодного старту homeworks14")
+    parser.add_argument("--top", type=int, default=20, help="Скільки модулів показати")
+    parser.add_argument("--sort", choices=("self", "cumulative"), default="self")
+    args = parser.parse_args()
+
+    report = profile_startup()
+    phases = report["phases"]
+    records = report["imports"]
+    print(
+        f"import {phases['import_ms']:.1f} ms, create_app {phases['create_app_ms']:.1f} ms, "
+        f"lifespan {phases['lifespan_ms']:.1f} ms, {len(records)} modules imported"
+    )
+
+    key = (lambda record: record.self_us) if args.sort == "self" else (lambda record: record.cumulative_us)
+    print(f"\n{'self ms':>9} {'cumul ms':>9}  module")
+    for record in sorted(records, key=key, reverse=True)[:args.top]:
+        print(f"{record.self_us / 1000:>9.1f} {record.cumulative_us / 1000:>9.1f}  {record.module}")
+
+    print(f"\n{'self ms':>9}  package")
+    for package, self_us in list(by_package(records).items())[:args.top]:
+        print(f"{self_us / 1000:>9.1f}  {package}")
+
+
+if __name__ == "__main__":
+    main()
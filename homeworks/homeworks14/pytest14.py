@@ -0,0 +1,155 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from homeworks.homeworks14.auth import UserStore
+from homeworks.homeworks14.config import ALGORITHM, SECRET_KEY, USERS
+from homeworks.homeworks14.main import create_app
+from homeworks.homeworks14.profile_startup import ImportRecord, by_package, parse_importtime
+from homeworks.homeworks14.tokens import InvalidToken, JoseBackend, VerifiedTokenCache
+
+
+class CountingBackend(JoseBackend):
+    def __init__(self):
+        self.decodes = 0
+
+    def decode(self, token, key, algorithms):
+        self.decodes += 1
+        return super().decode(token, key, algorithms)
+
+
+@pytest.fixture
+def backend():
+    return CountingBackend()
+
+
+def issue(backend, subject="user", **claims):
+    return backend.encode({"sub": subject, **claims}, SECRET_KEY, ALGORITHM)
+
+
+def test_cached_claims_expire_with_token(backend):
+    now = time.time()
+    token = issue(backend, exp=int(now) + 60)
+    cache = VerifiedTokenCache(backend, SECRET_KEY, [ALGORITHM])
+
+    assert cache.decode(token, now=now)["sub"] == "user"
+    assert cache.decode(token, now=now + 30)["sub"] == "user"
+    assert backend.decodes == 1
+    cache.decode(token, now=int(now) + 60)
+    assert backend.decodes == 2
+    assert cache.metrics()["hits"] == 1 and cache.metrics()["misses"] == 2
+
+
+def test_failed_and_exp_less_tokens_are_not_cached(backend):
+    cache = VerifiedTokenCache(backend, SECRET_KEY, [ALGORITHM])
+    forged = backend.encode({"sub": "user", "exp": int(time.time()) + 60}, "other-secret", ALGORITHM)
+    expired = issue(backend, exp=int(time.time()) - 60)
+    for token in (forged, forged, expired, expired):
+        with pytest.raises(InvalidToken):
+            cache.decode(token)
+
+    eternal = issue(backend)
+    cache.decode(eternal)
+    cache.decode(eternal)
+    assert backend.decodes == 6
+    assert cache.metrics()["entries"] == 0 and cache.metrics()["hits"] == 0
+
+
+def test_cache_evicts_least_recently_used(backend):
+    exp = int(time.time()) + 60
+    first, second, third = (issue(backend, name, exp=exp) for name in ("first", "second", "third"))
+    cache = VerifiedTokenCache(backend, SECRET_KEY, [ALGORITHM], max_size=2)
+
+    cache.decode(first)
+    cache.decode(second)
+    cache.decode(first)
+    cache.decode(third)
+    assert cache.metrics()["entries"] == 2 and cache.metrics()["evictions"] == 1
+
+    decodes = backend.decodes
+    cache.decode(first)
+    cache.decode(third)
+    assert backend.decodes == decodes
+    cache.decode(second)
+    assert backend.decodes == decodes + 1
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # chat.db у homeworks14 - відносний шлях
+    monkeypatch.chdir(tmp_path)
+    with TestClient(create_app()) as client:
+        yield client
+
+
+def login(client):
+    response = client.post("/token", data={"username": "user", "password": "password"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_create_app_builds_state_in_lifespan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = create_app()
+    assert not hasattr(app.state, "users") and not hasattr(app.state, "token_cache")
+    assert not (tmp_path / "chat.db").exists()
+
+    with TestClient(app) as client:
+        assert all(hasattr(app.state, name) for name in ("templates", "users", "token_cache", "rooms", "chat"))
+        assert (tmp_path / "chat.db").exists()
+        headers = login(client)
+        assert client.get("/protected", headers=headers).json()["message"].startswith("Hello, user!")
+        assert client.get("/protected", headers={"Authorization": "Bearer nope"}).status_code == 401
+        assert app.state.token_cache.metrics()["entries"] == 1
+
+
+def test_user_store_creates_crypt_context_on_first_check():
+    store = UserStore(USERS)
+    assert store.get("user")["hashed_password"] == USERS["user"]
+    assert store.get("nobody") is None
+    assert store.authenticate("nobody", "password") is False
+    assert store._pwd_context is None
+
+    assert store.authenticate("user", "wrong") is False
+    context = store.pwd_context
+    assert store.authenticate("user", "password")["username"] == "user"
+    assert store.pwd_context is context
+
+
+def test_parse_importtime_reads_depth_and_package_totals():
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |   _io",
+        "import time:        40 |         40 |     fastapi.types",
+        "import time:       300 |        340 |   fastapi",
+        "Traceback lines are ignored",
+        "import time:      1000 |       1500 | homeworks.homeworks14.main",
+    ])
+    records = parse_importtime(output)
+    assert records == [
+        ImportRecord("_io", 120, 120, 1),
+        ImportRecord("fastapi.types", 40, 40, 2),
+        ImportRecord("fastapi", 300, 340, 1),
+        ImportRecord("homeworks.homeworks14.main", 1000, 1500, 0),
+    ]
+    assert by_package(records) == {"homeworks": 1000, "fastapi": 340, "_io": 120}
+
+
+def test_chat_room_echoes_to_members_only(client):
+    headers = login(client)
+    assert client.get("/protected", headers=headers).status_code == 200
+
+    with client.websocket_connect("/ws/lobby") as alice, client.websocket_connect("/ws/lobby") as bob, \
+            client.websocket_connect("/ws/other") as carol:
+        alice.send_text("hello")
+        assert alice.receive_text() == "hello"
+        assert bob.receive_text() == "hello"
+        carol.send_text("elsewhere")
+        # першим у черзі carol її власне повідомлення: "hello" з lobby до неї не дійшло
+        assert carol.receive_text() == "elsewhere"
+        bob.send_text("hi")
+        assert alice.receive_text() == "hi"
+        assert bob.receive_text() == "hi"
+        assert client.app.state.rooms.names >= {"lobby", "other"}
+        assert client.app.state.chat.metrics()["rooms"] == 2
@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from jose import JWTError, jwt as jose_jwt
+
+try:
+    import jwt as pyjwt
+except ImportError:  # PyJWT не встановлено - доступний лише бекенд python-jose
+    pyjwt = None
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class JWTBackend:
+    """Спільний інтерфейс бібліотек JWT: `encode` і `decode` з перевіркою підпису та `exp`."""
+
+    name = "base"
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        raise NotImplementedError
+
+    def decode(self, token: str, key: str, algorithms: Iterable[str]) -> dict:
+        raise NotImplementedError
+
+
+class JoseBackend(JWTBackend):
+    name = "jose"
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return jose_jwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithms: Iterable[str]) -> dict:
+        try:
+            return jose_jwt.decode(token, key, algorithms=list(algorithms))
+        except JWTError as exc:
+            raise InvalidToken(str(exc)) from exc
+
+
+class PyJWTBackend(JWTBackend):
+    name = "pyjwt"
+
+    def __init__(self):
+        if pyjwt is None:
+            raise RuntimeError("PyJWT is not installed")
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return pyjwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithms: Iterable[str]) -> dict:
+        try:
+            return pyjwt.decode(token, key, algorithms=list(algorithms))
+        except pyjwt.PyJWTError as exc:
+            raise InvalidToken(str(exc)) from exc
+
+
+BACKENDS = {backend.name: backend for backend in (JoseBackend, PyJWTBackend)}
+
+
+def create_backend(name: str) -> JWTBackend:
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown JWT backend {name!r}") from None
+
+
+class VerifiedTokenCache:
+    """Кеш уже перевірених claims за SHA-256 токена.
+
+    Запис живе до `exp` самого токена; токени без `exp` не кешуються.
+    Розмір обмежено `max_size` записами, найдовше не використані
+    витісняються першими. Невдалі перевірки не кешуються.
+    """
+
+    def __init__(self, backend: JWTBackend, key: str, algorithms: Iterable[str], max_size: int = 10_000):
+        self.backend = backend
+        self.key = key
+        self.algorithms = tuple(algorithms)
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def decode(self, token: str, now: Optional[float] = None) -> dict:
+        now = now if now is not None else time.time()
+        digest = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                claims, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return claims
+                del self._entries[digest]
+            self.misses += 1
+
+        claims = self.backend.decode(token, self.key, self.algorithms)
+        expires_at = claims.get("exp")
+        if isinstance(expires_at, (int, float)) and self.max_size > 0:
+            with self._lock:
+                self._entries[digest] = (claims, expires_at)
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "backend": self.backend.name,
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -1,13 +1,124 @@
+import asyncio
 import html
+import json
 import jwt
+from collections import deque
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status, HTTPException
 from fastapi.responses import HTMLResponse
-from typing import List, Tuple
+from typing import Deque, Dict, Set
 
 SECRET_KEY = "SUPER_SECRET"
 ALGORITHM = "HS256"
+SEND_TIMEOUT = 5.0
+MAX_SEND_QUEUE = 256
+DEFAULT_CHANNEL = "general"
 app = FastAPI()
-active_connections: List[Tuple[str, WebSocket]] = []
+
+
+class Client:
+    """Підключення з власною чергою та задачею-писачем.
+
+    Розсилка лише кладе готовий рядок у черги, а надсилають писачі всіх
+    клієнтів одночасно. Таймаут відправки `SEND_TIMEOUT` стежить сторожова
+    задача реєстру за `sending_since`, а не окремий таймер на кожне
+    надсилання: тисячі таймерів на одне повідомлення коштують дорожче за
+    саму відправку.
+    """
+
+    def __init__(self, websocket: WebSocket, user: str, channel: str):
+        self.websocket = websocket
+        self.user = user
+        self.channel = channel
+        self.closed = False
+        self.sending_since = None
+        self._queue: Deque[str] = deque()
+        self._ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, payload: str) -> bool:
+        if self.closed or len(self._queue) >= MAX_SEND_QUEUE:
+            return False
+        self._queue.append(payload)
+        self._ready.set()
+        return True
+
+    async def _write_loop(self):
+        try:
+            while not self.closed:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._queue and not self.closed:
+                    self.sending_since = asyncio.get_running_loop().time()
+                    await self.websocket.send_text(self._queue.popleft())
+                    self.sending_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # мертвий або завислий сокет: прибираємо з реєстру, а не ігноруємо
+            self.abort()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._writer.cancel()
+        connections.remove(self)
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        except Exception:
+            pass
+
+    async def close(self):
+        self.closed = True
+        self._ready.set()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+
+
+class ConnectionRegistry:
+    """Клієнти, проіндексовані за каналом і за користувачем: додавання й видалення за O(1)."""
+
+    def __init__(self):
+        self.channels: Dict[str, Set[Client]] = {}
+        self.users: Dict[str, Set[Client]] = {}
+        self._watchdog = None
+
+    def add(self, client: Client):
+        if self._watchdog is None or self._watchdog.done():
+            self._watchdog = asyncio.create_task(self._drop_stalled())
+        self.channels.setdefault(client.channel, set()).add(client)
+        self.users.setdefault(client.user, set()).add(client)
+
+    def remove(self, client: Client):
+        for index, key in ((self.channels, client.channel), (self.users, client.user)):
+            members = index.get(key)
+            if members is not None:
+                members.discard(client)
+                if not members:
+                    del index[key]
+
+    def members(self, channel: str) -> Set[Client]:
+        return self.channels.get(channel, set())
+
+    async def _drop_stalled(self):
+        loop = asyncio.get_running_loop()
+        while self.channels:
+            await asyncio.sleep(SEND_TIMEOUT / 2)
+            deadline = loop.time() - SEND_TIMEOUT
+            for members in list(self.channels.values()):
+                for client in list(members):
+                    if client.sending_since is not None and client.sending_since < deadline:
+                        client.abort()
+
+
+connections = ConnectionRegistry()
 
 
 def decode_jwt(token: str):
@@ -34,28 +145,33 @@ def sanitize_message(msg: str) -> str:
 @app.websocket("/ws/")
 async def websocket_endpoint(websocket: WebSocket):
     user = await get_user_from_ws(websocket)
+    channel = websocket.query_params.get("channel", DEFAULT_CHANNEL)
     await websocket.accept()
-    active_connections.append((user, websocket))
-    await broadcast(f"{user} joined the chat.", sender="system")
+    client = Client(websocket, user, channel)
+    # клієнт сам показує "you" для своїх повідомлень, тож має знати своє ім'я
+    client.send(json.dumps({"type": "welcome", "user": user, "channel": channel}))
+    connections.add(client)
+    broadcast(channel, f"{user} joined the chat.", sender="system")
 
     try:
         while True:
             data = await websocket.receive_text()
             clean = sanitize_message(data)
-            await broadcast(clean, sender=user)
+            broadcast(channel, clean, sender=user)
     except WebSocketDisconnect:
-        active_connections.remove((user, websocket))
-        await broadcast(f"{user} left the chat.", sender="system")
-        
-async def broadcast(message: str, sender: str):
-    for username, connection in active_connections:
-        try:
-            if username == sender:
-                await connection.send_text(f"you: {message}")
-            else:
-                await connection.send_text(f"{sender}: {message}")
-        except:
-            continue
+        pass
+    finally:
+        connections.remove(client)
+        await client.close()
+        broadcast(channel, f"{user} left the chat.", sender="system")
+
+def broadcast(channel: str, message: str, sender: str):
+    """Кодує повідомлення один раз і ставить у черги всіх клієнтів каналу."""
+    payload = json.dumps({"type": "message", "sender": sender, "message": message})
+    for client in list(connections.members(channel)):
+        if not client.send(payload):
+            # черга переповнена - клієнт не встигає читати
+            client.abort()
 
 html_code = """
 <!DOCTYPE html>
@@ -78,6 +194,7 @@ html_code = """
 
     <script>
         let ws = null;
+        let me = null;
 
         function connect() {
             const token = document.getElementById("tokenInput").value;
@@ -88,9 +205,19 @@ html_code = """
             };
 
             ws.onmessage = function (event) {
+                const data = JSON.parse(event.data);
+                if (data.type === "welcome") {
+                    me = data.user;
+                    return;
+                }
+                if (data.sender === "system") {
+                    appendSystemMessage(data.message);
+                    return;
+                }
                 const messages = document.getElementById('messages');
                 const message = document.createElement('li');
-                const content = document.createTextNode(event.data);
+                const author = data.sender === me ? "you" : data.sender;
+                const content = document.createTextNode(author + ": " + data.message);
                 message.appendChild(content);
                 messages.appendChild(message);
             };
@@ -1,6 +1,9 @@
+import asyncio
+import json
 import pytest
 from fastapi.testclient import TestClient
-from main13 import app, SECRET_KEY, ALGORITHM
+import main13
+from main13 import app, SECRET_KEY, ALGORITHM, Client, ConnectionRegistry, broadcast
 import jwt
 import websockets
 
@@ -21,12 +24,15 @@ def test_chat_page():
 async def test_websocket_valid_token(token):
     url = f"ws://localhost:8000/ws/?token={token}"
     async with websockets.connect(url) as websocket:
-        greeting = await websocket.recv()
-        assert "testuser joined the chat." in greeting
+        welcome = json.loads(await websocket.recv())
+        assert welcome["type"] == "welcome" and welcome["user"] == "testuser"
+        greeting = json.loads(await websocket.recv())
+        assert greeting["sender"] == "system"
+        assert "testuser joined the chat." in greeting["message"]
 
         await websocket.send("Hello pytest!")
-        response = await websocket.recv()
-        assert "you: Hello pytest!" == response
+        response = json.loads(await websocket.recv())
+        assert response == {"type": "message", "sender": "testuser", "message": "Hello pytest!"}
 
 @pytest.mark.asyncio
 async def test_websocket_invalid_token():
@@ -34,4 +40,78 @@ async def test_websocket_invalid_token():
     with pytest.raises(websockets.exceptions.InvalidStatus) as exc_info:
         async with websockets.connect(url) as websocket:
             pass
-    assert exc_info.value.response.status_code == 403
\ No newline at end of file
+    assert exc_info.value.response.status_code == 403
+
+def ws_url(user, channel=None):
+    token = jwt.encode({"sub": user}, SECRET_KEY, algorithm=ALGORITHM)
+    return f"/ws/?token={token}" + (f"&channel={channel}" if channel else "")
+
+
+def test_registry_follows_joins_and_leaves():
+    with TestClient(app) as local:
+        with local.websocket_connect(ws_url("alice")) as alice, \
+                local.websocket_connect(ws_url("carol", "other")) as carol:
+            assert alice.receive_json()["type"] == "welcome"
+            assert alice.receive_json()["message"] == "alice joined the chat."
+            with local.websocket_connect(ws_url("bob")) as bob:
+                assert bob.receive_json() == {"type": "welcome", "user": "bob", "channel": "general"}
+                assert bob.receive_json()["message"] == "bob joined the chat."
+                assert alice.receive_json()["message"] == "bob joined the chat."
+                assert {name: {c.user for c in members} for name, members in main13.connections.channels.items()} == {
+                    "general": {"alice", "bob"},
+                    "other": {"carol"},
+                }
+                assert set(main13.connections.users) == {"alice", "bob", "carol"}
+
+                alice.send_text(" <b>hi</b> ")
+                expected = {"type": "message", "sender": "alice", "message": "&lt;b&gt;hi&lt;/b&gt;"}
+                assert bob.receive_json() == expected
+            assert alice.receive_json() == expected
+            assert alice.receive_json()["message"] == "bob left the chat."
+            assert set(main13.connections.users) == {"alice", "carol"}
+            assert carol.receive_json()["type"] == "welcome"
+            assert carol.receive_json()["message"] == "carol joined the chat."
+    assert main13.connections.channels == {} and main13.connections.users == {}
+
+
+class FakeSocket:
+    def __init__(self, stall=False, fail=False):
+        self.sent = []
+        self.stall = stall
+        self.fail = fail
+        self.close_code = None
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        if self.stall:
+            await asyncio.Event().wait()
+        self.sent.append(text)
+
+    async def close(self, code):
+        self.close_code = code
+
+
+def test_broadcast_shares_one_payload_and_drops_dead_and_stalled_clients(monkeypatch):
+    monkeypatch.setattr(main13, "connections", ConnectionRegistry())
+    monkeypatch.setattr(main13, "SEND_TIMEOUT", 0.05)
+
+    async def scenario():
+        sockets = [FakeSocket(), FakeSocket(), FakeSocket(stall=True), FakeSocket(fail=True), FakeSocket()]
+        clients = [Client(socket, f"user{i}", "general") for i, socket in enumerate(sockets[:4])]
+        clients.append(Client(sockets[4], "user4", "elsewhere"))
+        for client in clients:
+            main13.connections.add(client)
+        broadcast("general", "hello", sender="user0")
+        await asyncio.sleep(0.2)
+        return sockets, clients
+
+    sockets, clients = asyncio.run(scenario())
+    healthy, other, stalled, dead, elsewhere = sockets
+    assert healthy.sent == other.sent == ['{"type": "message", "sender": "user0", "message": "hello"}']
+    # рядок закодовано один раз і спільно використано всіма отримувачами
+    assert healthy.sent[0] is other.sent[0]
+    assert elsewhere.sent == []
+    assert stalled.close_code == dead.close_code == 1011
+    assert clients[2].closed and clients[3].closed
+    assert {client.user for client in main13.connections.members("general")} == {"user0", "user1"}
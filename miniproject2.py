@@ -1,9 +1,9 @@
 import aiosqlite
 import base64
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Response
 from pydantic import BaseModel, Field, SecretStr
-from typing import List
+from typing import List, Optional
 from fastapi.security import (
     OAuth2PasswordBearer,
     OAuth2PasswordRequestForm,
@@ -31,6 +31,15 @@ class User(BaseModel):
 		hobbies: List[Hobby] = Field(..., description="List of hobbies of the person", examples=[[{"name": "Reading"}, {"name": "Traveling"}]])
 		password: SecretStr = Field(..., description="Password for the user", min_length=8, examples=["strongpassword123", "anotherpassword456"])
 
+def encode_cursor(name: str) -> str:
+    return base64.urlsafe_b64encode(name.encode()).decode()
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor, altchars=b"-_", validate=True).decode()
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+
 @app.on_event("startup")
 async def database():
     async with aiosqlite.connect(DB_PATH) as db:
@@ -51,6 +60,7 @@ async def database():
                 FOREIGN KEY (user_name) REFERENCES users(name) ON DELETE CASCADE
             )
         """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_hobbies_user_name ON hobbies(user_name)")
         await db.commit()
 
 @app.post(
@@ -106,27 +116,42 @@ async def create_user(user: User):
 		response_model=List[User],
     tags=["Users"],
     summary="Get users",
-    description="Get all users in the system.",
-    responses={200: {"description": "Users retrieved successfully"}},
+    description=(
+        "Get users ordered by name. Without `limit` all users after `cursor` are returned, as before. "
+        "With `limit` at most that many users are returned, and if more remain the response carries an "
+        "`X-Next-Cursor` header; pass its value as `cursor` to get the next page."
+    ),
+    responses={200: {"description": "Users retrieved successfully"}, 400: {"description": "Invalid cursor"}},
     include_in_schema=True
 )
-async def get_users(token: str = Depends(oauth2_scheme)):
+async def get_users(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; all users when omitted"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    token: str = Depends(oauth2_scheme),
+):
+    after = decode_cursor(cursor) if cursor is not None else ""
     async with aiosqlite.connect(DB_PATH) as db:
         db.row_factory = aiosqlite.Row
-        users_data = await db.execute("SELECT * FROM users")
-        users = await users_data.fetchall()
-
-        result = []
-        for user in users:
-            hobbies_data = await db.execute("SELECT hobby FROM hobbies WHERE user_name = ?", (user["name"],))
-            hobbies = [Hobby(name=row["hobby"]) for row in await hobbies_data.fetchall()]
-            result.append(User(
-                name=user["name"],
-                year=user["year"],
-                hobbies=hobbies,
-                password=SecretStr(user["password"])
-            ))
-        return result
+        # one query per page: users come from the name primary key, hobbies from idx_hobbies_user_name;
+    # LIMIT -1 is SQLite's "no limit" for requests without a page size
+        rows = await db.execute_fetchall("""
+            SELECT u.name, u.year, u.password, h.hobby
+            FROM (SELECT name, year, password FROM users WHERE name > ? ORDER BY name LIMIT ?) AS u
+            LEFT JOIN hobbies AS h ON h.user_name = u.name
+            ORDER BY u.name, h.id
+        """, (after, limit + 1 if limit is not None else -1))
+
+    result = []
+    for row in rows:
+        if not result or result[-1].name != row["name"]:
+            result.append(User(name=row["name"], year=row["year"], hobbies=[], password=SecretStr(row["password"])))
+        if row["hobby"] is not None:
+            result[-1].hobbies.append(Hobby(name=row["hobby"]))
+    if limit is not None and len(result) > limit:
+        result = result[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(result[-1].name)
+    return result
 
 @app.put("/users/{name}",
 		response_model=User,
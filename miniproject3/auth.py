@@ -1,11 +1,14 @@
-import bcrypt
-import base64
 import sqlite3
 
-from fastapi import Depends, HTTPException, status
+from fastapi import BackgroundTasks, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr, Field, SecretStr, field_validator
-from .config import DB_NAME, oauth2_scheme
+from . import refresh_tokens
+from .config import REFRESH_TOKEN_TTL, oauth2_scheme
+from .db import Database, get_db
+from .passwords import PasswordHasher, get_hasher
+from .ratelimit import LoginLimiter, get_login_limiter
+from .tokens import InvalidToken, TokenClaims, TokenSigner, get_token_signer
 from fastapi import APIRouter
 
 router = APIRouter()
@@ -19,7 +22,15 @@ class Token(BaseModel):
     """Модель токена доступу."""
 
     token_type: str = Field(description="type of the token", examples=["bearer"])
-    access_token: str = Field(description="Token Value", examples=["YmasdeQ=="])
+    access_token: str = Field(description="Token Value", examples=["1.1767225600.3q2-7w"])
+    expires_in: int = Field(description="Access token lifetime in seconds", examples=[900])
+    refresh_token: str = Field(description="One-time token for /token/refresh", examples=["kZ1x...Qe8"])
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class RevokeRequest(RefreshRequest):
+    everywhere: bool = Field(False, description="Відкликати всі refresh-токени користувача")
 
 class UserShow(User):
     id: int
@@ -49,23 +60,19 @@ class UserShow(User):
             raise ValueError("Password should be at least 8 characters long")
         return v
 
-async def decode_token(token: str):
-
+async def current_user(
+    token: str = Depends(oauth2_scheme),
+    tokens: TokenSigner = Depends(get_token_signer),
+) -> TokenClaims:
+    """Перевіряє підписаний токен без звернення до бази."""
     try:
-        decoded_user_email = (
-            base64.urlsafe_b64decode(token).split(b"-")[0].decode("utf-8")
+        return tokens.verify(token)
+    except InvalidToken as exc:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(exc),
+            headers={"WWW-Authenticate": "Bearer"},
         )
-    except (UnicodeDecodeError, ValueError):
-        return None
-
-    return decoded_user_email
-
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
 
 @router.post(
     "/register/",
@@ -76,70 +83,160 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     responses={
         201: {"description": "Користувача успішно зареєстровано"},
         400: {"description": "Email вже зареєстрований або некоректні дані"},
+        503: {"description": "Черга хешування паролів переповнена"},
     }
 )
-async def register_user(user: User):
-    with sqlite3.connect(DB_NAME) as connection:
-        cursor: sqlite3.Cursor = connection.cursor()
-        cursor.execute(
-            "SELECT 1 FROM users WHERE email = ?",
-            (user.email,),
-        )
-        if cursor.fetchone() is not None:
-            raise HTTPException(status_code=400, detail="Email already registered")
+async def register_user(
+    user: User,
+    db: Database = Depends(get_db),
+    hasher: PasswordHasher = Depends(get_hasher),
+):
+    existing = await db.fetchone(
+        "SELECT 1 FROM users WHERE email = ?",
+        (user.email,),
+    )
+    if existing is not None:
+        raise HTTPException(status_code=400, detail="Email already registered")
 
-        hashed_password = hash_password(user.password.get_secret_value())
+    hashed_password = await hasher.hash(user.password.get_secret_value())
 
-        cursor.execute(
+    try:
+        await db.execute(
             "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
             (user.name, user.email, hashed_password),
         )
-        connection.commit()
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="Email already registered")
 
     return {"message": f"User {user.name} registered successfully"}
 
+def _replace_hash(conn, user_id: int, old_hash: str, new_hash: str) -> int:
+    with conn:
+        return conn.execute(
+            "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+            (new_hash, user_id, old_hash),
+        ).rowcount
+
+async def rehash_password(db: Database, hasher: PasswordHasher, user_id: int, password: str, old_hash: str):
+    """Перехешовує пароль з поточною вартістю, якщо хеш ще не змінили паралельно."""
+    new_hash = await hasher.hash(password)
+    hasher.rehashed += await db.run(_replace_hash, user_id, old_hash, new_hash)
+
 async def login(
-    form_data: OAuth2PasswordRequestForm = Depends(),
+    form_data: OAuth2PasswordRequestForm,
+    db: Database,
+    hasher: PasswordHasher,
+    tokens: TokenSigner,
+    background_tasks: BackgroundTasks,
 ):
-    with sqlite3.connect(DB_NAME) as connection:
-        connection.row_factory = sqlite3.Row
-        cursor: sqlite3.Cursor = connection.cursor()
-        cursor.execute(
-            "SELECT * FROM users WHERE email = ?", (form_data.username,)
-        )
-
-        db_user = cursor.fetchone()
+    db_user = await db.fetchone(
+        "SELECT * FROM users WHERE email = ?", (form_data.username,),
+        row_factory=sqlite3.Row,
+    )
 
-        if db_user is None:
-            raise HTTPException(status.HTTP_404_NOT_FOUND, "User does not exist.")
+    if db_user is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "User does not exist.")
 
     user = UserShow(**dict(db_user))
 
-    if not verify_password(form_data.password, user.password.get_secret_value()):
+    stored_hash = user.password.get_secret_value()
+    if not await hasher.verify(form_data.password, stored_hash):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Incorrect password.")
 
+    if hasher.needs_rehash(stored_hash):
+        # після відповіді, щоб логін не чекав на друге хешування
+        background_tasks.add_task(
+            rehash_password, db, hasher, user.id, form_data.password, stored_hash
+        )
+
     return Token(
-        access_token=base64.urlsafe_b64encode(
-            f"{user.email}-{user.name}".encode("utf-8")
-        ).decode("utf-8"),
+        access_token=tokens.issue(user.id),
         token_type="bearer",
+        expires_in=tokens.ttl,
+        refresh_token=await db.run(refresh_tokens.issue, user.id, REFRESH_TOKEN_TTL),
     )
 
 @router.post(
     "/token",
     response_model=Token,
     summary="Отримання токену доступу",
-    description="Отримання JWT токену за email та паролем (логін).",
+    description=(
+        "Отримання підписаного токену доступу за email та паролем (логін). "
+        "Токен містить id користувача і час закінчення дії та перевіряється без звернення до бази. "
+        "Разом з ним видається refresh-токен для `/token/refresh`."
+    ),
     tags=["Аутентифікація"],
     status_code=status.HTTP_200_OK,
     responses={
         200: {"description": "Токен отримано успішно"},
         400: {"description": "Неправильний пароль"},
         404: {"description": "Користувача не знайдено"},
+        429: {"description": "Забагато спроб входу для облікового запису або IP, див. Retry-After"},
+        503: {"description": "Черга хешування паролів переповнена"},
     }
 )
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    return await login(form_data)
+async def login_for_access_token(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Database = Depends(get_db),
+    hasher: PasswordHasher = Depends(get_hasher),
+    tokens: TokenSigner = Depends(get_token_signer),
+    limiter: LoginLimiter = Depends(get_login_limiter),
+):
+    limiter.check(form_data.username, request.client.host if request.client else "unknown")
+    token = await login(form_data, db, hasher, tokens, background_tasks)
+    limiter.succeeded(form_data.username)
+    return token
+
+@router.post(
+    "/token/refresh",
+    response_model=Token,
+    summary="Оновлення токену доступу",
+    description=(
+        "Видає новий токен доступу та новий refresh-токен в обмін на чинний refresh-токен "
+        "без перевірки пароля. Кожен refresh-токен одноразовий; повторне використання "
+        "відкликає всі сесії користувача."
+    ),
+    tags=["Аутентифікація"],
+    status_code=status.HTTP_200_OK,
+    responses={
+        200: {"description": "Токени оновлено"},
+        401: {"description": "Refresh-токен недійсний, прострочений або вже використаний"},
+    }
+)
+async def refresh_access_token(
+    body: RefreshRequest,
+    db: Database = Depends(get_db),
+    tokens: TokenSigner = Depends(get_token_signer),
+):
+    try:
+        user_id, refresh_token = await db.run(
+            refresh_tokens.rotate, body.refresh_token, REFRESH_TOKEN_TTL
+        )
+    except InvalidToken as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc))
+
+    return Token(
+        access_token=tokens.issue(user_id),
+        token_type="bearer",
+        expires_in=tokens.ttl,
+        refresh_token=refresh_token,
+    )
+
+@router.post(
+    "/token/revoke",
+    summary="Відкликання refresh-токену",
+    description=(
+        "Відкликає refresh-токен (вихід із сесії), а з `everywhere=true` - усі сесії користувача. "
+        "Уже видані токени доступу діють до закінчення свого короткого строку."
+    ),
+    tags=["Аутентифікація"],
+    status_code=status.HTTP_200_OK,
+)
+async def revoke_refresh_token(body: RevokeRequest, db: Database = Depends(get_db)):
+    revoked = await db.run(refresh_tokens.revoke, body.refresh_token, body.everywhere)
+    return {"revoked": revoked}
 
 @router.get(
     "/test/",
@@ -148,5 +245,5 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     tags=["Тести"],
     status_code=status.HTTP_200_OK,
 )
-async def test(token: str = Depends(oauth2_scheme)):
+async def test(user: TokenClaims = Depends(current_user)):
     return "hello"
\ No newline at end of file
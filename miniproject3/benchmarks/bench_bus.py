@@ -0,0 +1,121 @@
+"""Пропускна здатність чату через брокер на Unix-сокеті для 1, 2, 4 і 8 воркерів.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_bus --messages 20000 --rooms 16
+
+Кожен воркер - окремий процес зі своїм `ChatHub` і `UnixSocketBus`, по
+одному локальному клієнту в кожній кімнаті. Усі воркери одночасно
+публікують `--messages` повідомлень; результат - сумарна кількість
+доставлених клієнтам повідомлень за секунду.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from miniproject3.bus import Broker, UnixSocketBus
+from miniproject3.chat import ChatHub
+
+
+class CountingSocket:
+    def __init__(self):
+        self.received = 0
+
+    async def send_text(self, message):
+        self.received += 1
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def run_broker(path: str, ready):
+    async def serve():
+        server = await Broker().serve(path)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def run_worker(path: str, workers: int, rooms: int, messages: int, barrier, results):
+    async def work():
+        hub = ChatHub(max_queue=messages * workers, bus=UnixSocketBus(path))
+        await hub.start()
+        sockets = [CountingSocket() for _ in range(rooms)]
+        clients = [hub.join(f"room-{i}", socket) for i, socket in enumerate(sockets)]
+        await asyncio.sleep(0.2)
+        await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+
+        expected = messages * workers
+        started = time.perf_counter()
+        for i in range(messages):
+            hub.broadcast(f"room-{i % rooms}", f"message {i}")
+            if i % 256 == 0:
+                await asyncio.sleep(0)
+        deadline = started + 60
+        while sum(socket.received for socket in sockets) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - started
+
+        for i, client in enumerate(clients):
+            await hub.leave(f"room-{i}", client)
+        dropped = hub.bus.dropped
+        await hub.close()
+        results.put((sum(socket.received for socket in sockets), elapsed, dropped))
+
+    asyncio.run(work())
+
+
+def scenario(path: str, workers: int, rooms: int, messages: int):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(path, workers, rooms, messages, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get(timeout=120) for _ in processes]
+    for process in processes:
+        process.join()
+
+    delivered = sum(received for received, _, _ in outcomes)
+    elapsed = max(elapsed for _, elapsed, _ in outcomes)
+    dropped = sum(dropped for _, _, dropped in outcomes)
+    expected = messages * workers * workers
+    print(
+        f"{workers:>7} {delivered:>10}/{expected:<10} {elapsed:>7.2f} s "
+        f"{delivered / elapsed:>12.0f} msg/s  dropped {dropped}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--messages", type=int, default=20_000, help="Публікацій на воркер")
+    parser.add_argument("--rooms", type=int, default=16)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_bus.sock")
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    broker = context.Process(target=run_broker, args=(path, ready), daemon=True)
+    broker.start()
+    ready.wait(10)
+
+    print(f"cpus {os.cpu_count()}")
+    print(f"{'workers':>7} {'delivered/expected':>21} {'time':>9} {'throughput':>16}")
+    try:
+        for workers in args.workers:
+            scenario(path, workers, args.rooms, args.messages)
+    finally:
+        broker.terminate()
+
+
+if __name__ == "__main__":
+    main()
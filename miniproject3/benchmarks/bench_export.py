@@ -0,0 +1,73 @@
+"""Пам'ять і швидкість потокового `/export/` на великій таблиці.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_export --rows 10000000
+
+Для кожного формату без стиснення анонімне RSS процесу друкується кожні
+`--report-every` рядків виводу (за замовчуванням - десята частина `--rows`):
+при експорті частинами воно не росте разом з кількістю вивантажених рядків.
+Для gzip рядки в потоці не порахувати, тож друкується лише підсумок з RSS
+наприкінці.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from miniproject3.benchmarks.bench_pagination import create_database, fill
+from miniproject3.db import Database
+from miniproject3.export import export_stream
+
+
+def rss_mb() -> float:
+    """Анонімна частина RSS: без сторінок файлу бази, відображених через mmap_size."""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def run(db: Database, fmt: str, compress: bool, chunk_size: int, report_every: int):
+    started = time.perf_counter()
+    exported = 0
+    lines = 0
+    next_report = report_every
+    async for data in export_stream(db, fmt, chunk_size=chunk_size, compress=compress):
+        exported += len(data)
+        if not compress:
+            lines += data.count(b"\n")
+            if lines >= next_report:
+                print(f"  {lines:>10} lines  RSS {rss_mb():>7.1f} MB")
+                next_report += report_every
+    elapsed = time.perf_counter() - started
+    print(
+        f"{fmt:<6} gzip={compress!s:<5} {exported / 2 ** 20:>9.1f} MB  {elapsed:>7.1f} s  "
+        f"{exported / 2 ** 20 / elapsed:>7.1f} MB/s  RSS {rss_mb():.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--report-every", type=int, help="Рядків між звітами RSS (за замовчуванням rows / 10)")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_export.db")
+    conn = create_database(path)
+    fill(conn, args.rows)
+    conn.close()
+    print(f"filled {args.rows} rows, RSS {rss_mb():.1f} MB")
+
+    db = Database(path, size=2)
+    report_every = args.report_every or max(args.rows // 10, 1)
+    for fmt, compress in (("ndjson", False), ("csv", False), ("json", False), ("ndjson", True)):
+        asyncio.run(run(db, fmt, compress, args.chunk_size, report_every))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Пропускна здатність підключень до чату: перевірка кімнати в SQLite проти `RoomRegistry`.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_handshake --connections 10000 --rooms 1000
+
+Усі `--connections` WebSocket-підключень стартують одночасно і проходять
+повний цикл у `/ws/{room}`: accept, перевірка кімнати, повтор історії, join,
+disconnect. ASGI-застосунок викликається напряму, без мережі, тож
+вимірюється саме серверна частина. `sqlite` - стара поведінка homeworks14:
+`sqlite3.connect` і SELECT/INSERT прямо в event loop на кожне підключення.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from miniproject3 import config
+from miniproject3.main import app
+
+
+class BlockingRooms:
+    """Стара поведінка: синхронний запит до SQLite на кожне підключення."""
+
+    def __init__(self, db_name: str):
+        self.db_name = db_name
+
+    def ensure(self, name: str):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM rooms WHERE name = ?", (name,))
+            if cursor.fetchone() is None:
+                cursor.execute("INSERT INTO rooms (name) VALUES (?)", (name,))
+                conn.commit()
+        finally:
+            conn.close()
+
+
+async def connect(room: str, latencies: list):
+    scope = {
+        "type": "websocket",
+        "asgi": {"version": "3.0"},
+        "scheme": "ws",
+        "path": f"/ws/{room}",
+        "raw_path": f"/ws/{room}".encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "subprotocols": [],
+        "server": ("bench", 80),
+        "client": ("127.0.0.1", 50000),
+    }
+    accepted = asyncio.Event()
+    started = time.perf_counter()
+
+    async def receive():
+        if not accepted.is_set():
+            return {"type": "websocket.connect"}
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def send(message):
+        if message["type"] == "websocket.accept":
+            accepted.set()
+
+    await app(scope, receive, send)
+    latencies.append(time.perf_counter() - started)
+
+
+async def scenario(name: str, connections: int, rooms: int, prefix: str):
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(connect(f"{prefix}-{i % rooms}", latencies) for i in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<10} {connections:>6} conns  {elapsed:>6.2f} s  {connections / elapsed:>8.0f} conn/s  "
+        f"p50 {p50 * 1000:>8.1f} ms  p99 {p99 * 1000:>8.1f} ms"
+    )
+
+
+async def main_async(args):
+    async with config.lifespan(app):
+        registry = app.state.rooms
+        app.state.rooms = BlockingRooms(config.DB_NAME)
+        try:
+            await scenario("sqlite", args.connections, args.rooms, "blocking")
+        finally:
+            app.state.rooms = registry
+
+        await scenario("registry", args.connections, args.rooms, "registry")
+        await registry.flush()
+        print(registry.metrics())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, default=10_000)
+    parser.add_argument("--rooms", type=int, default=1000, help="Кількість різних кімнат, усі нові")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    config.DB_NAME = os.path.join(directory, "bench_handshake.db")
+    config.UPLOAD_DIR = os.path.join(directory, "uploads")
+    config.PASSWORD_HASH_ROUNDS = 4
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
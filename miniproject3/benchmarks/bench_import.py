@@ -0,0 +1,92 @@
+"""Пропускна здатність масового імпорту NDJSON/CSV (конвеєр `import_stream`).
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_import --rows 200000 --batch-size 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from miniproject3 import config
+from miniproject3.benchmarks.bench_pagination import CATEGORIES
+from miniproject3.db import Database
+from miniproject3.facets import diff as facets_diff
+from miniproject3.importer import import_stream, iter_csv_records, iter_lines
+from miniproject3.storage import ImageStorage
+
+
+DIGEST = "a" * 64
+
+
+def ndjson_body(rows: int) -> bytes:
+    lines = (
+        json.dumps({
+            "title": f"Ad {i}",
+            "description": "imported in bulk, good condition",
+            "price": i % 20000,
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "image_hash": DIGEST,
+        })
+        for i in range(rows)
+    )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def csv_body(rows: int) -> bytes:
+    lines = (
+        f'"Ad {i}","imported in bulk, good condition",{i % 20000},{CATEGORIES[i % len(CATEGORIES)]},{DIGEST}'
+        for i in range(rows)
+    )
+    return ("title,description,price,category,image_hash\n" + "\n".join(lines) + "\n").encode()
+
+
+async def chunks(body: bytes, size: int = 64 * 1024):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+async def run(db: Database, storage: ImageStorage, fmt: str, body: bytes, batch_size: int):
+    records = iter_lines(chunks(body))
+    if fmt == "csv":
+        records = iter_csv_records(records)
+    started = time.perf_counter()
+    report = await import_stream(records, fmt, db, storage, batch_size)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{fmt:<7} {report.inserted:>9} rows  {report.batches:>4} batches  "
+        f"{elapsed:>7.2f} s  {report.inserted / elapsed:>10.0f} rows/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    config.DB_NAME = os.path.join(directory, "bench_import.db")
+    config.init_db()
+    db = Database(config.DB_NAME, size=2, pragmas=config.DB_PRAGMAS)
+    storage = ImageStorage(db.run, os.path.join(directory, "uploads"))
+    with db.connection() as conn:
+        conn.execute(
+            "INSERT INTO images (hash, path, size, content_type, refcount) VALUES (?, ?, 1, 'image/png', 0)",
+            (DIGEST, storage.path_for(DIGEST)),
+        )
+        conn.commit()
+
+    for fmt, body in (("ndjson", ndjson_body(args.rows)), ("csv", csv_body(args.rows))):
+        asyncio.run(run(db, storage, fmt, body, args.batch_size))
+
+    with db.connection() as conn:
+        print("facets consistent:", not facets_diff(conn))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
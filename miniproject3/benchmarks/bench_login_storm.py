@@ -0,0 +1,109 @@
+"""Затримка `/filters/` під час шторму логінів: bcrypt в event loop проти пулу
+`PasswordHasher`.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_login_storm --logins 64 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from miniproject3 import config
+from miniproject3.main import app
+from miniproject3.passwords import PasswordHasher
+
+
+class InlineHasher(PasswordHasher):
+    """Стара поведінка: bcrypt викликається прямо в корутині і блокує loop."""
+
+    async def _submit(self, fn, *args):
+        return fn(*args)
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/filters/", params={"limit": 20})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.005)
+
+
+async def storm(client: httpx.AsyncClient, logins: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def one():
+        async with semaphore:
+            response = await client.post(
+                "/token", data={"username": "storm@gmail.com", "password": "password123"}
+            )
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(one() for _ in range(logins)))
+    return statuses
+
+
+def summary(latencies: list) -> str:
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return f"{len(latencies):>5} probes  p50 {p50 * 1000:>8.2f} ms  p99 {p99 * 1000:>8.2f} ms"
+
+
+async def scenario(name: str, client: httpx.AsyncClient, args, with_storm: bool):
+    latencies = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(client, stop, latencies))
+    started = time.perf_counter()
+    if with_storm:
+        statuses = await storm(client, args.logins, args.concurrency)
+    else:
+        await asyncio.sleep(args.idle_seconds)
+        statuses = {}
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+    print(f"{name:<18} {summary(latencies)}  {elapsed:>6.1f} s  logins {statuses}")
+
+
+async def main_async(args):
+    async with config.lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post(
+                "/register/",
+                json={"name": "Storm", "email": "storm@gmail.com", "password": "password123"},
+            )
+            pooled = app.state.hasher
+            await scenario("idle", client, args, with_storm=False)
+
+            app.state.hasher = InlineHasher(workers=1)
+            await scenario("storm, inline", client, args, with_storm=True)
+            app.state.hasher.close()
+
+            app.state.hasher = pooled
+            await scenario(f"storm, pool({pooled.workers})", client, args, with_storm=True)
+            print(pooled.metrics())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    config.DB_NAME = os.path.join(directory, "bench_login_storm.db")
+    config.UPLOAD_DIR = os.path.join(directory, "uploads")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Порівняння OFFSET- та курсорної пагінації `/filters/` на великій таблиці.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_pagination --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from miniproject3 import config
+from miniproject3.queries import build_ads_query, next_cursor
+
+
+CATEGORIES = ["auto", "books", "electronics", "home", "jobs", "pets", "sport", "toys"]
+AD_COLUMNS = {"id": 0, "price": 3}
+
+
+def create_database(path: str) -> sqlite3.Connection:
+    """Порожня база з тією ж схемою та індексами, що створює застосунок (`config.init_db`)."""
+    config.DB_NAME = path
+    config.init_db()
+    return sqlite3.connect(path)
+
+
+def fill(conn: sqlite3.Connection, rows: int, batch: int = 50_000):
+    rnd = random.Random(42)
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            (
+                (f"Ad {i}", f"Description {i}", round(rnd.uniform(1, 10_000), 2),
+                 rnd.choice(CATEGORIES), "uploads/none.jpg")
+                for i in range(start, min(start + batch, rows))
+            ),
+        )
+    conn.commit()
+
+
+def timed(conn, query, params, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = conn.execute(query, params).fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best, rows
+
+
+def run(conn, pages, limit, repeat, sort, category):
+    results = []
+    cursor = None
+    page = 1
+    for target in pages:
+        while page < target:
+            query, params = build_ads_query(category=category, limit=limit, cursor=cursor, sort=sort)
+            rows = conn.execute(query, params).fetchall()
+            cursor = next_cursor(rows, limit, sort, AD_COLUMNS)
+            page += 1
+            if cursor is None:
+                return results
+
+        offset_query, offset_params = build_ads_query(
+            category=category, limit=limit, offset=(target - 1) * limit, sort=sort
+        )
+        offset_time, _ = timed(conn, offset_query, offset_params, repeat)
+
+        keyset_query, keyset_params = build_ads_query(
+            category=category, limit=limit, cursor=cursor, sort=sort
+        )
+        keyset_time, _ = timed(conn, keyset_query, keyset_params, repeat)
+        results.append((target, offset_time, keyset_time))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000, 10_000])
+    parser.add_argument("--db", help="Існуюча база з таблицею ads (за замовчуванням тимчасова)")
+    args = parser.parse_args()
+
+    if args.db:
+        conn = sqlite3.connect(args.db)
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "bench_ads.db")
+        conn = create_database(path)
+        started = time.perf_counter()
+        fill(conn, args.rows)
+        print(f"Filled {args.rows} rows in {time.perf_counter() - started:.1f}s ({path})")
+
+    for sort, category in (("id", None), ("price", None), ("price", "electronics")):
+        print(f"\nsort={sort} category={category or '-'} limit={args.limit}")
+        print(f"{'page':>8} {'offset, ms':>12} {'cursor, ms':>12}")
+        for page, offset_time, keyset_time in run(conn, args.pages, args.limit, args.repeat, sort, category):
+            print(f"{page:>8} {offset_time * 1000:>12.3f} {keyset_time * 1000:>12.3f}")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
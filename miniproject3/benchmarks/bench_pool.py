@@ -0,0 +1,100 @@
+"""Паралельні запити: `sqlite3.connect` на кожен виклик проти пулу `Database`.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_pool --rows 100000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from miniproject3.benchmarks.bench_pagination import create_database, fill
+from miniproject3.db import Database
+from miniproject3.queries import build_ads_query
+
+
+QUERY, PARAMS = build_ads_query(category="electronics", min_price=100, limit=20, sort="price")
+
+
+def per_call_connect(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute(QUERY, PARAMS).fetchall()
+    conn.close()
+    return rows
+
+
+async def measure_lag(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def scenario(name, make_call, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_lag(stop, lags))
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await make_call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:<22} {requests / elapsed:>10.0f} req/s  p99 {p99 * 1000:>8.2f} ms  "
+        f"max loop lag {max(lags, default=0) * 1000:>8.2f} ms"
+    )
+
+
+async def main_async(args, path):
+    async def inline():
+        per_call_connect(path)
+
+    async def threaded():
+        await asyncio.to_thread(per_call_connect, path)
+
+    db = Database(path, size=args.pool_size)
+
+    async def pooled():
+        await db.fetchall(QUERY, PARAMS)
+
+    print(f"{'scenario':<22} {'throughput':>14}  {'latency':>14}  {'event loop':>20}")
+    await scenario("connect, on loop", inline, args.requests, args.concurrency)
+    await scenario("connect, to_thread", threaded, args.requests, args.concurrency)
+    await scenario(f"pool({args.pool_size})", pooled, args.requests, args.concurrency)
+    print(db.metrics())
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_pool.db")
+    conn = create_database(path)
+    fill(conn, args.rows)
+    conn.close()
+
+    asyncio.run(main_async(args, path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Накладні витрати `LoginLimiter.check` на запит `/token`.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_ratelimit --requests 1000000 --ips 200000
+
+Ціль - менше 20 мкс на перевірку, зокрема коли ключів більше, ніж
+вміщує обмежувач, і він постійно витісняє старі.
+"""
+import argparse
+import random
+import time
+
+from miniproject3.ratelimit import LoginLimiter, SlidingWindowLimiter, TooManyAttempts
+
+
+def run(name: str, limiter: LoginLimiter, attempts, budget_us: float):
+    rejected = 0
+    started = time.perf_counter()
+    for now, account, ip in attempts:
+        try:
+            limiter.check(account, ip, now)
+        except TooManyAttempts:
+            rejected += 1
+    per_call = (time.perf_counter() - started) / len(attempts) * 1e6
+    verdict = "ok" if per_call < budget_us else "OVER BUDGET"
+    print(f"{name:<34} {per_call:>7.2f} us/check  rejected {rejected:>8}  {verdict}")
+    print(f"{'':<34} {limiter.metrics()}")
+
+
+def make_limiter(max_keys: int) -> LoginLimiter:
+    return LoginLimiter(
+        per_account=SlidingWindowLimiter(10, 60, max_keys),
+        per_ip=SlidingWindowLimiter(30, 60, max_keys),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1_000_000)
+    parser.add_argument("--ips", type=int, default=200_000)
+    parser.add_argument("--accounts", type=int, default=50_000)
+    parser.add_argument("--max-keys", type=int, default=100_000)
+    parser.add_argument("--budget-us", type=float, default=20.0)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(args.ips)]
+    accounts = [f"user{i}@gmail.com" for i in range(args.accounts)]
+    step = 600 / args.requests  # увесь прогін - 10 хвилин "годинника"
+
+    spray = [(i * step, rnd.choice(accounts), rnd.choice(ips)) for i in range(args.requests)]
+    run("spray: many IPs x many accounts", make_limiter(args.max_keys), spray, args.budget_us)
+
+    flood = [(i * step, "victim@gmail.com", "203.0.113.7") for i in range(args.requests)]
+    run("flood: one IP, one account", make_limiter(args.max_keys), flood, args.budget_us)
+
+
+if __name__ == "__main__":
+    main()
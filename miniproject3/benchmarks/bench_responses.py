@@ -0,0 +1,104 @@
+"""Час відповіді списку оголошень: `response_model` проти готового тіла з `trusted_json`.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_responses --repeat 2000
+
+Усі ендпоінти мають однаковий `response_model=List[Ad]` і віддають ті самі
+рядки з пам'яті, тож різниця - лише перевірка моделі та серіалізація:
+`/model` - як FastAPI без змін, `/validated` - `ListSerializer` за
+замовчуванням (перевірка pydantic), `/trusted` - з `TRUSTED_JSON_RESPONSES=1`.
+"""
+import argparse
+import asyncio
+import time
+
+from typing import List
+
+from fastapi import FastAPI
+
+from miniproject3.main import Ad, ad_row_to_dict
+from miniproject3.responses import ListSerializer, orjson, trusted_json
+
+
+def make_rows(count: int) -> List[tuple]:
+    return [
+        (i, f"Ad {i}", f"Description of ad number {i}", 10.0 + i, "electronics", f"uploads/ab/cd/{'ab' * 32}")
+        for i in range(count)
+    ]
+
+
+def make_app(rows: List[tuple]) -> FastAPI:
+    bench = FastAPI()
+
+    @bench.get("/model", response_model=List[Ad])
+    async def model_path():
+        return [ad_row_to_dict(row) for row in rows]
+
+    validated = ListSerializer(Ad)
+    trusted = ListSerializer(Ad, trusted=True)
+
+    @bench.get("/validated", response_model=List[Ad])
+    async def validated_path():
+        return trusted_json(validated.dumps([ad_row_to_dict(row) for row in rows]))
+
+    @bench.get("/trusted", response_model=List[Ad])
+    async def trusted_path():
+        return trusted_json(trusted.dumps([ad_row_to_dict(row) for row in rows]))
+
+    return bench
+
+
+async def call(app: FastAPI, path: str) -> bytes:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+async def measure(app: FastAPI, path: str, repeat: int) -> float:
+    await call(app, path)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await call(app, path)
+    return (time.perf_counter() - started) / repeat
+
+
+async def main_async(args):
+    print(f"encoder: {'orjson' if orjson is not None else 'json'}")
+    print(f"{'rows':>6} {'response_model':>16} {'validated':>12} {'trusted':>12} {'speedup':>8}")
+    for count in args.sizes:
+        app = make_app(make_rows(count))
+        assert await call(app, "/model") == await call(app, "/validated") == await call(app, "/trusted")
+        repeat = max(args.repeat // count, 20)
+        model = await measure(app, "/model", repeat)
+        validated = await measure(app, "/validated", repeat)
+        trusted = await measure(app, "/trusted", repeat)
+        print(
+            f"{count:>6} {model * 1e6:>13.0f} us {validated * 1e6:>9.0f} us {trusted * 1e6:>9.0f} us "
+            f"{model / trusted:>7.1f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20_000, help="Сумарна кількість рядків на вимір")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Затримка `/search/` (FTS5 + BM25 + підсвітка) на великій таблиці.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_search --rows 1000000
+    python -m miniproject3.benchmarks.bench_search --rows 1000000 --max-candidates 200 1000 5000
+
+Для кожного `--max-candidates` друкуються час першої й п'ятої сторінки та
+скільки всього збігів проходять фільтри: у видачу потрапляють лише
+найновіші `max_candidates` з них.
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from miniproject3 import config
+from miniproject3.main import SEARCH_COLUMNS, _search_ads
+from miniproject3.queries import build_filters, fts_match_expression, next_cursor
+from miniproject3.benchmarks.bench_pagination import CATEGORIES
+
+
+WORDS = (
+    "new used red blue black wooden leather electric portable compact cheap urgent "
+    "warranty vintage bicycle phone laptop sofa table chair lamp guitar camera watch "
+    "jacket boots puppy kitten tent kayak drill printer monitor keyboard"
+).split()
+SYLLABLES = "ba ko ri mu te sa lo vi na pe du gro shi ten mar zol".split()
+
+
+def vocabulary(rnd: random.Random, size: int):
+    """Словник із розподілом Ціпфа: перші слова часті, хвіст рідкісний."""
+    words = list(WORDS)
+    while len(words) < size:
+        words.append("".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 4))))
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    return words, cum_weights
+
+
+def fill(path: str, rows: int, batch: int = 50_000, vocabulary_size: int = 50_000):
+    rnd = random.Random(7)
+    words, cum_weights = vocabulary(rnd, vocabulary_size)
+    with sqlite3.connect(path) as conn:
+        for start in range(0, rows, batch):
+            conn.executemany(
+                "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (" ".join(rnd.choices(words, cum_weights=cum_weights, k=3)),
+                     " ".join(rnd.choices(words, cum_weights=cum_weights, k=20)),
+                     round(rnd.uniform(1, 10_000), 2), rnd.choice(CATEGORIES), "uploads/none.jpg")
+                    for _ in range(start, min(start + batch, rows))
+                ),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--db", help="Готова база з попереднього запуску замість заповнення нової")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-candidates", type=int, nargs="+", default=[config.SEARCH_MAX_CANDIDATES])
+    args = parser.parse_args()
+
+    if args.db:
+        config.DB_NAME = args.db
+    else:
+        config.DB_NAME = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+        config.init_db()
+        started = time.perf_counter()
+        fill(config.DB_NAME, args.rows)
+        print(f"Filled {args.rows} rows in {time.perf_counter() - started:.1f}s ({config.DB_NAME})")
+
+    conn = sqlite3.connect(config.DB_NAME)
+    cases = [
+        ("two words", "kayak drill", {}),
+        ("prefix", "guit*", {}),
+        ("with filters", "laptop", {"category": "electronics", "min_price": 100, "max_price": 5000}),
+        ("common word", "new", {}),
+    ]
+    print(f"\n{'case':<14} {'matches':>9} {'candidates':>11} {'page 1, ms':>12} {'page 5, ms':>12}")
+    for name, text, filters in cases:
+        match = fts_match_expression(text)
+        conditions, params = build_filters(prefix="a.", **filters)
+        matches = conn.execute(
+            "SELECT COUNT(*) FROM ads_fts JOIN ads a ON a.id = ads_fts.rowid WHERE "
+            + " AND ".join(["ads_fts MATCH ?", *conditions]),
+            [match, *params],
+        ).fetchone()[0]
+        for max_candidates in args.max_candidates:
+            timings = []
+            cursor = None
+            for page in range(1, 6):
+                best = float("inf")
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    rows, _ = _search_ads(conn, match, filters, args.limit, cursor, max_candidates)
+                    best = min(best, time.perf_counter() - t0)
+                if page in (1, 5):
+                    timings.append(best)
+                cursor = next_cursor(rows, args.limit, "relevance", SEARCH_COLUMNS)
+                if cursor is None:
+                    break
+            print(f"{name:<14} {matches:>9} {max_candidates:>11} " + " ".join(f"{t * 1000:>12.2f}" for t in timings))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
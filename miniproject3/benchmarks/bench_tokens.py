@@ -0,0 +1,48 @@
+"""Вартість перевірки токена доступу на запит: холодний і теплий кеш `TokenSigner`.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_tokens --users 10000 --requests 200000
+"""
+import argparse
+import secrets
+import time
+
+from miniproject3.tokens import TokenSigner
+
+
+def per_call(fn, tokens, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        fn(tokens[i % len(tokens)])
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=200_000)
+    args = parser.parse_args()
+
+    signer = TokenSigner(secrets.token_bytes(32), max_cached=args.users)
+    tokens = [signer.issue(user_id) for user_id in range(1, args.users + 1)]
+
+    print(f"{'scenario':<28} {'per request':>12}")
+    signature = per_call(signer.verify_signature, tokens, args.requests)
+    print(f"{'HMAC only (no cache)':<28} {signature * 1e6:>9.2f} us")
+
+    cold = per_call(signer.verify, tokens, args.users)
+    print(f"{'cold cache (first request)':<28} {cold * 1e6:>9.2f} us")
+
+    warm = per_call(signer.verify, tokens, args.requests)
+    print(f"{'warm cache':<28} {warm * 1e6:>9.2f} us")
+
+    small = TokenSigner(secrets.token_bytes(32), max_cached=args.users // 10)
+    small_tokens = [small.issue(user_id) for user_id in range(1, args.users + 1)]
+    thrash = per_call(small.verify, small_tokens, args.requests)
+    print(f"{'cache 10% of users (LRU)':<28} {thrash * 1e6:>9.2f} us")
+    print(signer.metrics())
+
+
+if __name__ == "__main__":
+    main()
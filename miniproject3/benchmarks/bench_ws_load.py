@@ -0,0 +1,288 @@
+"""Навантаження на WebSocket-чат: тисячі клієнтів, затримка доставки, повідомлення/с і пам'ять.
+
+Запуск з кореня репозиторію:
+
+    python -m miniproject3.benchmarks.bench_ws_load --target miniproject3 --connections 2000 --rooms 20
+    python -m miniproject3.benchmarks.bench_ws_load --target homeworks14 --output ws_load.jsonl
+    python -m miniproject3.benchmarks.bench_ws_load --target main13 --connections 300
+
+Застосунок запускається в цьому ж процесі через uvicorn на 127.0.0.1 з
+випадковим портом (у окремому потоці зі своїм event loop), клієнти
+`websockets` підключаються до нього справжніми TCP-з'єднаннями. У кожній
+кімнаті `--senders` клієнтів надсилають по `--messages` повідомлень із
+міткою часу; затримка - від відправки до отримання кожним учасником.
+`rss_per_connection_kb` - приріст анонімного RSS процесу після підключення
+всіх клієнтів, поділений на їх кількість, тож включає і клієнтську сторону.
+
+Результат друкується останнім рядком як JSON; з `--output` він ще й
+дописується до файлу JSONL для порівняння запусків між собою.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import uvicorn
+
+from websockets.asyncio.client import connect
+
+
+MESSAGE = re.compile(r"bench (\d+) (\d+) (\d+)")
+
+
+def rss_anon_kb() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1])
+    return 0
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_miniproject3(directory: str, args):
+    from miniproject3 import config
+    from miniproject3.main import app
+
+    config.DB_NAME = os.path.join(directory, "ads.db")
+    config.UPLOAD_DIR = os.path.join(directory, "uploads")
+    config.PASSWORD_HASH_ROUNDS = 4
+    batch = "?batch=1" if args.batch else ""
+    return app, lambda client_id, room: f"/ws/{room}{batch}"
+
+
+def load_homeworks14(directory: str, args):
+    from homeworks.homeworks14.main import create_app
+
+    # chat.db у homeworks14 - відносний шлях
+    os.chdir(directory)
+    return create_app(), lambda client_id, room: f"/ws/{room}"
+
+
+def load_main13(directory: str, args):
+    import jwt
+
+    from homeworks.main13 import ALGORITHM, SECRET_KEY, app
+
+    def url(client_id: int, room: str) -> str:
+        # кімнат у main13 немає: усі клієнти в одному спільному чаті
+        token = jwt.encode({"sub": f"user{client_id}"}, SECRET_KEY, algorithm=ALGORITHM)
+        return f"/ws/?token={token}"
+
+    return app, url
+
+
+TARGETS: Dict[str, Callable] = {
+    "miniproject3": load_miniproject3,
+    "homeworks14": load_homeworks14,
+    "main13": load_main13,
+}
+SINGLE_ROOM_TARGETS = {"main13"}
+
+
+class BackgroundServer:
+    """uvicorn у окремому потоці на вже прив'язаному сокеті з випадковим портом."""
+
+    def __init__(self, app, backlog: int = 4096):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.port = self.socket.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning", backlog=backlog))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("Server failed to start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(30)
+
+
+class Stats:
+    def __init__(self):
+        self.received = 0
+        self.latencies: List[float] = []
+
+    def on_frame(self, frame):
+        now = time.perf_counter_ns()
+        texts = json.loads(frame) if frame.startswith("[") else (frame,)
+        for text in texts:
+            match = MESSAGE.search(text)
+            if match is not None:
+                self.received += 1
+                self.latencies.append((now - int(match.group(3))) / 1e6)
+
+
+async def read(websocket, stats: Stats):
+    try:
+        async for frame in websocket:
+            stats.on_frame(frame)
+    except Exception:
+        pass
+
+
+async def send(websocket, client_id: int, messages: int, interval: float):
+    for seq in range(messages):
+        await websocket.send(f"bench {client_id} {seq} {time.perf_counter_ns()}")
+        await asyncio.sleep(interval)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(base_url: str, url_for: Callable, args) -> dict:
+    rooms = 1 if args.target in SINGLE_ROOM_TARGETS else args.rooms
+    stats = Stats()
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    members: Dict[int, list] = {room: [] for room in range(rooms)}
+    failed = 0
+
+    async def open_client(client_id: int):
+        nonlocal failed
+        room = client_id % rooms
+        async with semaphore:
+            try:
+                websocket = await connect(
+                    base_url + url_for(client_id, f"bench-{room}"),
+                    compression=None,
+                    open_timeout=60,
+                    ping_interval=None,
+                    max_queue=None,
+                )
+            except Exception:
+                failed += 1
+                return
+        members[room].append((client_id, websocket, asyncio.create_task(read(websocket, stats))))
+
+    rss_before = rss_anon_kb()
+    started = time.perf_counter()
+    await asyncio.gather(*(open_client(client_id) for client_id in range(args.connections)))
+    connect_seconds = time.perf_counter() - started
+    connected = args.connections - failed
+    await asyncio.sleep(args.settle)
+    rss_per_connection = (rss_anon_kb() - rss_before) / connected if connected else 0.0
+
+    expected = sum(
+        min(args.senders, len(clients)) * args.messages * len(clients) for clients in members.values()
+    )
+    stats.received = 0
+    stats.latencies.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        send(websocket, client_id, args.messages, args.interval)
+        for clients in members.values()
+        for client_id, websocket, _ in clients[:args.senders]
+    ))
+    deadline = time.perf_counter() + args.drain_timeout
+    while stats.received < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    for clients in members.values():
+        for _, websocket, reader in clients:
+            await websocket.close()
+            reader.cancel()
+
+    return {
+        "rooms": rooms,
+        "connected": connected,
+        "failed_connections": failed,
+        "connect_seconds": round(connect_seconds, 3),
+        "connects_per_second": round(connected / connect_seconds, 1) if connect_seconds else 0.0,
+        "sent": sum(min(args.senders, len(clients)) for clients in members.values()) * args.messages,
+        "expected_deliveries": expected,
+        "deliveries": stats.received,
+        "elapsed_seconds": round(elapsed, 3),
+        "deliveries_per_second": round(stats.received / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(stats.latencies, 0.5), 3),
+            "p99": round(percentile(stats.latencies, 0.99), 3),
+            "max": round(max(stats.latencies, default=0.0), 3),
+        },
+        "rss_per_connection_kb": round(rss_per_connection, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=sorted(TARGETS), default="miniproject3")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--senders", type=int, default=2, help="Відправників у кожній кімнаті")
+    parser.add_argument("--messages", type=int, default=20, help="Повідомлень від кожного відправника")
+    parser.add_argument("--interval", type=float, default=0.05, help="Пауза між повідомленнями відправника, с")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--settle", type=float, default=1.0, help="Пауза після підключення всіх, с")
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--batch", action="store_true", help="miniproject3: клієнти з ?batch=1")
+    parser.add_argument("--output", help="Дописати результат у файл JSONL")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    directory = tempfile.mkdtemp()
+    app, url_for = TARGETS[args.target](directory, args)
+    with BackgroundServer(app) as server:
+        result = asyncio.run(run(f"ws://127.0.0.1:{server.port}", url_for, args))
+
+    record = {
+        "benchmark": "ws_load",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "target": args.target,
+        "params": {
+            "connections": args.connections,
+            "rooms": args.rooms,
+            "senders": args.senders,
+            "messages": args.messages,
+            "interval": args.interval,
+            "batch": args.batch,
+        },
+        **result,
+    }
+    latency = record["latency_ms"]
+    print(
+        f"{args.target}: {record['connected']}/{args.connections} connected in {record['connect_seconds']} s, "
+        f"{record['deliveries']}/{record['expected_deliveries']} delivered, "
+        f"{record['deliveries_per_second']:.0f} msg/s, p50 {latency['p50']} ms, p99 {latency['p99']} ms, "
+        f"max {latency['max']} ms, {record['rss_per_connection_kb']} KB/conn",
+        file=sys.stderr,
+    )
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, "a") as output:
+            output.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
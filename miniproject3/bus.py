@@ -0,0 +1,291 @@
+"""Шина повідомлень кімнат чату між воркерами uvicorn (спільна для miniproject3 і homeworks14).
+
+`LocalBus` працює в межах одного процесу, `UnixSocketBus` - через брокер на
+Unix-сокеті, який запускається окремо:
+
+    python -m miniproject3.bus /tmp/miniproject3-chat.sock
+
+і вмикається у воркерах через `CHAT_BUS=unix:/tmp/miniproject3-chat.sock`
+(у homeworks14 - `CHAT_BUS` у homeworks/homeworks14/config.py).
+Кожен воркер тримає одну підписку на кімнату, в якій є його клієнти, і сам
+розсилає отримані повідомлення своїм сокетам. Брокер не повертає
+повідомлення воркеру, що його опублікував, - той уже розіслав його локально.
+Разом з текстом шиною йде `message_id`, який дав воркер-автор.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+from typing import Callable, Dict, Optional, Set
+
+
+logger = logging.getLogger(__name__)
+
+# (room, message, message_id)
+OnMessage = Callable[[str, str, str], None]
+MAX_FRAME = 1024 * 1024
+# json.dumps кодує символ щонайбільше 6 байтами (\uXXXX), тож кімната, повідомлення
+# та його id такої сумарної довжини гарантовано вміщуються в кадр брокера
+MAX_MESSAGE = (MAX_FRAME - 64) // 6
+MAX_BUFFER = 4 * 1024 * 1024
+
+
+def _frame(*parts: str) -> bytes:
+    return json.dumps(parts, separators=(",", ":")).encode() + b"\n"
+
+
+class MessageBus:
+    """Інтерфейс шини: `subscribe`/`unsubscribe`/`publish` не чекають мережі."""
+
+    async def connect(self, on_message: OnMessage):
+        raise NotImplementedError
+
+    def subscribe(self, room: str):
+        raise NotImplementedError
+
+    def unsubscribe(self, room: str):
+        raise NotImplementedError
+
+    def publish(self, room: str, message: str, message_id: str):
+        raise NotImplementedError
+
+    def metrics(self) -> dict:
+        return {"backend": type(self).__name__}
+
+    async def close(self):
+        pass
+
+
+class InProcessBroker:
+    """Спільна точка для кількох `LocalBus` одного процесу (тести, бенчмарки)."""
+
+    def __init__(self):
+        self.rooms: Dict[str, Set["LocalBus"]] = {}
+
+
+class LocalBus(MessageBus):
+    def __init__(self, broker: Optional[InProcessBroker] = None):
+        self.broker = broker or InProcessBroker()
+        self._on_message: Optional[OnMessage] = None
+        self.published = 0
+
+    async def connect(self, on_message: OnMessage):
+        self._on_message = on_message
+
+    def subscribe(self, room: str):
+        self.broker.rooms.setdefault(room, set()).add(self)
+
+    def unsubscribe(self, room: str):
+        subscribers = self.broker.rooms.get(room)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.broker.rooms[room]
+
+    def publish(self, room: str, message: str, message_id: str):
+        self.published += 1
+        for bus in list(self.broker.rooms.get(room, ())):
+            if bus is not self:
+                bus._on_message(room, message, message_id)
+
+    def metrics(self) -> dict:
+        return {"backend": "local", "published": self.published}
+
+
+class UnixSocketBus(MessageBus):
+    """Клієнт брокера на Unix-сокеті з перепідключенням і відновленням підписок.
+
+    Поки з'єднання немає або буфер запису переповнений, публікації
+    відкидаються (рахуються в `dropped`), щоб розсилка ніколи не чекала.
+    """
+
+    def __init__(self, path: str, reconnect_delay: float = 1.0):
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.rooms: Set[str] = set()
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.failed = 0
+        self.oversized = 0
+        self.reconnects = 0
+        self._on_message: Optional[OnMessage] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self, on_message: OnMessage):
+        self._on_message = on_message
+        try:
+            await self._open()
+        except OSError as exc:
+            logger.warning("Chat bus %s unavailable, will retry: %r", self.path, exc)
+        self._task = asyncio.create_task(self._read_loop())
+
+    async def _open(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=MAX_FRAME)
+        for room in self.rooms:
+            self._writer.write(_frame("s", room))
+
+    def _send(self, frame: bytes) -> bool:
+        writer = self._writer
+        if writer is None or writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            return False
+        writer.write(frame)
+        return True
+
+    def subscribe(self, room: str):
+        self.rooms.add(room)
+        self._send(_frame("s", room))
+
+    def unsubscribe(self, room: str):
+        self.rooms.discard(room)
+        self._send(_frame("u", room))
+
+    def publish(self, room: str, message: str, message_id: str):
+        if len(room) + len(message) + len(message_id) > MAX_MESSAGE:
+            # такий кадр брокер не прочитав би і розірвав би з'єднання з усіма кімнатами воркера
+            self.oversized += 1
+            logger.warning("Chat message of %d chars in room %r is too large for the bus", len(message), room)
+            return
+        if self._send(_frame("p", room, message, message_id)):
+            self.published += 1
+        else:
+            self.dropped += 1
+
+    async def _read_loop(self):
+        while True:
+            if self._reader is not None:
+                try:
+                    async for line in self._reader:
+                        self._dispatch(line)
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError) as exc:
+                    logger.warning("Chat bus connection lost: %r", exc)
+                except Exception:
+                    logger.exception("Chat bus reader failed, reconnecting")
+
+            if self._writer is not None:
+                self._writer.close()
+            self._reader = self._writer = None
+            while self._writer is None:
+                await asyncio.sleep(self.reconnect_delay)
+                try:
+                    await self._open()
+                    self.reconnects += 1
+                except OSError as exc:
+                    logger.warning("Chat bus reconnect to %s failed: %r", self.path, exc)
+
+    def _dispatch(self, line: bytes):
+        # помилка в одному повідомленні не повинна зупиняти читання шини
+        try:
+            _, room, message, message_id = json.loads(line)
+        except ValueError:
+            logger.warning("Malformed chat bus frame dropped: %.100r", line)
+            return
+        self.received += 1
+        try:
+            self._on_message(room, message, message_id)
+        except Exception:
+            self.failed += 1
+            logger.exception("Chat bus delivery to room %r failed", room)
+
+    def metrics(self) -> dict:
+        return {
+            "backend": "unix",
+            "path": self.path,
+            "connected": self._writer is not None,
+            "rooms": len(self.rooms),
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "oversized": self.oversized,
+            "reconnects": self.reconnects,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+
+class Broker:
+    """Брокер: пересилає публікації всім підписаним на кімнату, крім відправника."""
+
+    def __init__(self):
+        self.rooms: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self.forwarded = 0
+        self.disconnected = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        rooms = set()
+        try:
+            async for line in reader:
+                op, room, *rest = json.loads(line)
+                if op == "s":
+                    self.rooms.setdefault(room, set()).add(writer)
+                    rooms.add(room)
+                elif op == "u":
+                    self._leave(room, writer)
+                    rooms.discard(room)
+                elif op == "p":
+                    frame = _frame("m", room, *rest)
+                    for subscriber in list(self.rooms.get(room, ())):
+                        if subscriber is writer:
+                            continue
+                        if subscriber.transport.get_write_buffer_size() > MAX_BUFFER:
+                            # воркер не встигає читати - відключаємо, він перепідключиться
+                            self.disconnected += 1
+                            subscriber.close()
+                            continue
+                        subscriber.write(frame)
+                        self.forwarded += 1
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as exc:
+            logger.info("Broker client dropped: %r", exc)
+        finally:
+            for room in rooms:
+                self._leave(room, writer)
+            writer.close()
+
+    def _leave(self, room: str, writer: asyncio.StreamWriter):
+        subscribers = self.rooms.get(room)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self.rooms[room]
+
+    async def serve(self, path: str) -> asyncio.AbstractServer:
+        if os.path.exists(path):
+            os.remove(path)
+        return await asyncio.start_unix_server(self.handle, path, limit=MAX_FRAME)
+
+
+def create_bus(url: str) -> MessageBus:
+    """`local` або порожній рядок - `LocalBus`, `unix:/path.sock` - `UnixSocketBus`."""
+    if not url or url == "local":
+        return LocalBus()
+    if url.startswith("unix:"):
+        return UnixSocketBus(url[len("unix:"):])
+    raise ValueError(f"Unknown chat bus {url!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Брокер кімнат чату на Unix-сокеті")
+    parser.add_argument("path", nargs="?", default="/tmp/miniproject3-chat.sock")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        server = await Broker().serve(args.path)
+        logger.info("Chat broker listening on %s", args.path)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
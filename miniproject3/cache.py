@@ -0,0 +1,81 @@
+import threading
+
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from starlette.requests import HTTPConnection
+
+
+class QueryCache:
+    """LRU-кеш результатів запитів з інвалідацією за поколінням даних.
+
+    Кожен запис зберігається під поколінням, яке було актуальним до виконання
+    запиту. `invalidate()` збільшує покоління і очищає кеш, тож результат
+    запиту, що завершився вже після запису, ніколи не буде віддано.
+    Розмір обмежується приблизним бюджетом пам'яті `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.generation = 0
+        self._entries: "OrderedDict[Tuple[int, Hashable], Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Tuple[int, Optional[Any]]:
+        """Повертає `(покоління, значення)`; значення None означає промах."""
+        with self._lock:
+            generation = self.generation
+            entry = self._entries.get((generation, key))
+            if entry is None:
+                self.misses += 1
+                return generation, None
+            self._entries.move_to_end((generation, key))
+            self.hits += 1
+            return generation, entry[0]
+
+    def put(self, generation: int, key: Hashable, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            previous = self._entries.pop((generation, key), None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[(generation, key)] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "generation": self.generation,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def get_list_cache(connection: HTTPConnection) -> QueryCache:
+    return connection.app.state.list_cache
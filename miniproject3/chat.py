@@ -0,0 +1,271 @@
+import asyncio
+import itertools
+import logging
+import secrets
+
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+from starlette.requests import HTTPConnection
+
+from .bus import LocalBus, MessageBus
+from .history import ChatHistory
+from .responses import dumps
+
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop-oldest", "disconnect")
+# 1013 Try Again Later: клієнт не встигає читати повідомлення
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """Вихідна черга одного WebSocket-клієнта та задача, що її розвантажує.
+
+    `enqueue` нічого не чекає: повідомлення кладеться в обмежену чергу, а
+    відправку робить окрема задача-писач, тож повільний клієнт затримує лише
+    власну чергу. При переповненні з політикою `drop-oldest` викидається
+    найстаріше повідомлення, з `disconnect` - клієнт відключається.
+    """
+
+    def __init__(
+        self, websocket: WebSocket, max_queue: int, policy: str, send_timeout: float, batched: bool = False
+    ):
+        self.websocket = websocket
+        # клієнт отримує кадри-масиви JSON з кількох повідомлень замість окремих
+        self.batched = batched
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.closed = False
+        self.dropped = 0
+        self.sent = 0
+        self._queue: Deque[str] = deque()
+        self._ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, message: str) -> bool:
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                self._abort("send queue overflow")
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(message)
+        self._ready.set()
+        return True
+
+    async def _write_loop(self):
+        try:
+            # `closed` перевіряється явно: у Python 3.11 `wait_for` може проковтнути
+            # скасування, якщо відправка завершилась одночасно з ним
+            while not self.closed:
+                await self._ready.wait()
+                while self._queue and not self.closed:
+                    message = self._queue.popleft()
+                    await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+                    self.sent += 1
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # закритий або завислий сокет зупиняє лише свого писача
+            logger.info("Dropping chat client: %r", exc)
+            self.closed = True
+            self._queue.clear()
+            await self._close_socket("send failed")
+
+    def _abort(self, reason: str):
+        self.closed = True
+        self._queue.clear()
+        self._writer.cancel()
+        self._closing = asyncio.create_task(self._close_socket(reason))
+
+    async def _close_socket(self, reason: str):
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason=reason)
+        except Exception:
+            pass
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    async def close(self):
+        self.closed = True
+        self._ready.set()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+class ChatHub:
+    """Кімнати чату з неблокуючою розсилкою через черги клієнтів.
+
+    Повідомлення від своїх клієнтів розсилаються локально й публікуються в
+    шину; з шини приходять повідомлення інших воркерів. На кожну кімнату, де
+    є локальні клієнти, воркер тримає рівно одну підписку. З `history`
+    повідомлення своїх клієнтів записуються в історію, а всі - потрапляють у
+    її кільцеві буфери для повтору новим клієнтам.
+
+    З `coalesce_window` > 0 повідомлення кімнати, що прийшли протягом цього
+    вікна (секунди), надсилаються клієнтам з `batched` одним кадром - масивом
+    JSON, закодованим один раз на всю кімнату. Решта клієнтів отримують
+    кожне повідомлення одразу, без очікування вікна.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 256,
+        policy: str = "drop-oldest",
+        send_timeout: float = 10.0,
+        bus: Optional[MessageBus] = None,
+        history: Optional[ChatHistory] = None,
+        coalesce_window: float = 0.0,
+    ):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}")
+        self.bus = bus or LocalBus()
+        self.history = history
+        # id повідомлення унікальний між воркерами: випадковий префікс воркера + лічильник
+        self.worker_id = secrets.token_hex(8)
+        self._message_ids = itertools.count()
+        self.coalesce_window = coalesce_window
+        self._batches: Dict[str, List[str]] = {}
+        self.frames = 0
+        self.batched_messages = 0
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.rooms: Dict[str, Set[ClientConnection]] = {}
+        self.dropped = 0
+        self.disconnected = 0
+
+    async def start(self):
+        await self.bus.connect(self.deliver)
+
+    async def close(self):
+        for room in list(self._batches):
+            self._flush_batch(room)
+        await self.bus.close()
+
+    def join(
+        self, room: str, websocket: WebSocket, replay: Iterable[str] = (), batched: bool = False
+    ) -> ClientConnection:
+        """Реєструє клієнта; `replay` стає в його чергу раніше за будь-яке нове повідомлення."""
+        client = ClientConnection(websocket, self.max_queue, self.policy, self.send_timeout, batched)
+        replay = list(replay)
+        if batched and replay:
+            client.enqueue(dumps(replay).decode())
+        else:
+            for message in replay:
+                client.enqueue(message)
+        if room not in self.rooms:
+            self.rooms[room] = set()
+            self.bus.subscribe(room)
+            if self.history is not None:
+                self.history.pin(room)
+        self.rooms[room].add(client)
+        return client
+
+    def _discard(self, room: str, client: ClientConnection):
+        clients = self.rooms.get(room)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del self.rooms[room]
+                self.bus.unsubscribe(room)
+                if self.history is not None:
+                    self.history.unpin(room)
+
+    async def leave(self, room: str, client: ClientConnection):
+        self._discard(room, client)
+        self.dropped += client.dropped
+        await client.close()
+
+    def deliver(self, room: str, message: str, message_id: str) -> int:
+        """Повідомлення з шини від іншого воркера; повертає кількість доставлених у черги."""
+        if self.history is not None:
+            self.history.remember(room, message, message_id)
+        return self._fanout(room, message)
+
+    def _fanout(self, room: str, message: str) -> int:
+        if self.coalesce_window <= 0:
+            return self._send(room, [message])
+        # клієнти без batched отримують повідомлення одразу, вікна чекають лише batched
+        delivered = self._send(room, [message], batched=False)
+        waiting = sum(1 for client in self.rooms.get(room, ()) if client.batched)
+        if waiting:
+            batch = self._batches.get(room)
+            if batch is None:
+                batch = self._batches[room] = []
+                asyncio.get_running_loop().call_later(self.coalesce_window, self._flush_batch, room)
+            batch.append(message)
+        return delivered + waiting
+
+    def _flush_batch(self, room: str):
+        messages = self._batches.pop(room, None)
+        if messages:
+            self._send(room, messages, batched=True)
+
+    def _send(self, room: str, messages: List[str], batched: Optional[bool] = None) -> int:
+        """Ставить `messages` у черги клієнтів кімнати; `batched` обмежує, яким саме."""
+        frame = None
+        delivered = 0
+        for client in list(self.rooms.get(room, ())):
+            if batched is not None and client.batched != batched:
+                continue
+            if client.batched:
+                if frame is None:
+                    frame = dumps(messages).decode()
+                    self.frames += 1
+                    self.batched_messages += len(messages)
+                accepted = client.enqueue(frame)
+            else:
+                for message in messages:
+                    accepted = client.enqueue(message)
+                    if not accepted:
+                        break
+            if accepted:
+                delivered += 1
+            elif client.closed:
+                self._discard(room, client)
+                self.disconnected += 1
+        return delivered
+
+    def broadcast(self, room: str, message: str) -> int:
+        """Повідомлення від локального клієнта: розсилка своїм і публікація іншим воркерам."""
+        message_id = f"{self.worker_id}-{next(self._message_ids)}"
+        if self.history is not None:
+            self.history.record(room, message, message_id)
+        delivered = self._fanout(room, message)
+        self.bus.publish(room, message, message_id)
+        return delivered
+
+    def metrics(self) -> dict:
+        clients = [client for room in self.rooms.values() for client in room]
+        return {
+            "rooms": len(self.rooms),
+            "clients": len(clients),
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "queued": sum(client.queued for client in clients),
+            "queued_max": max((client.queued for client in clients), default=0),
+            "dropped": self.dropped + sum(client.dropped for client in clients),
+            "disconnected": self.disconnected,
+            "bus": self.bus.metrics(),
+            "history": self.history.metrics() if self.history is not None else None,
+            "coalesce_window_ms": self.coalesce_window * 1000,
+            "batch_frames": self.frames,
+            "batched_messages": self.batched_messages,
+        }
+
+
+def get_chat_hub(connection: HTTPConnection) -> ChatHub:
+    return connection.app.state.chat
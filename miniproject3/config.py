@@ -1,19 +1,107 @@
+import asyncio
+import logging
 import os
+import secrets
 import sqlite3
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.security import OAuth2PasswordBearer
+from .bus import create_bus
+from .cache import QueryCache
+from .chat import ChatHub
+from .db import Database
+from .facets import rebuild as rebuild_facets, schema_sql as facets_schema_sql
+from .history import SCHEMA as messages_schema, ChatHistory
+from .passwords import PasswordHasher
+from .ratelimit import LoginLimiter, SlidingWindowLimiter
+from .refresh_tokens import SCHEMA as refresh_tokens_schema, cleanup_loop as refresh_tokens_cleanup
+from .rooms import RoomRegistry
+from .storage import ImageStorage, UploadSizeLimitMiddleware
+from .thumbnails import ThumbnailPipeline
+from .tokens import TokenSigner
 
 
 DB_NAME = "ads.db"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# /search/ ранжує лише стільки найновіших збігів, що пройшли фільтри
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "500"))
+DB_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -32000,
+    "mmap_size": 268435456,
+}
 UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-app = FastAPI(on_startup=["init_db"])
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# запас на текстові поля форми та межі multipart понад сам файл
+MAX_FORM_OVERHEAD_BYTES = 64 * 1024
+LIST_CACHE_MAX_BYTES = int(os.getenv("LIST_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+THUMBNAIL_SIZES = {"small": 160, "medium": 480}
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "5"))
+# вартість bcrypt підбирається при старті під PASSWORD_HASH_TARGET_MS,
+# якщо її не задано явно через PASSWORD_HASH_ROUNDS
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "150"))
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "0")) or None
+PASSWORD_MIN_ROUNDS = int(os.getenv("PASSWORD_MIN_ROUNDS", "10"))
+PASSWORD_MAX_ROUNDS = int(os.getenv("PASSWORD_MAX_ROUNDS", "16"))
+# TOKEN_SECRET - ключ підпису токенів доступу, спільний для всіх воркерів. Обов'язковий,
+# якщо воркерів кілька (WEB_CONCURRENCY > 1, як його читає `uvicorn --workers`, або CHAT_BUS
+# не "local"): інакше кожен воркер згенерує свій ключ і не прийме чужі токени. Для одного
+# воркера без нього ключ генерується при старті, і токени не переживають перезапуск.
+TOKEN_SECRET = os.getenv("TOKEN_SECRET", "").encode()
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", "900"))
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", str(30 * 24 * 3600)))
+REFRESH_CLEANUP_INTERVAL = float(os.getenv("REFRESH_CLEANUP_INTERVAL", "3600"))
+REFRESH_CLEANUP_BATCH = int(os.getenv("REFRESH_CLEANUP_BATCH", "1000"))
+LOGIN_ATTEMPTS_PER_ACCOUNT = int(os.getenv("LOGIN_ATTEMPTS_PER_ACCOUNT", "10"))
+LOGIN_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_ATTEMPTS_PER_IP", "30"))
+LOGIN_ATTEMPTS_WINDOW = float(os.getenv("LOGIN_ATTEMPTS_WINDOW", "60"))
+LOGIN_LIMITER_MAX_KEYS = int(os.getenv("LOGIN_LIMITER_MAX_KEYS", "100000"))
+# вихідна черга кожного клієнта чату; при переповненні "drop-oldest" або "disconnect"
+CHAT_SEND_QUEUE = int(os.getenv("CHAT_SEND_QUEUE", "256"))
+CHAT_OVERFLOW_POLICY = os.getenv("CHAT_OVERFLOW_POLICY", "drop-oldest")
+CHAT_SEND_TIMEOUT = float(os.getenv("CHAT_SEND_TIMEOUT", "10"))
+# "local" для одного воркера або "unix:/tmp/miniproject3-chat.sock" для кількох (див. miniproject3/bus.py)
+CHAT_BUS = os.getenv("CHAT_BUS", "local")
+# > 0 - повідомлення кімнати за це вікно йдуть клієнтам з ?batch=1 одним кадром-масивом JSON
+CHAT_COALESCE_MS = float(os.getenv("CHAT_COALESCE_MS", "0"))
+# повідомлення пишуться в базу пакетами раз на CHAT_HISTORY_FLUSH_INTERVAL секунд
+# або по CHAT_HISTORY_FLUSH_BATCH; новий клієнт отримує останні CHAT_HISTORY_REPLAY
+CHAT_HISTORY_REPLAY = int(os.getenv("CHAT_HISTORY_REPLAY", "50"))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "0.2"))
+CHAT_HISTORY_FLUSH_BATCH = int(os.getenv("CHAT_HISTORY_FLUSH_BATCH", "500"))
+CHAT_HISTORY_MAX_PENDING = int(os.getenv("CHAT_HISTORY_MAX_PENDING", "10000"))
+CHAT_HISTORY_ROOMS = int(os.getenv("CHAT_HISTORY_ROOMS", "10000"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# "1" - /filters/ і /search/ віддають рядки без перевірки pydantic через orjson (див. responses.ListSerializer)
+TRUSTED_JSON_RESPONSES = os.getenv("TRUSTED_JSON_RESPONSES", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+def token_secret() -> bytes:
+    if TOKEN_SECRET:
+        return TOKEN_SECRET
+    if WEB_CONCURRENCY > 1 or CHAT_BUS != "local":
+        raise RuntimeError(
+            "TOKEN_SECRET must be set when running several workers: "
+            "each worker would sign tokens with its own random key"
+        )
+    logger.warning("TOKEN_SECRET is not set: using a random key, issued tokens will not survive a restart")
+    return secrets.token_bytes(32)
 
 def init_db():
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    existing_tables = {
+        row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
     cursor.executescript("""
         CREATE TABLE IF NOT EXISTS ads (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -23,6 +111,40 @@ def init_db():
             category TEXT NOT NULL,
             image_path TEXT NOT NULL
         );
+        CREATE INDEX IF NOT EXISTS idx_ads_category_price_id ON ads (category, price, id);
+        CREATE INDEX IF NOT EXISTS idx_ads_category_id ON ads (category, id);
+        CREATE INDEX IF NOT EXISTS idx_ads_price_id ON ads (price, id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS ads_fts USING fts5(
+            title,
+            description,
+            content='ads',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TABLE IF NOT EXISTS ads_bulk_load (active INTEGER NOT NULL);
+        DROP TRIGGER IF EXISTS ads_fts_insert;
+        CREATE TRIGGER ads_fts_insert AFTER INSERT ON ads
+        WHEN NOT EXISTS (SELECT 1 FROM ads_bulk_load) BEGIN
+            INSERT INTO ads_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS ads_fts_delete AFTER DELETE ON ads BEGIN
+            INSERT INTO ads_fts (ads_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS ads_fts_update AFTER UPDATE OF title, description ON ads BEGIN
+            INSERT INTO ads_fts (ads_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO ads_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END;
+        CREATE TABLE IF NOT EXISTS images (
+            hash TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        );
         CREATE TABLE IF NOT EXISTS rooms (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT UNIQUE NOT NULL
@@ -34,5 +156,68 @@ def init_db():
             password VARCHAR(30) NOT NULL
         );
     """)
+    cursor.executescript(facets_schema_sql())
+    cursor.executescript(refresh_tokens_schema)
+    cursor.executescript(messages_schema)
+    if "ads_fts" not in existing_tables:
+        cursor.execute("INSERT INTO ads_fts (ads_fts) VALUES ('rebuild')")
     conn.commit()
-    conn.close()
\ No newline at end of file
+    if "ad_facets" not in existing_tables:
+        rebuild_facets(conn)
+    conn.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    secret = token_secret()
+    init_db()
+    app.state.db = Database(DB_NAME, size=DB_POOL_SIZE, pragmas=DB_PRAGMAS)
+    app.state.storage = ImageStorage(app.state.db.run, UPLOAD_DIR, UPLOAD_CHUNK_SIZE, MAX_UPLOAD_BYTES)
+    app.state.thumbnails = ThumbnailPipeline(UPLOAD_DIR, THUMBNAIL_SIZES, THUMBNAIL_WORKERS)
+    app.state.list_cache = QueryCache(LIST_CACHE_MAX_BYTES)
+    app.state.hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_TIMEOUT)
+    if PASSWORD_HASH_ROUNDS is not None:
+        app.state.hasher.rounds = PASSWORD_HASH_ROUNDS
+    else:
+        app.state.hasher.calibrate(PASSWORD_HASH_TARGET_MS, PASSWORD_MIN_ROUNDS, PASSWORD_MAX_ROUNDS)
+    app.state.tokens = TokenSigner(secret, ACCESS_TOKEN_TTL, TOKEN_CACHE_SIZE)
+    app.state.login_limiter = LoginLimiter(
+        per_account=SlidingWindowLimiter(LOGIN_ATTEMPTS_PER_ACCOUNT, LOGIN_ATTEMPTS_WINDOW, LOGIN_LIMITER_MAX_KEYS),
+        per_ip=SlidingWindowLimiter(LOGIN_ATTEMPTS_PER_IP, LOGIN_ATTEMPTS_WINDOW, LOGIN_LIMITER_MAX_KEYS),
+    )
+    app.state.rooms = RoomRegistry(app.state.db.run)
+    await app.state.rooms.start()
+    app.state.chat_history = ChatHistory(
+        app.state.db,
+        CHAT_HISTORY_REPLAY,
+        CHAT_HISTORY_FLUSH_INTERVAL,
+        CHAT_HISTORY_FLUSH_BATCH,
+        CHAT_HISTORY_MAX_PENDING,
+        CHAT_HISTORY_ROOMS,
+    )
+    app.state.chat_history.start()
+    app.state.chat = ChatHub(
+        CHAT_SEND_QUEUE,
+        CHAT_OVERFLOW_POLICY,
+        CHAT_SEND_TIMEOUT,
+        create_bus(CHAT_BUS),
+        app.state.chat_history,
+        CHAT_COALESCE_MS / 1000,
+    )
+    await app.state.chat.start()
+    cleanup = asyncio.create_task(
+        refresh_tokens_cleanup(app.state.db, REFRESH_CLEANUP_INTERVAL, REFRESH_CLEANUP_BATCH)
+    )
+    try:
+        yield
+    finally:
+        cleanup.cancel()
+        await app.state.chat.close()
+        await app.state.chat_history.close()
+        await app.state.rooms.close()
+        app.state.hasher.close()
+        app.state.thumbnails.close()
+        app.state.db.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES + MAX_FORM_OVERHEAD_BYTES)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -0,0 +1,151 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Optional
+
+from starlette.requests import HTTPConnection
+
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 134217728,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Database:
+    """Пул з'єднань SQLite з власним обмеженим пулом потоків.
+
+    З'єднання створюються один раз і видаються по черзі; усі запити з
+    async-коду виконуються через `run`/`fetchall`/`execute` у пулі потоків,
+    тож event loop не блокується на I/O бази.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 4,
+        workers: Optional[int] = None,
+        timeout: float = 10.0,
+        pragmas: Optional[dict] = None,
+    ):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or size, thread_name_prefix="sqlite"
+        )
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._in_use = 0
+
+        for _ in range(size):
+            conn = self._connect()
+            self._all.append(conn)
+            self._idle.put(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No free SQLite connection after {self.timeout}s")
+        waited = time.perf_counter() - started
+
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if waited > 0.001:
+                self._waits += 1
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(conn)
+
+    def _call(self, fn: Callable, args: tuple):
+        with self.connection() as conn:
+            return fn(conn, *args)
+
+    async def run(self, fn: Callable[..., Any], *args):
+        """Виконує `fn(conn, *args)` у пулі потоків з позиченим з'єднанням."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    async def fetchall(self, query: str, params: Iterable = (), row_factory=None):
+        def _fetchall(conn):
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            return cursor.execute(query, params).fetchall()
+
+        return await self.run(_fetchall)
+
+    async def fetchone(self, query: str, params: Iterable = (), row_factory=None):
+        def _fetchone(conn):
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            return cursor.execute(query, params).fetchone()
+
+        return await self.run(_fetchone)
+
+    async def execute(self, query: str, params: Iterable = ()) -> int:
+        """Виконує запис у власній транзакції та повертає `lastrowid`."""
+
+        def _execute(conn):
+            with conn:
+                return conn.execute(query, params).lastrowid
+
+        return await self.run(_execute)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "contended_checkouts": self._waits,
+                "wait_total_ms": round(self._wait_total * 1000, 3),
+                "wait_avg_ms": round(self._wait_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for conn in self._all:
+            conn.close()
+        self._all.clear()
+
+
+def get_db(connection: HTTPConnection) -> Database:
+    return connection.app.state.db
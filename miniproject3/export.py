@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+import sqlite3
+import zlib
+
+from typing import AsyncIterator, List, Optional
+
+from .db import Database
+from .queries import build_filters
+
+
+EXPORT_COLUMNS = ("id", "title", "description", "price", "category", "image_path")
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json",
+}
+
+
+def fetch_chunk(
+    conn: sqlite3.Connection,
+    conditions: List[str],
+    params: list,
+    after_id: int,
+    last_id: int,
+    size: int,
+) -> List[tuple]:
+    """Наступні `size` рядків з `id > after_id` (keyset по первинному ключу)."""
+    where = " AND ".join([*conditions, "id > ?", "id <= ?"])
+    return conn.execute(
+        f"SELECT {', '.join(EXPORT_COLUMNS)} FROM ads WHERE {where} ORDER BY id LIMIT ?",
+        (*params, after_id, last_id, size),
+    ).fetchall()
+
+
+def _ndjson(rows: List[tuple], first: bool) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+    )
+
+
+def _json_array(rows: List[tuple], first: bool) -> str:
+    items = ",\n".join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) for row in rows)
+    return items if first else ",\n" + items
+
+
+def _csv(rows: List[tuple], first: bool) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+ENCODERS = {
+    "ndjson": ("", _ndjson, ""),
+    "csv": (",".join(EXPORT_COLUMNS) + "\r\n", _csv, ""),
+    "json": ("[\n", _json_array, "\n]\n"),
+}
+
+
+async def export_stream(
+    db: Database,
+    fmt: str,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    chunk_size: int = 1000,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """Потоково віддає оголошення частинами по `chunk_size` рядків.
+
+    Кожна частина читається окремим викликом пулу за keyset-умовою `id > ?`,
+    тож з'єднання не утримується, поки клієнт повільно читає відповідь, а
+    пам'ять не залежить від кількості рядків. Верхня межа `id` фіксується на
+    початку: рядки, додані під час експорту, не потрапляють у вивантаження.
+    """
+    header, encode, footer = ENCODERS[fmt]
+    conditions, params = build_filters(category, min_price, max_price)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def output(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor is not None else data
+
+    last_id = (await db.fetchone("SELECT MAX(id) FROM ads"))[0] or 0
+    after_id = 0
+    first = True
+    if header:
+        yield output(header)
+    while after_id < last_id:
+        rows = await db.run(fetch_chunk, conditions, params, after_id, last_id, chunk_size)
+        if not rows:
+            break
+        data = output(encode(rows, first))
+        if data:
+            yield data
+        first = False
+        after_id = rows[-1][0]
+    tail = output(footer)
+    if compressor is not None:
+        tail += compressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,143 @@
+"""Агрегати для фільтрів: кількість оголошень за категоріями та ціновими діапазонами.
+
+Таблицю `ad_facets` ведуть тригери на `ads`, тож читання не залежить від
+розміру таблиці. Перевірка узгодженості з нуля:
+
+    python -m miniproject3.facets ads.db [--fix]
+"""
+import argparse
+import sqlite3
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+PRICE_BUCKETS = (100, 500, 1000, 5000, 10000, 50000)
+
+
+def bucket_expression(column: str, bounds: Sequence[float] = PRICE_BUCKETS) -> str:
+    cases = " ".join(f"WHEN {column} < {bound} THEN {index}" for index, bound in enumerate(bounds))
+    return f"(CASE {cases} ELSE {len(bounds)} END)"
+
+
+def bucket_ranges(bounds: Sequence[float] = PRICE_BUCKETS) -> List[Tuple[Optional[float], Optional[float]]]:
+    edges = [None, *bounds, None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def schema_sql(bounds: Sequence[float] = PRICE_BUCKETS) -> str:
+    new_bucket = bucket_expression("new.price", bounds)
+    old_bucket = bucket_expression("old.price", bounds)
+    increment = f"""
+            INSERT INTO ad_facets (category, bucket, count) VALUES (new.category, {new_bucket}, 1)
+            ON CONFLICT (category, bucket) DO UPDATE SET count = count + 1;"""
+    decrement = f"""
+            UPDATE ad_facets SET count = count - 1
+            WHERE category = old.category AND bucket = {old_bucket};
+            DELETE FROM ad_facets
+            WHERE category = old.category AND bucket = {old_bucket} AND count <= 0;"""
+    return f"""
+        CREATE TABLE IF NOT EXISTS ad_facets (
+            category TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (category, bucket)
+        ) WITHOUT ROWID;
+        DROP TRIGGER IF EXISTS ad_facets_insert;
+        CREATE TRIGGER ad_facets_insert AFTER INSERT ON ads
+        WHEN NOT EXISTS (SELECT 1 FROM ads_bulk_load) BEGIN{increment}
+        END;
+        CREATE TRIGGER IF NOT EXISTS ad_facets_delete AFTER DELETE ON ads BEGIN{decrement}
+        END;
+        CREATE TRIGGER IF NOT EXISTS ad_facets_update AFTER UPDATE OF price, category ON ads BEGIN{decrement}{increment}
+        END;
+    """
+
+
+def expected_counts(conn: sqlite3.Connection, bounds: Sequence[float] = PRICE_BUCKETS) -> Dict[Tuple[str, int], int]:
+    rows = conn.execute(
+        f"SELECT category, {bucket_expression('price', bounds)} AS bucket, COUNT(*) "
+        "FROM ads GROUP BY category, bucket"
+    )
+    return {(category, bucket): count for category, bucket, count in rows}
+
+
+def stored_counts(conn: sqlite3.Connection) -> Dict[Tuple[str, int], int]:
+    rows = conn.execute("SELECT category, bucket, count FROM ad_facets")
+    return {(category, bucket): count for category, bucket, count in rows}
+
+
+def rebuild(conn: sqlite3.Connection, bounds: Sequence[float] = PRICE_BUCKETS):
+    with conn:
+        conn.execute("DELETE FROM ad_facets")
+        conn.execute(
+            f"INSERT INTO ad_facets (category, bucket, count) "
+            f"SELECT category, {bucket_expression('price', bounds)} AS bucket, COUNT(*) "
+            "FROM ads GROUP BY category, bucket"
+        )
+
+
+def add_inserted(conn: sqlite3.Connection, first_id: int, bounds: Sequence[float] = PRICE_BUCKETS):
+    """Додає до агрегатів рядки `ads` з `id >= first_id` одним запитом (масовий імпорт)."""
+    conn.execute(
+        f"INSERT INTO ad_facets (category, bucket, count) "
+        f"SELECT category, {bucket_expression('price', bounds)} AS bucket, COUNT(*) "
+        "FROM ads WHERE id >= ? GROUP BY category, bucket "
+        "ON CONFLICT (category, bucket) DO UPDATE SET count = count + excluded.count",
+        (first_id,),
+    )
+
+
+def diff(conn: sqlite3.Connection, bounds: Sequence[float] = PRICE_BUCKETS) -> List[Tuple[str, int, int, int]]:
+    """Розбіжності `(category, bucket, stored, expected)` між агрегатами та `ads`."""
+    expected = expected_counts(conn, bounds)
+    stored = stored_counts(conn)
+    return [
+        (category, bucket, stored.get((category, bucket), 0), expected.get((category, bucket), 0))
+        for category, bucket in sorted(expected.keys() | stored.keys())
+        if stored.get((category, bucket), 0) != expected.get((category, bucket), 0)
+    ]
+
+
+def read_facets(conn: sqlite3.Connection, category: Optional[str] = None, bounds: Sequence[float] = PRICE_BUCKETS) -> dict:
+    categories: Dict[str, int] = {}
+    histogram = [0] * (len(bounds) + 1)
+    for row_category, bucket, count in conn.execute("SELECT category, bucket, count FROM ad_facets"):
+        categories[row_category] = categories.get(row_category, 0) + count
+        if category is None or row_category == category:
+            histogram[bucket] += count
+
+    return {
+        "total": sum(categories.values()),
+        "categories": [
+            {"category": name, "count": count}
+            for name, count in sorted(categories.items(), key=lambda item: (-item[1], item[0]))
+        ],
+        "price_histogram": [
+            {"min_price": low, "max_price": high, "count": count}
+            for (low, high), count in zip(bucket_ranges(bounds), histogram)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перевірка узгодженості таблиці ad_facets з ads")
+    parser.add_argument("db", nargs="?", default="ads.db")
+    parser.add_argument("--fix", action="store_true", help="Перебудувати агрегати, якщо є розбіжності")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    mismatches = diff(conn)
+    for category, bucket, stored, expected in mismatches:
+        print(f"{category!r} bucket {bucket}: stored {stored}, expected {expected}")
+
+    if not mismatches:
+        print("ad_facets is consistent")
+    elif args.fix:
+        rebuild(conn)
+        print(f"Rebuilt ad_facets, fixed {len(mismatches)} rows")
+    conn.close()
+    raise SystemExit(1 if mismatches and not args.fix else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Історія кімнат чату: кільцевий буфер у пам'яті та відкладений запис у SQLite.
+
+Нові повідомлення не комітяться по одному: `record` лише додає їх у буфер,
+а фонова задача записує буфер однією транзакцією кожні `flush_interval`
+секунд або щойно в ньому набереться `flush_batch` повідомлень. Останні
+`replay_size` повідомлень кожної активної кімнати тримаються в пам'яті, тож
+повтор історії при підключенні зазвичай не звертається до бази; до неї йде
+лише перше підключення до "холодної" кімнати.
+
+Кожне повідомлення має `message_id`, який дає воркер-автор і який іде через
+шину разом з текстом, тож одне й те саме повідомлення з різних джерел
+(база, черга запису, шина) розпізнається однозначно.
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Set, Tuple
+
+from starlette.requests import HTTPConnection
+
+from .db import Database
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room TEXT NOT NULL,
+        message_id TEXT NOT NULL,
+        body TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_room_id ON messages (room, id);
+"""
+
+
+
+def insert_messages(conn: sqlite3.Connection, rows: List[Tuple[str, str, str, float]]) -> int:
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (room, message_id, body, created_at) VALUES (?, ?, ?, ?)", rows
+        )
+    return len(rows)
+
+
+def fetch_recent(conn: sqlite3.Connection, room: str, limit: int) -> List[Tuple[str, str]]:
+    rows = conn.execute(
+        "SELECT message_id, body FROM messages WHERE room = ? ORDER BY id DESC LIMIT ?", (room, limit)
+    ).fetchall()
+    return [(message_id, body) for message_id, body in reversed(rows)]
+
+
+def merge_recent(stored: List[Tuple[str, str]], extra: List[Tuple[str, str]], limit: int) -> List[str]:
+    """Дописує до прочитаних з бази повідомлень ті `(message_id, body)` з `extra`, яких у ній ще немає."""
+    seen = {message_id for message_id, _ in stored}
+    merged = [body for _, body in stored]
+    for message_id, body in extra:
+        if message_id not in seen:
+            seen.add(message_id)
+            merged.append(body)
+    return merged[-limit:]
+
+
+class ChatHistory:
+    """Write-behind запис повідомлень і повтор останніх `replay_size` на вході.
+
+    Кільцеві буфери є лише для `max_rooms` нещодавно активних кімнат; решта
+    підвантажується з бази індексним запитом при першому підключенні.
+    Кімнати, закріплені через `pin` (у них є підключені клієнти), не
+    витісняються, навіть якщо їх більше за `max_rooms`.
+    На кімнату припадає одне завантаження, решта підключень чекають на нього;
+    запис пакетів і завантаження інших кімнат при цьому не зупиняються.
+    Повідомлення, що приходять під час завантаження, збираються окремо й
+    зливаються з прочитаним з бази за `message_id` (`merge_recent`), тож
+    кожне потрапляє в буфер кімнати рівно один раз. Якщо база недоступна,
+    незаписані повідомлення накопичуються до `max_pending`, далі найстаріші
+    відкидаються.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        replay_size: int = 50,
+        flush_interval: float = 0.2,
+        flush_batch: int = 500,
+        max_pending: int = 10_000,
+        max_rooms: int = 10_000,
+    ):
+        self.db = db
+        self.replay_size = replay_size
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.max_rooms = max_rooms
+        self._rooms: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._pending: List[Tuple[str, str, str, float]] = []
+        self._loading: Dict[str, "asyncio.Task[Deque[str]]"] = {}
+        self._arrived: Dict[str, List[Tuple[str, str]]] = {}
+        self._pinned: Set[str] = set()
+        self._full = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._closed = False
+        self._task = None
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.replay_hits = 0
+        self.replay_misses = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    def pin(self, room: str):
+        """Кімната з підключеними клієнтами: її буфер не витісняється."""
+        self._pinned.add(room)
+
+    def unpin(self, room: str):
+        self._pinned.discard(room)
+
+    def remember(self, room: str, message: str, message_id: str):
+        """Додає повідомлення до кільцевого буфера кімнати, якщо він завантажений."""
+        ring = self._rooms.get(room)
+        if ring is not None:
+            ring.append(message)
+            return
+        arrived = self._arrived.get(room)
+        if arrived is not None:
+            arrived.append((message_id, message))
+
+    def record(self, room: str, message: str, message_id: str):
+        """Повідомлення від локального клієнта: у буфер кімнати й у чергу запису."""
+        self.remember(room, message, message_id)
+        if len(self._pending) >= self.max_pending:
+            del self._pending[0]
+            self.dropped += 1
+        self._pending.append((room, message_id, message, time.time()))
+        if len(self._pending) >= self.flush_batch:
+            self._full.set()
+
+    async def recent(self, room: str) -> List[str]:
+        ring = self._rooms.get(room)
+        if ring is None:
+            loading = self._loading.get(room)
+            if loading is None:
+                self.replay_misses += 1
+                loading = self._loading[room] = asyncio.create_task(self._load(room))
+            else:
+                self.replay_hits += 1
+            # скасування одного підключення не повинно зривати завантаження для інших
+            ring = await asyncio.shield(loading)
+        else:
+            self.replay_hits += 1
+        if room in self._rooms:
+            self._rooms.move_to_end(room)
+        return list(ring)
+
+    async def _load(self, room: str) -> Deque[str]:
+        # усе, що прийде до кімнати під час читання, збирається в `arrived`;
+        # незаписане на старті могло бути записане за цей час, тож теж іде на злиття
+        arrived = self._arrived[room] = []
+        unflushed = [(message_id, body) for pending_room, message_id, body, _ in self._pending if pending_room == room]
+        try:
+            stored = await self.db.run(fetch_recent, room, self.replay_size)
+            return self._install(room, merge_recent(stored, unflushed + arrived, self.replay_size))
+        finally:
+            del self._arrived[room]
+            del self._loading[room]
+
+    def _install(self, room: str, messages: List[str]) -> Deque[str]:
+        ring = self._rooms[room] = deque(messages, maxlen=self.replay_size)
+        excess = len(self._rooms) - self.max_rooms
+        for candidate in list(self._rooms):
+            if excess <= 0:
+                break
+            if candidate == room or candidate in self._pinned:
+                # активні кімнати в кінець, щоб наступне витіснення не переглядало їх знову
+                self._rooms.move_to_end(candidate)
+                continue
+            del self._rooms[candidate]
+            excess -= 1
+        return ring
+
+    async def flush(self):
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                self.written += await self.db.run(insert_messages, batch)
+                self.flushes += 1
+            except Exception:
+                logger.exception("Chat history flush of %d messages failed", len(batch))
+                overflow = len(batch) + len(self._pending) - self.max_pending
+                if overflow > 0:
+                    self.dropped += overflow
+                    batch = batch[overflow:]
+                self._pending = batch + self._pending
+
+    async def _flush_loop(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "rooms_cached": len(self._rooms),
+            "rooms_loading": len(self._loading),
+            "rooms_pinned": len(self._pinned),
+            "pending": len(self._pending),
+            "written": self.written,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+            "replay_hits": self.replay_hits,
+            "replay_misses": self.replay_misses,
+        }
+
+    async def close(self):
+        """Зупиняє фонову задачу й дописує все, що лишилося в буфері."""
+        self._closed = True
+        self._full.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+
+
+def get_chat_history(connection: HTTPConnection) -> ChatHistory:
+    return connection.app.state.chat_history
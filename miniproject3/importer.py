@@ -0,0 +1,259 @@
+import asyncio
+import codecs
+import csv
+import logging
+import os
+import sqlite3
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from starlette.concurrency import run_in_threadpool
+
+from .db import Database
+from .facets import add_inserted as add_inserted_facets
+from .storage import DIGEST_RE, ImageStorage, digest_from_path
+
+
+class AdImportRow(BaseModel):
+    title: str = Field(min_length=1)
+    description: str
+    price: float = Field(ge=0)
+    category: str = Field(min_length=1)
+    image_path: Optional[str] = None
+    image_hash: Optional[str] = None
+
+    @model_validator(mode="after")
+    def image_reference(self):
+        if (self.image_path is None) == (self.image_hash is None):
+            raise ValueError("Exactly one of image_path or image_hash is required")
+        if self.image_hash is not None and not DIGEST_RE.match(self.image_hash):
+            raise ValueError("image_hash must be a sha256 hex digest")
+        return self
+
+
+CSV_FIELDS = tuple(AdImportRow.model_fields)
+logger = logging.getLogger(__name__)
+
+
+class BadHeader(ValueError):
+    pass
+
+
+def parse_csv_header(raw: str) -> List[str]:
+    header = [name.strip() for name in next(csv.reader([raw]))]
+    unknown = set(header) - set(CSV_FIELDS)
+    missing = {"title", "description", "price", "category"} - set(header)
+    if unknown or missing:
+        raise BadHeader(f"Bad CSV header: unknown {sorted(unknown)}, missing {sorted(missing)}")
+    return header
+
+
+@dataclass
+class ImportReport:
+    inserted: int = 0
+    failed: int = 0
+    batches: int = 0
+    errors: List[dict] = field(default_factory=list)
+    max_errors: int = 1000
+
+    def add(self, inserted: int, errors: List[Tuple[int, str]]):
+        self.inserted += inserted
+        self.failed += len(errors)
+        self.batches += 1
+        for line, message in errors[:self.max_errors - len(self.errors)]:
+            self.errors.append({"line": line, "error": message})
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Рядки з потоку байтів без буферизації всього тіла (роздільник `\\n` зберігається)."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    tail = ""
+    async for chunk in stream:
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line + "\n"
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Склеює рядки CSV, поки лапки не збалансовані (поле з переносом рядка)."""
+    record = ""
+    async for line in lines:
+        record += line
+        if record.count('"') % 2 == 0:
+            yield record
+            record = ""
+    if record:
+        yield record
+
+
+def _first_error(exc: ValidationError) -> str:
+    return exc.errors(include_url=False, include_input=False)[0]["msg"]
+
+
+def parse_batch(
+    lines: List[Tuple[int, str]], fmt: str, header: Optional[List[str]]
+) -> Tuple[List[Tuple[int, AdImportRow]], List[Tuple[int, str]]]:
+    """Перевіряє сирі рядки пакета; повертає валідні рядки та помилки `(line, message)`."""
+    rows = []
+    errors = []
+    for line_no, raw in lines:
+        try:
+            if fmt == "ndjson":
+                row = AdImportRow.model_validate_json(raw)
+            else:
+                values = next(csv.reader([raw]))
+                if len(values) != len(header):
+                    errors.append((line_no, f"Expected {len(header)} columns, got {len(values)}"))
+                    continue
+                row = AdImportRow.model_validate(
+                    {key: value for key, value in zip(header, values) if value != ""}
+                )
+        except ValidationError as exc:
+            errors.append((line_no, _first_error(exc)))
+            continue
+        except csv.Error as exc:
+            errors.append((line_no, f"Invalid CSV: {exc}"))
+            continue
+        rows.append((line_no, row))
+    return rows, errors
+
+
+def insert_batch(
+    conn: sqlite3.Connection,
+    storage: ImageStorage,
+    rows: List[Tuple[int, AdImportRow]],
+) -> Tuple[int, List[Tuple[int, str]]]:
+    """Вставляє перевірені рядки пакета одним executemany в окремій транзакції.
+
+    Поки в транзакції є рядок в `ads_bulk_load`, тригери FTS та фасетів
+    пропускаються, а індекс і агрегати оновлюються для всього пакета двома
+    запитами - це в рази швидше за построкові тригери. Інші з'єднання цього
+    рядка не бачать. Повертає кількість вставлених рядків та помилки посилань
+    на зображення.
+
+    `image_path` на файл сховища зводиться до його хешу й рахується в
+    `images.refcount` так само, як `image_hash`, інакше `discard()` іншого
+    завантаження міг би видалити файл, на який посилаються імпортовані.
+    Хеші перевіряються в тій самій транзакції `BEGIN IMMEDIATE`, що й
+    збільшує лічильники, тож між перевіркою й вставкою файл не зникне.
+    """
+    errors = []
+    row_digests = {
+        index: row.image_hash if row.image_hash is not None else digest_from_path(row.image_path)
+        for index, (_, row) in enumerate(rows)
+    }
+    hashes = list({digest for digest in row_digests.values() if digest is not None})
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        known = set()
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            known.update(
+                digest for (digest,) in conn.execute(
+                    f"SELECT hash FROM images WHERE hash IN ({', '.join('?' * len(chunk))})", chunk
+                )
+            )
+
+        hash_paths = {digest: storage.path_for(digest) for digest in known}
+        root = os.path.realpath(storage.root) + os.sep
+        values = []
+        references = Counter()
+        for index, (line_no, row) in enumerate(rows):
+            digest = row_digests[index]
+            if row.image_path is not None and (
+                not os.path.realpath(row.image_path).startswith(root) or not os.path.isfile(row.image_path)
+            ):
+                errors.append((line_no, f"image_path must be an existing file in {storage.root}"))
+                continue
+            if digest is not None:
+                image_path = hash_paths.get(digest)
+                if image_path is None:
+                    errors.append((line_no, f"Unknown image {digest}"))
+                    continue
+                references[digest] += 1
+            else:
+                # старі файли з іменем-міткою часу поза таблицею images, discard() їх не видаляє
+                image_path = row.image_path
+            values.append((row.title, row.description, row.price, row.category, image_path))
+
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM ads").fetchone()[0]
+        conn.execute("INSERT INTO ads_bulk_load (active) VALUES (1)")
+        conn.executemany(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            values,
+        )
+        conn.execute("DELETE FROM ads_bulk_load")
+        conn.execute(
+            "INSERT INTO ads_fts (rowid, title, description) "
+            "SELECT id, title, description FROM ads WHERE id >= ?",
+            (first_id,),
+        )
+        add_inserted_facets(conn, first_id)
+        conn.executemany(
+            "UPDATE images SET refcount = refcount + ? WHERE hash = ?",
+            [(count, digest) for digest, count in references.items()],
+        )
+
+    return len(values), errors
+
+
+async def import_stream(
+    records: AsyncIterator[str],
+    fmt: str,
+    db: Database,
+    storage: ImageStorage,
+    batch_size: int,
+    header: Optional[List[str]] = None,
+) -> ImportReport:
+    """Конвеєр імпорту: поки пакет N вставляється в пулі бази, пакет N+1
+    розбирається в іншому потоці, а event loop читає наступні рядки.
+    """
+    report = ImportReport()
+    pending: Optional[asyncio.Future] = None
+    parse_errors: List[Tuple[int, str]] = []
+    batch = []
+    # фізичний рядок, з якого починається наступний запис (запис CSV може мати кілька рядків)
+    line_no = 1
+
+    async def flush(batch):
+        nonlocal pending
+        rows, errors = await run_in_threadpool(parse_batch, batch, fmt, header)
+        parse_errors.extend(errors)
+        if pending is not None:
+            report.add(*await pending)
+        pending = asyncio.ensure_future(db.run(insert_batch, storage, rows))
+        logger.info("Import: %d rows inserted, %d failed", report.inserted, report.failed + len(parse_errors))
+
+    try:
+        async for raw in records:
+            record_line = line_no
+            line_no += raw.count("\n")
+            if not raw.strip():
+                continue
+            if fmt == "csv" and header is None:
+                header = parse_csv_header(raw)
+                continue
+            batch.append((record_line, raw))
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+    finally:
+        if pending is not None:
+            await asyncio.wait([pending])
+    if pending is not None:
+        report.add(*pending.result())
+
+    report.failed += len(parse_errors)
+    for line, message in parse_errors[:report.max_errors - len(report.errors)]:
+        report.errors.append({"line": line, "error": message})
+    report.errors.sort(key=lambda error: error["line"])
+    return report
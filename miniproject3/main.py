@@ -1,26 +1,38 @@
-import os
-import sqlite3 
+import logging
+import time
 
 from fastapi import (
-	Query, HTTPException, UploadFile, Form, 
-    File, WebSocket, WebSocketDisconnect, status, Depends, Request
-)
-from fastapi.security import (
-    OAuth2PasswordBearer,
+	Query, HTTPException, UploadFile, Form, Path,
+    File, WebSocket, WebSocketDisconnect, status, Depends, Request, Response
 )
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
-from .auth import router as auth_router
-from .config import app
+from typing import Dict, List, Literal, Optional
+from .auth import current_user, router as auth_router
+from .chat import ChatHub, get_chat_hub
+from .config import EXPORT_CHUNK_SIZE, SEARCH_MAX_CANDIDATES, THUMBNAIL_SIZES, TRUSTED_JSON_RESPONSES, app
+from .cache import QueryCache, get_list_cache
+from .db import Database, get_db
+from .export import EXPORT_FORMATS, export_stream
+from .facets import read_facets
+from .history import ChatHistory, get_chat_history
+from .importer import BadHeader, import_stream, iter_csv_records, iter_lines
+from .passwords import PasswordHasher, get_hasher
+from .ratelimit import LoginLimiter, get_login_limiter
+from .responses import ListSerializer, trusted_json
+from .rooms import RoomRegistry, get_room_registry
+from .storage import ImageStorage, digest_from_path, get_storage
+from .thumbnails import FORMATS, ThumbnailPipeline, get_thumbnails, variant_path
+from .tokens import TokenClaims, TokenSigner, get_token_signer
+from .queries import (
+    InvalidCursor, build_ads_query, build_highlight_query, build_search_query,
+    fts_match_expression, next_cursor,
+)
 
 
 app.include_router(auth_router)
-DB_NAME = "ads.db"
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+logger = logging.getLogger(__name__)
 templates = Jinja2Templates(directory="miniproject3/templates")
 
 
@@ -30,6 +42,28 @@ class Ad(BaseModel):
     description: str
     price: float
     category: str
+    image_url: Optional[str] = None
+    thumbnails: Dict[str, str] = {}
+
+class SearchHit(Ad):
+    score: float
+    title_highlight: str
+    snippet: str
+
+AD_LIST = ListSerializer(Ad, TRUSTED_JSON_RESPONSES)
+SEARCH_HITS = ListSerializer(SearchHit, TRUSTED_JSON_RESPONSES)
+
+AD_COLUMNS = {"id": 0, "price": 3}
+SEARCH_COLUMNS = {"id": 0, "score": 6, "window_end": 7}
+
+def image_urls(image_path: str) -> dict:
+    digest = digest_from_path(image_path)
+    if digest is None:
+        return {"image_url": None, "thumbnails": {}}
+    return {
+        "image_url": f"/images/{digest}/original",
+        "thumbnails": {size: f"/images/{digest}/{size}" for size in THUMBNAIL_SIZES},
+    }
 
 def ad_row_to_dict(row) -> dict:
     return {
@@ -38,6 +72,7 @@ def ad_row_to_dict(row) -> dict:
         "description": row[2],
         "price": row[3],
         "category": row[4],
+        **image_urls(row[5]),
     }
 
 @app.get(
@@ -46,48 +81,216 @@ def ad_row_to_dict(row) -> dict:
     summary="Список оголошень з фільтрами",
     description=(
         "Повертає список оголошень з можливістю фільтрації за категорією, "
-        "мінімальною та максимальною ціною з підтримкою пагінації."
+        "мінімальною та максимальною ціною з підтримкою пагінації. "
+        "Для глибоких сторінок передавайте `cursor` із заголовка `X-Next-Cursor` "
+        "замість `offset`."
     ),
     tags=["Оголошення"],
     responses={
-        200: {"description": "Успішне повернення списку оголошень"},
+        200: {
+            "description": "Успішне повернення списку оголошень",
+            "headers": {
+                "X-Next-Cursor": {
+                    "description": "Курсор наступної сторінки, відсутній на останній",
+                    "schema": {"type": "string"},
+                }
+            },
+        },
         400: {"description": "Невірні параметри запиту"},
     }
 )
-def list_ads(
+async def list_ads(
     category: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     limit: int = Query(10, ge=1),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор з заголовка X-Next-Cursor попередньої сторінки"),
+    sort: Literal["id", "price"] = "id",
+    db: Database = Depends(get_db),
+    cache: QueryCache = Depends(get_list_cache),
+):
+	if cursor is not None and offset:
+		raise HTTPException(status_code=400, detail="Use either cursor or offset, not both")
+
+	cache_key = (
+		category or None,
+		None if min_price is None else float(min_price),
+		None if max_price is None else float(max_price),
+		limit, offset, cursor, sort,
+	)
+	generation, cached = cache.get(cache_key)
+	if cached is not None:
+		body, next_page = cached
+		headers = {"X-Cache": "HIT"}
+	else:
+		try:
+			query, params = build_ads_query(
+				category, min_price, max_price, limit, offset, cursor, sort
+			)
+		except InvalidCursor as exc:
+			raise HTTPException(status_code=400, detail=str(exc))
+
+		rows = await db.fetchall(query, params)
+		next_page = next_cursor(rows, limit, sort, AD_COLUMNS)
+		body = AD_LIST.dumps([ad_row_to_dict(row) for row in rows])
+		cache.put(generation, cache_key, (body, next_page), len(body) + 200)
+		headers = {"X-Cache": "MISS"}
+
+	if next_page is not None:
+		headers["X-Next-Cursor"] = next_page
+
+	return trusted_json(body, headers)
+
+def _search_ads(conn, match: str, filters: dict, limit: int, cursor: Optional[str], max_candidates: int):
+    window_end = None
+    if cursor is None:
+        window_end = conn.execute("SELECT MAX(id) FROM ads").fetchone()[0]
+
+    query, params = build_search_query(
+        match, limit=limit, cursor=cursor, window_end=window_end, max_candidates=max_candidates, **filters
+    )
+    rows = conn.execute(query, params).fetchall()
+    if not rows:
+        return rows, {}
+    highlight_query, highlight_params = build_highlight_query(match, [row[0] for row in rows])
+    highlights = {
+        row[0]: (row[1], row[2])
+        for row in conn.execute(highlight_query, highlight_params)
+    }
+    return rows, highlights
+
+@app.get(
+    "/search/",
+    response_model=List[SearchHit],
+    summary="Повнотекстовий пошук оголошень",
+    description=(
+        "Шукає оголошення за словами в заголовку та описі (FTS5), сортує за "
+        "релевантністю BM25 і повертає підсвічені фрагменти. Підтримує ті самі "
+        "фільтри, що й `/filters/`, та курсорну пагінацію через `X-Next-Cursor`. "
+        "Слово з `*` у кінці шукається як префікс. За релевантністю "
+        "впорядковуються лише найновіші `SEARCH_MAX_CANDIDATES` збігів, що пройшли фільтри."
+    ),
+    tags=["Оголошення"],
+    responses={
+        200: {
+            "description": "Знайдені оголошення, найрелевантніші першими",
+            "headers": {
+                "X-Next-Cursor": {
+                    "description": "Курсор наступної сторінки, відсутній на останній",
+                    "schema": {"type": "string"},
+                }
+            },
+        },
+        400: {"description": "Порожній запит або невірний курсор"},
+    }
+)
+async def search_ads(
+    q: str = Query(..., min_length=1, max_length=200, description="Пошуковий запит"),
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Database = Depends(get_db),
+):
+    match = fts_match_expression(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="Empty search query")
+
+    filters = {"category": category, "min_price": min_price, "max_price": max_price}
+    try:
+        rows, highlights = await db.run(_search_ads, match, filters, limit, cursor, SEARCH_MAX_CANDIDATES)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    next_page = next_cursor(rows, limit, "relevance", SEARCH_COLUMNS)
+    hits = []
+    for row in rows:
+        title_highlight, snippet = highlights.get(row[0], (row[1], ""))
+        hits.append({
+            **ad_row_to_dict(row),
+            "score": row[6],
+            "title_highlight": title_highlight,
+            "snippet": snippet,
+        })
+    return trusted_json(SEARCH_HITS.dumps(hits), None if next_page is None else {"X-Next-Cursor": next_page})
+
+class CategoryCount(BaseModel):
+    category: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min_price: Optional[float]
+    max_price: Optional[float]
+    count: int
+
+class Facets(BaseModel):
+    total: int
+    categories: List[CategoryCount]
+    price_histogram: List[PriceBucket]
+
+@app.get(
+    "/facets/",
+    response_model=Facets,
+    summary="Фасети для фільтрів оголошень",
+    description=(
+        "Кількість оголошень за категоріями та гістограма цін з фіксованими "
+        "діапазонами. Читається з агрегатів, які ведуть тригери, тому час "
+        "відповіді залежить лише від кількості категорій. З `category` "
+        "гістограма рахується лише для цієї категорії."
+    ),
+    tags=["Оголошення"],
+    status_code=status.HTTP_200_OK,
+)
+async def get_facets(
+    category: Optional[str] = None,
+    db: Database = Depends(get_db),
 ):
-	conditions = []
-	params = []
-
-	if category:
-		conditions.append("category = ?")
-		params.append(category)
-	if min_price is not None:
-		conditions.append("price >= ?")
-		params.append(min_price)
-	if max_price is not None:
-		conditions.append("price <= ?")
-		params.append(max_price)
-
-	query = "SELECT * FROM ads"
-	if conditions:
-		query += " WHERE " + " AND ".join(conditions)
-
-	query += " LIMIT ? OFFSET ?"
-	params.extend([limit, offset])
-	
-	conn = sqlite3.connect(DB_NAME)
-	cursor = conn.cursor()
-	cursor.execute(query, params)
-	rows = cursor.fetchall()
-	conn.close()
-		
-	return [ad_row_to_dict(row) for row in rows]
+    return await db.run(read_facets, category)
+
+@app.get(
+    "/export/",
+    response_class=StreamingResponse,
+    summary="Експорт оголошень",
+    description=(
+        "Потоково вивантажує всі оголошення з тими ж фільтрами, що й `/filters/`, "
+        "у форматі NDJSON, CSV або JSON-масиву. Рядки читаються частинами, тож "
+        "пам'ять сервера не залежить від розміру вивантаження. З `gzip=true` "
+        "відповідь стискається і віддається як `application/gzip`."
+    ),
+    tags=["Оголошення"],
+    responses={
+        200: {
+            "description": "Файл вивантаження",
+            "content": {
+                "application/x-ndjson": {},
+                "text/csv": {},
+                "application/json": {},
+                "application/gzip": {},
+            },
+        },
+    },
+)
+async def export_ads(
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    format: Literal["ndjson", "csv", "json"] = "ndjson",
+    gzip: bool = False,
+    db: Database = Depends(get_db),
+):
+    filename = f"ads.{format}"
+    media_type = EXPORT_FORMATS[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        export_stream(db, format, category, min_price, max_price, EXPORT_CHUNK_SIZE, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @app.post(
     "/create/",
@@ -99,6 +302,7 @@ def list_ads(
         201: {"description": "Оголошення успішно створено"},
         400: {"description": "Некоректне зображення або дані"},
         401: {"description": "Неавторизований доступ"},
+        413: {"description": "Зображення перевищує MAX_UPLOAD_BYTES"},
     }
 )
 async def create_ad(
@@ -107,28 +311,33 @@ async def create_ad(
     price: float = Form(...),
     category: str = Form(...),
     image: UploadFile = File(...),
-    token: str = Depends(oauth2_scheme)
+    user: TokenClaims = Depends(current_user),
+    db: Database = Depends(get_db),
+    storage: ImageStorage = Depends(get_storage),
+    thumbnails: ThumbnailPipeline = Depends(get_thumbnails),
+    cache: QueryCache = Depends(get_list_cache),
 ):
     if not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Файл має бути зображенням")
 
-    timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    filename = f"{timestamp}_{image.filename}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
+    stored = await storage.save(image)
+    file_path = stored.path
 
-    with open(file_path, "wb") as buffer:
-        content = await image.read()
-        buffer.write(content)
+    def _insert_ad(conn):
+        with conn:
+            return conn.execute(
+                "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+                (title, description, price, category, file_path)
+            ).lastrowid
 
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
-        (title, description, price, category, file_path)
-    )
-    conn.commit()
-    ad_id = cursor.lastrowid
-    conn.close()
+    try:
+        ad_id = await db.run(_insert_ad)
+    except Exception:
+        # посилання взяте ще в save, без оголошення його треба віддати
+        await db.run(storage.discard, stored)
+        raise
+    cache.invalidate()
+    thumbnails.submit(stored.digest, stored.path)
 
     return {
         "id": ad_id,
@@ -137,7 +346,199 @@ async def create_ad(
         "price": price,
         "category": category,
         "image_path": file_path,
+        **image_urls(file_path),
+    }
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportResult(BaseModel):
+    inserted: int
+    failed: int
+    batches: int
+    errors: List[ImportRowError]
+    elapsed_seconds: float
+    rows_per_second: float
+
+IMPORT_CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json-lines": "ndjson",
+    "text/csv": "csv",
+}
+
+@app.post(
+    "/import/",
+    response_model=ImportResult,
+    summary="Масовий імпорт оголошень",
+    description=(
+        "Потоково читає тіло запиту у форматі NDJSON (один JSON-об'єкт на рядок) "
+        "або CSV із заголовком і вставляє оголошення пакетами по `batch_size` "
+        "рядків, кожен пакет в окремій транзакції. Зображення вказуються через "
+        "`image_hash` (вже завантажене зображення) або `image_path` (файл у "
+        "каталозі завантажень). Некоректні рядки пропускаються і повертаються "
+        "в `errors` з номером фізичного рядка, з якого починається запис, решта "
+        "пакета вставляється. "
+        "Потрібна аутентифікація через токен."
+    ),
+    tags=["Оголошення"],
+    status_code=status.HTTP_200_OK,
+    responses={
+        200: {"description": "Імпорт завершено, див. `inserted` та `errors`"},
+        400: {"description": "Невідомий формат або некоректний заголовок CSV"},
+        401: {"description": "Неавторизований доступ"},
     }
+)
+async def import_ads(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = Query(None, description="Формат тіла, якщо Content-Type його не визначає"),
+    batch_size: int = Query(5000, ge=1, le=50000),
+    user: TokenClaims = Depends(current_user),
+    db: Database = Depends(get_db),
+    storage: ImageStorage = Depends(get_storage),
+    cache: QueryCache = Depends(get_list_cache),
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = format or IMPORT_CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Use an NDJSON or CSV content type or the format parameter")
+
+    started = time.perf_counter()
+    records = iter_lines(request.stream())
+    if fmt == "csv":
+        records = iter_csv_records(records)
+
+    try:
+        report = await import_stream(records, fmt, db, storage, batch_size)
+    except BadHeader as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        # Навіть перерваний імпорт міг закомітити частину пакетів
+        cache.invalidate()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "inserted": report.inserted,
+        "failed": report.failed,
+        "batches": report.batches,
+        "errors": report.errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(report.inserted / elapsed, 1) if elapsed else 0.0,
+    }
+
+@app.get(
+    "/images/{digest}/{size}",
+    summary="Зображення оголошення",
+    description=(
+        "Віддає оригінал (`original`) або мініатюру заданого розміру. Мініатюри "
+        "віддаються у WebP, якщо клієнт його приймає, інакше в JPEG; поки "
+        "мініатюра ще генерується, віддається оригінал. Підтримуються `ETag` "
+        "та запити діапазонів (`Range`)."
+    ),
+    tags=["Оголошення"],
+    response_class=FileResponse,
+    responses={
+        200: {"description": "Вміст зображення"},
+        206: {"description": "Частина зображення за заголовком Range"},
+        304: {"description": "Зображення не змінилося"},
+        404: {"description": "Зображення або розмір не знайдено"},
+    }
+)
+async def get_image(
+    request: Request,
+    digest: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    size: str = Path(...),
+    db: Database = Depends(get_db),
+    storage: ImageStorage = Depends(get_storage),
+    thumbnails: ThumbnailPipeline = Depends(get_thumbnails),
+):
+    if size != "original" and size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=404, detail="Unknown image size")
+
+    image = await db.fetchone("SELECT path, content_type FROM images WHERE hash = ?", (digest,))
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path, media_type = image
+    cache_control = "public, max-age=31536000, immutable"
+    variant = "original"
+
+    if size != "original":
+        ext = "webp" if "image/webp" in request.headers.get("accept", "") else "jpg"
+        if await thumbnails.is_ready(digest):
+            path, media_type, variant = variant_path(storage.root, digest, size, ext), FORMATS[ext][1], f"{size}.{ext}"
+        else:
+            cache_control = "no-cache"
+
+    etag = f'"{digest[:16]}-{variant}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@app.get(
+    "/metrics/db",
+    summary="Метрики пулу з'єднань",
+    description="Кількість видач з'єднань, очікування на вільне з'єднання та завантаженість пулу.",
+    tags=["Діагностика"],
+    status_code=status.HTTP_200_OK,
+)
+async def db_metrics(db: Database = Depends(get_db)):
+    return db.metrics()
+
+@app.get(
+    "/metrics/cache",
+    summary="Метрики кешу списку оголошень",
+    description="Частка влучань, кількість записів, зайнята пам'ять та поточне покоління даних кешу `/filters/`.",
+    tags=["Діагностика"],
+    status_code=status.HTTP_200_OK,
+)
+async def cache_metrics(cache: QueryCache = Depends(get_list_cache)):
+    return cache.metrics()
+
+@app.get(
+    "/metrics/passwords",
+    summary="Метрики хешування паролів",
+    description=(
+        "Глибина черги, кількість відмов та затримки bcrypt у пулі хешування паролів, "
+        "результат калібрування вартості bcrypt при старті та кількість перехешованих паролів."
+    ),
+    tags=["Діагностика"],
+    status_code=status.HTTP_200_OK,
+)
+async def password_metrics(hasher: PasswordHasher = Depends(get_hasher)):
+    return hasher.metrics()
+
+@app.get(
+    "/metrics/tokens",
+    summary="Метрики перевірки токенів",
+    description="Влучання та промахи кешу перевірених токенів доступу і кількість відхилених токенів.",
+    tags=["Діагностика"],
+    status_code=status.HTTP_200_OK,
+)
+async def token_metrics(tokens: TokenSigner = Depends(get_token_signer)):
+    return tokens.metrics()
+
+@app.get(
+    "/metrics/login-limiter",
+    summary="Метрики обмеження спроб входу",
+    description="Кількість відстежуваних ключів, дозволених і відхилених спроб входу окремо для облікових записів та IP.",
+    tags=["Діагностика"],
+    status_code=status.HTTP_200_OK,
+)
+async def login_limiter_metrics(limiter: LoginLimiter = Depends(get_login_limiter)):
+    return limiter.metrics()
+
+@app.get(
+    "/metrics/chat",
+    summary="Метрики WebSocket чату",
+    description="Кімнати, клієнти, заповненість вихідних черг, викинуті повідомлення, відключені повільні клієнти та запис історії.",
+    tags=["Діагностика"],
+    status_code=status.HTTP_200_OK,
+)
+async def chat_metrics(hub: ChatHub = Depends(get_chat_hub)):
+    return hub.metrics()
 
 @app.get(
     "/chat/",
@@ -149,37 +550,31 @@ async def create_ad(
 async def get_chat(request: Request):
     return templates.TemplateResponse("chat.html", {"request": request})
 
-def ensure_room_exists(room_name: str):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM rooms WHERE name = ?", (room_name,))
-        if cursor.fetchone() is None:
-            cursor.execute("INSERT INTO rooms (name) VALUES (?)", (room_name,))
-            conn.commit()
-
-connections = {}
-
 @app.websocket(
     "/ws/{room}"
 )
-async def websocket_endpoint(websocket: WebSocket, room: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    room: str,
+    batch: bool = False,
+    hub: ChatHub = Depends(get_chat_hub),
+    history: ChatHistory = Depends(get_chat_history),
+    rooms: RoomRegistry = Depends(get_room_registry),
+):
     await websocket.accept()
 
-    ensure_room_exists(room)
-
-    if room not in connections:
-        connections[room] = []
-
-    connections[room].append(websocket)
+    rooms.ensure(room)
 
+    # між отриманням історії та join немає await, тож нові повідомлення
+    # не загубляться й не повторяться
+    replay = await history.recent(room)
+    client = hub.join(room, websocket, replay, batched=batch)
     try:
         while True:
             data = await websocket.receive_text()
-
-            for client in connections[room]:
-                await client.send_text(data)
+            hub.broadcast(room, data)
 
     except WebSocketDisconnect:
-        connections[room].remove(websocket)
-        if not connections[room]:
-            del connections[room]
\ No newline at end of file
+        pass
+    finally:
+        await hub.leave(room, client)
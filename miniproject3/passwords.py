@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import bcrypt
+
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+
+
+def hash_password(password: str, rounds: int = 12) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def hash_rounds(hashed_password: str) -> int:
+    """Вартість з хешу bcrypt `$2b$12$...`."""
+    return int(hashed_password.split("$")[2])
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int = 10, max_rounds: int = 16) -> dict:
+    """Найбільша вартість bcrypt, що вкладається в `target_ms` на цій машині.
+
+    Кожен +1 до вартості подвоює час, тож вимірювання йде вгору від
+    `min_rounds`, поки наступний крок за оцінкою ще вкладається в ціль.
+    Нижче `min_rounds` вартість не опускається, навіть якщо ціль недосяжна.
+    """
+    measurements = {}
+    password = b"calibration-password"
+
+    def measure(rounds: int, samples: int) -> float:
+        best = float("inf")
+        for _ in range(samples):
+            started = time.perf_counter()
+            bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+            best = min(best, time.perf_counter() - started)
+        measurements[rounds] = round(best * 1000, 1)
+        return best * 1000
+
+    rounds = min_rounds
+    elapsed = measure(rounds, samples=2)
+    while rounds < max_rounds and elapsed * 2 <= target_ms:
+        rounds += 1
+        elapsed = measure(rounds, samples=1)
+    if elapsed > target_ms and rounds > min_rounds:
+        rounds -= 1
+        elapsed = measurements[rounds]
+
+    return {
+        "rounds": rounds,
+        "target_ms": target_ms,
+        "hash_ms": round(elapsed, 1),
+        "within_target": elapsed <= target_ms,
+        "measured_ms": measurements,
+        "min_rounds": min_rounds,
+        "max_rounds": max_rounds,
+    }
+
+
+class HasherOverloaded(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail="Сервіс перевірки паролів перевантажений, спробуйте пізніше",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class PasswordHasher:
+    """bcrypt в окремому обмеженому пулі потоків.
+
+    Одночасно виконується не більше `workers` хешувань (bcrypt відпускає GIL,
+    тож event loop і пул бази працюють далі). Решта запитів чекає в черзі
+    довжиною до `max_queue` не довше `queue_timeout` секунд; переповнення або
+    тайм-аут черги дає 503 з Retry-After замість накопичення запитів.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 64, queue_timeout: float = 5.0, rounds: int = 12):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(workers)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._queued_max = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._latencies = deque(maxlen=1024)
+        self._waits = deque(maxlen=1024)
+        self.calibration: Optional[dict] = None
+        self.rehashed = 0
+
+    def calibrate(self, target_ms: float, min_rounds: int = 10, max_rounds: int = 16) -> dict:
+        """Підбирає `rounds` під ціль затримки; викликається при старті."""
+        self.calibration = calibrate_rounds(target_ms, min_rounds, max_rounds)
+        self.calibration["calibrated_at"] = time.time()
+        self.rounds = self.calibration["rounds"]
+        return self.calibration
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Хеш слабший за поточну вартість або більш ніж удвічі дорожчий за неї."""
+        rounds = hash_rounds(hashed_password)
+        return rounds < self.rounds or rounds > self.rounds + 1
+
+    async def _submit(self, fn: Callable, *args):
+        if self._slots.locked() and self._queued >= self.max_queue:
+            self._rejected += 1
+            raise HasherOverloaded(retry_after=max(1, round(self.queue_timeout)))
+
+        started = time.perf_counter()
+        self._queued += 1
+        self._queued_max = max(self._queued_max, self._queued)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise HasherOverloaded(retry_after=max(1, round(self.queue_timeout)))
+        finally:
+            self._queued -= 1
+
+        waited = time.perf_counter() - started
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            hashed_at = time.perf_counter()
+            result = await loop.run_in_executor(self._executor, fn, *args)
+            with self._lock:
+                self._latencies.append(time.perf_counter() - hashed_at)
+                self._waits.append(waited)
+                self._completed += 1
+            return result
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(verify_password, password, hashed_password)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            waits = sorted(self._waits)
+
+        def percentile(values, fraction):
+            if not values:
+                return 0.0
+            return round(values[min(len(values) - 1, int(len(values) * fraction))] * 1000, 2)
+
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "calibration": self.calibration,
+            "rehashed": self.rehashed,
+            "in_flight": self._in_flight,
+            "queue_depth": self._queued,
+            "queue_depth_max": self._queued_max,
+            "max_queue": self.max_queue,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "queue_timeouts": self._timeouts,
+            "hash_ms_p50": percentile(latencies, 0.5),
+            "hash_ms_p99": percentile(latencies, 0.99),
+            "queue_wait_ms_p50": percentile(waits, 0.5),
+            "queue_wait_ms_p99": percentile(waits, 0.99),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_hasher(connection: HTTPConnection) -> PasswordHasher:
+    return connection.app.state.hasher
@@ -0,0 +1,190 @@
+import base64
+import json
+from typing import List, Optional, Tuple
+
+
+SORT_KEYS = {
+    "id": ("id",),
+    "price": ("price", "id"),
+    # window_end - найбільший id на момент першої сторінки, незмінний між сторінками
+    "relevance": ("score", "id", "window_end"),
+}
+# Заголовок важить уп'ятеро більше за опис.
+BM25 = "bm25(ads_fts, 5.0, 1.0)"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: str, row_values: Tuple) -> str:
+    payload = json.dumps({"s": sort, "k": list(row_values)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        keys = tuple(payload["k"])
+        cursor_sort = payload["s"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+
+    if cursor_sort != sort or len(keys) != len(SORT_KEYS[sort]):
+        raise InvalidCursor("Cursor does not match sort order")
+    return keys
+
+
+def next_cursor(rows: list, limit: int, sort: str, columns: dict) -> Optional[str]:
+    """Курсор наступної сторінки або None, якщо сторінка остання.
+
+    `columns` відображає назву колонки на її індекс у рядку результату.
+    """
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(sort, tuple(last[columns[key]] for key in SORT_KEYS[sort]))
+
+
+def build_filters(
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    prefix: str = "",
+) -> Tuple[List[str], list]:
+    conditions = []
+    params = []
+
+    if category:
+        conditions.append(f"{prefix}category = ?")
+        params.append(category)
+    if min_price is not None:
+        conditions.append(f"{prefix}price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append(f"{prefix}price <= ?")
+        params.append(max_price)
+
+    return conditions, params
+
+
+def fts_match_expression(text: str) -> str:
+    """Перетворює введений користувачем текст на безпечний вираз FTS5 MATCH.
+
+    Кожне слово береться в лапки (синтаксис FTS5 не інтерпретується), слова
+    об'єднуються через AND, а `*` в кінці слова залишається як пошук за префіксом.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def build_search_query(
+    match: str,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    window_end: Optional[int] = None,
+    max_candidates: int = 500,
+) -> Tuple[str, list]:
+    """SELECT id, title, description, price, category, image_path, score, window_end.
+
+    Збіги FTS5 з'єднуються з `ads` у підзапиті, тож фільтри відсіюють рядки
+    ще до ранжування; FTS5 обходить список документів від кінця й зупиняється
+    на `max_candidates` найновіших збігах, що пройшли фільтри, і BM25
+    рахується лише для них. Робота на сторінку обмежена цим числом, а не
+    кількістю збігів; ціна - старіші збіги поза вікном не потрапляють у
+    видачу. Сторінка вибирається keyset-умовою по `(score, id)`; межа
+    `rowid <= window_end` переноситься в курсорі, щоб оголошення, додані
+    після першої сторінки, не зсували вікно кандидатів. Підсвітка рахується
+    окремим запитом лише для рядків сторінки (`build_highlight_query`).
+    """
+    if cursor is not None:
+        score, ad_id, window_end = decode_cursor(cursor, "relevance")
+
+    conditions, params = build_filters(category, min_price, max_price, prefix="a.")
+    conditions.insert(0, "ads_fts MATCH ?")
+    params.insert(0, match)
+    if window_end is not None:
+        conditions.append("ads_fts.rowid <= ?")
+        params.append(window_end)
+
+    candidates = (
+        "SELECT a.id, a.title, a.description, a.price, a.category, a.image_path, "
+        f"{BM25} AS score "
+        "FROM ads_fts JOIN ads a ON a.id = ads_fts.rowid "
+        "WHERE " + " AND ".join(conditions) + " ORDER BY ads_fts.rowid DESC LIMIT ?"
+    )
+    params.append(max_candidates)
+    query = f"SELECT c.*, ? AS window_end FROM ({candidates}) AS c"
+    params.insert(0, window_end)
+    if cursor is not None:
+        query += " WHERE (c.score, c.id) > (?, ?)"
+        params.extend([score, ad_id])
+    query += " ORDER BY c.score, c.id LIMIT ?"
+    params.append(limit)
+    return query, params
+
+
+def build_highlight_query(match: str, ids: List[int]) -> Tuple[str, list]:
+    """Підсвітка для рядків сторінки одним проходом по діапазону rowid.
+
+    `rowid IN (...)` FTS5 виконує як окремий пошук на кожен id, і для
+    префіксного запиту щоразу заново зливає списки всіх слів з префіксом;
+    `+rowid` не дає FTS5 взяти IN собі, тож він лише фільтрує діапазон.
+    """
+    query = (
+        "SELECT rowid, highlight(ads_fts, 0, '<mark>', '</mark>'), "
+        "snippet(ads_fts, 1, '<mark>', '</mark>', '…', 24) "
+        "FROM ads_fts WHERE ads_fts MATCH ? AND rowid BETWEEN ? AND ? "
+        f"AND +rowid IN ({', '.join('?' * len(ids))})"
+    )
+    return query, [match, min(ids), max(ids), *ids]
+
+
+def build_ads_query(
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = 10,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    columns: str = "*",
+) -> Tuple[str, list]:
+    """Будує SELECT по `ads` з фільтрами та пагінацією.
+
+    З курсором використовується keyset-умова `(price, id) > (?, ?)`, яку SQLite
+    обслуговує індексами з `init_db`, тож глибокі сторінки не сканують
+    пропущені рядки, на відміну від OFFSET.
+    """
+    conditions, params = build_filters(category, min_price, max_price)
+    keys = SORT_KEYS[sort]
+
+    if cursor is not None:
+        values = decode_cursor(cursor, sort)
+        if len(keys) == 1:
+            conditions.append(f"{keys[0]} > ?")
+        else:
+            conditions.append(f"({', '.join(keys)}) > ({', '.join('?' * len(keys))})")
+        params.extend(values)
+
+    query = f"SELECT {columns} FROM ads"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY " + ", ".join(keys)
+    query += " LIMIT ?"
+    params.append(limit)
+    if cursor is None and offset:
+        query += " OFFSET ?"
+        params.append(offset)
+
+    return query, params
@@ -0,0 +1,136 @@
+import math
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+
+
+class TooManyAttempts(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail="Забагато спроб входу, спробуйте пізніше",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class _Shard:
+    __slots__ = ("lock", "windows")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [початок поточного вікна, лічильник поточного, лічильник попереднього]
+        self.windows: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+
+
+class SlidingWindowLimiter:
+    """Ковзне вікно з двох лічильників на ключ: O(1) часу та пам'яті на запит.
+
+    Оцінка кількості спроб за останні `window` секунд - поточний лічильник
+    плюс попередній, зважений на частку попереднього вікна, що ще в межах.
+    Ключі розкладені по `shards` незалежних словників зі своїми блокуваннями;
+    у кожному не більше `max_keys // shards` ключів, найдовше не чіпані
+    витісняються першими, тож пам'ять обмежена за будь-якої кількості IP.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100_000, shards: int = 16):
+        self.limit = limit
+        self.window = window
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards = [_Shard() for _ in range(shards)]
+        self.allowed = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    def _shard(self, key: Hashable) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _roll(self, entry: List[float], now: float):
+        elapsed_windows = int((now - entry[0]) // self.window)
+        if elapsed_windows >= 1:
+            entry[2] = entry[1] if elapsed_windows == 1 else 0
+            entry[1] = 0
+            entry[0] += elapsed_windows * self.window
+
+    def _retry_after(self, entry: List[float], now: float) -> Optional[int]:
+        start, current, previous = entry
+        elapsed = now - start
+        if previous * (1 - elapsed / self.window) + current < self.limit:
+            return None
+        if current >= self.limit or previous == 0:
+            wait = start + self.window - now
+        else:
+            # момент, коли вага попереднього вікна впаде достатньо
+            wait = self.window * (1 - (self.limit - current) / previous) - elapsed
+        return max(1, math.ceil(wait))
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> Optional[int]:
+        """Рахує спробу, якщо ліміт дозволяє; інакше повертає Retry-After і не рахує."""
+        now = now if now is not None else time.monotonic()
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.windows.get(key)
+            if entry is None:
+                entry = shard.windows[key] = [now, 0, 0]
+                if len(shard.windows) > self.max_keys_per_shard:
+                    shard.windows.popitem(last=False)
+                    self.evictions += 1
+            else:
+                shard.windows.move_to_end(key)
+                self._roll(entry, now)
+                retry_after = self._retry_after(entry, now)
+                if retry_after is not None:
+                    self.rejected += 1
+                    return retry_after
+            entry[1] += 1
+            self.allowed += 1
+            return None
+
+    def reset(self, key: Hashable):
+        shard = self._shard(key)
+        with shard.lock:
+            shard.windows.pop(key, None)
+
+    def __len__(self) -> int:
+        return sum(len(shard.windows) for shard in self._shards)
+
+    def metrics(self) -> dict:
+        return {
+            "limit": self.limit,
+            "window_seconds": self.window,
+            "keys": len(self),
+            "max_keys": self.max_keys_per_shard * len(self._shards),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evictions": self.evictions,
+        }
+
+
+class LoginLimiter:
+    """Окремі ліміти спроб входу на обліковий запис і на IP клієнта."""
+
+    def __init__(self, per_account: SlidingWindowLimiter, per_ip: SlidingWindowLimiter):
+        self.per_account = per_account
+        self.per_ip = per_ip
+
+    def check(self, account: str, ip: str, now: Optional[float] = None):
+        """Викликати до bcrypt: кидає 429, якщо вичерпано будь-який з лімітів."""
+        # спроба з IP рахується, навіть якщо заблоковано сам обліковий запис,
+        # тож перебір по багатьох акаунтах з однієї адреси теж обмежений
+        retry_after = self.per_ip.hit(ip, now) or self.per_account.hit(account.strip().lower(), now)
+        if retry_after is not None:
+            raise TooManyAttempts(retry_after)
+
+    def succeeded(self, account: str):
+        self.per_account.reset(account.strip().lower())
+
+    def metrics(self) -> dict:
+        return {"account": self.per_account.metrics(), "ip": self.per_ip.metrics()}
+
+
+def get_login_limiter(connection: HTTPConnection) -> LoginLimiter:
+    return connection.app.state.login_limiter
@@ -0,0 +1,128 @@
+"""Довгоживучі refresh-токени з ротацією.
+
+У базі зберігається лише SHA-256 токена (токен - 256 випадкових біт, тож
+повільний хеш не потрібен). Кожен токен одноразовий: `/token/refresh`
+позначає його використаним і видає новий. Повторне пред'явлення вже
+використаного токена вважається крадіжкою, і всі токени користувача
+відкликаються.
+"""
+import asyncio
+import hashlib
+import logging
+import secrets
+import sqlite3
+import time
+
+from typing import Optional, Tuple
+
+from .db import Database
+from .tokens import InvalidToken
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS refresh_tokens (
+        token_hash TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users (id),
+        expires_at INTEGER NOT NULL,
+        used_at INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens (user_id);
+    CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires ON refresh_tokens (expires_at);
+"""
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _insert(conn: sqlite3.Connection, user_id: int, ttl: int, now: int) -> str:
+    token = secrets.token_urlsafe(32)
+    conn.execute(
+        "INSERT INTO refresh_tokens (token_hash, user_id, expires_at) VALUES (?, ?, ?)",
+        (token_digest(token), user_id, now + ttl),
+    )
+    return token
+
+
+def issue(conn: sqlite3.Connection, user_id: int, ttl: int, now: Optional[float] = None) -> str:
+    with conn:
+        return _insert(conn, user_id, ttl, int(now if now is not None else time.time()))
+
+
+def rotate(conn: sqlite3.Connection, token: str, ttl: int, now: Optional[float] = None) -> Tuple[int, str]:
+    """Позначає токен використаним і видає новий; повертає `(user_id, new_token)`.
+
+    Пошук і позначка - один UPDATE за первинним ключем, без bcrypt і без
+    читання `users`.
+    """
+    now = int(now if now is not None else time.time())
+    digest = token_digest(token)
+    reused = False
+    with conn:
+        row = conn.execute(
+            "UPDATE refresh_tokens SET used_at = ? "
+            "WHERE token_hash = ? AND used_at IS NULL AND expires_at > ? RETURNING user_id",
+            (now, digest, now),
+        ).fetchone()
+        if row is not None:
+            return row[0], _insert(conn, row[0], ttl, now)
+
+        stolen = conn.execute(
+            "SELECT user_id FROM refresh_tokens WHERE token_hash = ? AND used_at IS NOT NULL",
+            (digest,),
+        ).fetchone()
+        if stolen is not None:
+            conn.execute("DELETE FROM refresh_tokens WHERE user_id = ?", stolen)
+            reused = True
+
+    if reused:
+        logger.warning("Refresh token reuse for user %s, all sessions revoked", stolen[0])
+        raise InvalidToken("Refresh token reuse detected, all sessions revoked")
+    raise InvalidToken("Invalid or expired refresh token")
+
+
+def revoke(conn: sqlite3.Connection, token: str, everywhere: bool = False) -> int:
+    """Відкликає токен, а з `everywhere` - усі токени його власника."""
+    digest = token_digest(token)
+    with conn:
+        if everywhere:
+            return conn.execute(
+                "DELETE FROM refresh_tokens WHERE user_id = "
+                "(SELECT user_id FROM refresh_tokens WHERE token_hash = ?)",
+                (digest,),
+            ).rowcount
+        return conn.execute("DELETE FROM refresh_tokens WHERE token_hash = ?", (digest,)).rowcount
+
+
+def purge_expired(conn: sqlite3.Connection, batch_size: int, now: Optional[float] = None) -> int:
+    """Видаляє до `batch_size` прострочених токенів однією короткою транзакцією."""
+    with conn:
+        return conn.execute(
+            "DELETE FROM refresh_tokens WHERE token_hash IN "
+            "(SELECT token_hash FROM refresh_tokens WHERE expires_at <= ? LIMIT ?)",
+            (int(now if now is not None else time.time()), batch_size),
+        ).rowcount
+
+
+async def cleanup_expired(db: Database, batch_size: int = 1000) -> int:
+    """Чистить прострочені токени пакетами, віддаючи пул іншим запитам між ними."""
+    purged = 0
+    while True:
+        deleted = await db.run(purge_expired, batch_size)
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+        await asyncio.sleep(0)
+
+
+async def cleanup_loop(db: Database, interval: float, batch_size: int = 1000):
+    while True:
+        try:
+            purged = await cleanup_expired(db, batch_size)
+            if purged:
+                logger.info("Purged %d expired refresh tokens", purged)
+        except Exception:
+            logger.exception("Refresh token cleanup failed")
+        await asyncio.sleep(interval)
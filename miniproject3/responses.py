@@ -0,0 +1,46 @@
+import json
+
+from typing import Any, List, Mapping, Optional, Type
+
+from pydantic import BaseModel, TypeAdapter
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson не встановлено - стандартний json з компактними роздільниками
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def trusted_json(body: bytes, headers: Optional[Mapping[str, str]] = None) -> Response:
+    """Готова JSON-відповідь з уже серіалізованого тіла.
+
+    Повернений `Response` FastAPI віддає як є, без повторної перевірки через
+    `response_model` (схема OpenAPI не змінюється). Лише для рядків, які
+    будуються з бази нашим кодом і вже мають форму моделі.
+    """
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class ListSerializer:
+    """JSON-тіло списку рядків моделі `model` для `trusted_json`.
+
+    За замовчуванням рядки перевіряються і серіалізуються pydantic так само,
+    як це зробив би `response_model`. З `trusted=True` (`TRUSTED_JSON_RESPONSES=1`)
+    перевірка пропускається, а тіло будує `dumps` - лише для рядків, які наш
+    код будує з бази у формі моделі.
+    """
+
+    def __init__(self, model: Type[BaseModel], trusted: bool = False):
+        self.adapter = TypeAdapter(List[model])
+        self.trusted = trusted
+
+    def dumps(self, items: list) -> bytes:
+        if self.trusted:
+            return dumps(items)
+        return self.adapter.dump_json(self.adapter.validate_python(items))
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import sqlite3
+
+from typing import Any, Awaitable, Callable, List, Set
+
+from starlette.requests import HTTPConnection
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_rooms(conn: sqlite3.Connection) -> Set[str]:
+    return {name for name, in conn.execute("SELECT name FROM rooms")}
+
+
+def insert_rooms(conn: sqlite3.Connection, names: List[str]) -> int:
+    with conn:
+        return conn.executemany("INSERT OR IGNORE INTO rooms (name) VALUES (?)", [(name,) for name in names]).rowcount
+
+
+class RoomRegistry:
+    """Множина відомих кімнат у пам'яті з фоновим записом нових у `rooms`.
+
+    Таблиця читається один раз при старті; далі `ensure` на підключенні -
+    лише перевірка множини без бази й без await. Нові назви збирає фонова
+    задача й пише пакетом через `INSERT OR IGNORE`, тож і кілька воркерів, і
+    повторна спроба після помилки запису безпечні.
+
+    `run(fn, *args)` виконує `fn(conn, *args)` поза event loop: у
+    miniproject3 це `Database.run` з пулом з'єднань, у homeworks14 -
+    `config.run_db` з окремим з'єднанням на виклик.
+    """
+
+    def __init__(self, run: Callable[..., Awaitable[Any]]):
+        self.run = run
+        self.names: Set[str] = set()
+        self._pending: List[str] = []
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._task = None
+        self.created = 0
+        self.written = 0
+
+    async def start(self):
+        self.names = await self.run(load_rooms)
+        self._task = asyncio.create_task(self._write_loop())
+
+    def ensure(self, name: str):
+        if name in self.names:
+            return
+        self.names.add(name)
+        self._pending.append(name)
+        self.created += 1
+        self._wakeup.set()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            self.written += await self.run(insert_rooms, batch)
+        except Exception:
+            logger.exception("Saving %d chat rooms failed, will retry", len(batch))
+            self._pending = batch + self._pending
+
+    async def _write_loop(self):
+        while not self._closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+            if self._pending:
+                await asyncio.sleep(1)
+                self._wakeup.set()
+
+    def metrics(self) -> dict:
+        return {
+            "rooms": len(self.names),
+            "created": self.created,
+            "written": self.written,
+            "pending": len(self._pending),
+        }
+
+    async def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+
+
+def get_room_registry(connection: HTTPConnection) -> RoomRegistry:
+    return connection.app.state.rooms
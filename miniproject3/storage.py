@@ -0,0 +1,177 @@
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, BinaryIO, Callable, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def digest_from_path(path: str):
+    """Хеш зі шляху контентно-адресованого файлу; None для старих імен з часовою міткою."""
+    name = os.path.basename(path)
+    return name if DIGEST_RE.match(name) else None
+
+
+class UploadTooLarge(HTTPException):
+    def __init__(self, max_bytes: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Файл більший за {max_bytes} байт",
+        )
+
+
+@dataclass(frozen=True)
+class StoredImage:
+    digest: str
+    path: str
+    size: int
+    content_type: str
+
+
+class ImageStorage:
+    """Контентно-адресоване сховище зображень.
+
+    Файл зберігається під своїм SHA-256 у шардованих каталогах
+    `root/ab/cd/abcd...`, тож однакові зображення займають місце один раз, а
+    кількість оголошень, що посилаються на файл, ведеться в таблиці `images`.
+
+    Рішення "використати наявний файл чи покласти новий" і видалення файлу
+    приймаються лише під `BEGIN IMMEDIATE` разом зі зміною `refcount`, тож
+    вони не перетинаються між запитами. `save` повертає зображення з уже
+    взятим посиланням; якщо оголошення так і не вставили, його треба
+    віддати через `discard`. `run(fn, *args)` виконує `fn(conn, *args)` у
+    пулі бази (`Database.run`).
+    """
+
+    def __init__(
+        self,
+        run: Callable[..., Awaitable[Any]],
+        root: str,
+        chunk_size: int = 64 * 1024,
+        max_bytes: int = 10 * 1024 * 1024,
+    ):
+        self.run = run
+        self.root = root
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self._tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def _copy(self, source: BinaryIO) -> Tuple[str, str, int]:
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as target:
+                while chunk := source.read(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(self.max_bytes)
+                    sha256.update(chunk)
+                    target.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, sha256.hexdigest(), size
+
+    def _reserve(self, conn: sqlite3.Connection, tmp_path: str, image: StoredImage):
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    """
+                    INSERT INTO images (hash, path, size, content_type, refcount)
+                    VALUES (?, ?, ?, ?, 1)
+                    ON CONFLICT (hash) DO UPDATE SET refcount = refcount + 1
+                    """,
+                    (image.digest, image.path, image.size, image.content_type),
+                )
+                if not os.path.exists(image.path):
+                    os.makedirs(os.path.dirname(image.path), exist_ok=True)
+                    os.replace(tmp_path, image.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def save(self, upload: UploadFile) -> StoredImage:
+        """Копіює завантаження на диск частинами по `chunk_size` і бере посилання на файл."""
+        await upload.seek(0)
+        tmp_path, digest, size = await run_in_threadpool(self._copy, upload.file)
+        image = StoredImage(digest, self.path_for(digest), size, upload.content_type)
+        await self.run(self._reserve, tmp_path, image)
+        return image
+
+    def discard(self, conn: sqlite3.Connection, image: StoredImage):
+        """Віддає посилання, взяте `save`; файл без посилань видаляється."""
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE images SET refcount = refcount - 1 WHERE hash = ?", (image.digest,))
+            unused = conn.execute(
+                "SELECT 1 FROM images WHERE hash = ? AND refcount <= 0", (image.digest,)
+            ).fetchone()
+            if unused is not None:
+                conn.execute("DELETE FROM images WHERE hash = ?", (image.digest,))
+                if os.path.exists(image.path):
+                    os.remove(image.path)
+
+
+def get_storage(connection: HTTPConnection) -> ImageStorage:
+    return connection.app.state.storage
+
+
+class UploadSizeLimitMiddleware:
+    """Відхиляє multipart-запити, більші за `max_bytes`, до розбору форми.
+
+    Заголовок Content-Length перевіряється одразу, а тіло без нього
+    рахується під час читання, тож завеликий запит не буферизується повністю.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = headers.get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse(
+                {"detail": "Request body too large"},
+                status_code=413,
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise UploadTooLarge(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не встановлено - працюємо лише з оригіналами
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+
+
+def variant_path(root: str, digest: str, size: str, ext: str) -> str:
+    return os.path.join(root, "derived", digest[:2], digest[2:4], digest, f"{size}.{ext}")
+
+
+def generate_variants(source: str, root: str, digest: str, sizes: Dict[str, int]) -> int:
+    """Створює мініатюри всіх розмірів у WebP та JPEG; виконується в окремому процесі."""
+    created = 0
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        for size, max_side in sizes.items():
+            thumb = original.copy()
+            thumb.thumbnail((max_side, max_side))
+            if thumb.mode not in ("RGB", "RGBA"):
+                thumb = thumb.convert("RGBA" if "transparency" in thumb.info else "RGB")
+
+            for ext, (pil_format, _) in FORMATS.items():
+                path = variant_path(root, digest, size, ext)
+                if os.path.exists(path):
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                image = thumb.convert("RGB") if pil_format == "JPEG" else thumb
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                image.save(tmp_path, pil_format, quality=80)
+                os.replace(tmp_path, path)
+                created += 1
+    return created
+
+
+class ThumbnailPipeline:
+    """Фонова генерація мініатюр у пулі процесів.
+
+    `submit` лише ставить задачу і повертається одразу, тож `/create/` не чекає
+    на обробку зображення. Для одного хешу одночасно виконується одна задача.
+    Готові хеші запам'ятовуються (до `max_ready`), тож запити зображень не
+    перевіряють файлову систему; решта перевіряється в пулі потоків.
+    """
+
+    def __init__(self, root: str, sizes: Dict[str, int], workers: int = 2, max_ready: int = 100_000):
+        self.root = root
+        self.sizes = sizes
+        self.workers = workers
+        self.max_ready = max_ready
+        self._ready: "OrderedDict[str, None]" = OrderedDict()
+        self.enabled = Image is not None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if self.enabled:
+            self._executor = self._create_executor()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _variants_exist(self, digest: str) -> bool:
+        return all(
+            os.path.exists(variant_path(self.root, digest, size, ext))
+            for size in self.sizes
+            for ext in FORMATS
+        )
+
+    def _mark_ready(self, digest: str):
+        self._ready[digest] = None
+        self._ready.move_to_end(digest)
+        if len(self._ready) > self.max_ready:
+            self._ready.popitem(last=False)
+
+    async def is_ready(self, digest: str) -> bool:
+        if digest in self._ready:
+            self._ready.move_to_end(digest)
+            return True
+        if digest in self._pending:
+            return False
+        # мініатюри з попереднього запуску або з іншого воркера
+        if await run_in_threadpool(self._variants_exist, digest):
+            self._mark_ready(digest)
+            return True
+        return False
+
+    def submit(self, digest: str, source: str) -> Optional[asyncio.Task]:
+        # наявні файли перевіряє сам generate_variants у процесі пулу
+        if not self.enabled or digest in self._pending or digest in self._ready:
+            return self._pending.get(digest)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, generate_variants, source, self.root, digest, self.sizes
+        )
+        task = asyncio.ensure_future(future)
+        self._pending[digest] = task
+        task.add_done_callback(lambda done: self._finished(digest, done))
+        return task
+
+    def _finished(self, digest: str, task: asyncio.Task):
+        self._pending.pop(digest, None)
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self._mark_ready(digest)
+            return
+        logger.warning("Thumbnail generation failed for %s: %s", digest, task.exception())
+        if isinstance(task.exception(), BrokenProcessPool):
+            self._executor.shutdown(wait=False)
+            self._executor = self._create_executor()
+
+    async def wait(self):
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_thumbnails(connection: HTTPConnection) -> ThumbnailPipeline:
+    return connection.app.state.thumbnails
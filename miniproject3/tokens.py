@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import hmac
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from starlette.requests import HTTPConnection
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    user_id: int
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class TokenSigner:
+    """Компактні токени доступу `<user_id>.<exp>.<HMAC-SHA256>`.
+
+    Підпис перевіряється без звернення до бази. Уже перевірені токени
+    зберігаються в обмеженому LRU до `max_cached` записів разом з часом
+    закінчення, тож повторний запит з тим самим токеном обходиться пошуком у
+    словнику, а прострочений запис не віддається і видаляється.
+    """
+
+    def __init__(self, secret: bytes, ttl: int = 3600, max_cached: int = 10_000):
+        self._mac = hmac.new(secret, digestmod=hashlib.sha256)
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._verified: "OrderedDict[str, TokenClaims]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def _signature(self, payload: str) -> str:
+        mac = self._mac.copy()
+        mac.update(payload.encode("ascii"))
+        return _b64encode(mac.digest())
+
+    def issue(self, user_id: int, now: Optional[float] = None) -> str:
+        expires_at = int(now if now is not None else time.time()) + self.ttl
+        payload = f"{user_id}.{expires_at}"
+        return f"{payload}.{self._signature(payload)}"
+
+    def verify_signature(self, token: str, now: Optional[float] = None) -> TokenClaims:
+        """Перевірка без кешу: формат, підпис, строк дії."""
+        payload, _, signature = token.rpartition(".")
+        user_id, _, expires_at = payload.partition(".")
+        if not (token.isascii() and user_id.isdigit() and expires_at.isdigit()):
+            raise InvalidToken("Malformed token")
+        if not hmac.compare_digest(signature, self._signature(payload)):
+            raise InvalidToken("Bad token signature")
+        claims = TokenClaims(int(user_id), int(expires_at))
+        if claims.expires_at <= (now if now is not None else time.time()):
+            raise InvalidToken("Token expired")
+        return claims
+
+    def verify(self, token: str, now: Optional[float] = None) -> TokenClaims:
+        now = now if now is not None else time.time()
+        claims = self._verified.get(token)
+        if claims is not None:
+            if claims.expires_at > now:
+                self._verified.move_to_end(token)
+                self.hits += 1
+                return claims
+            del self._verified[token]
+
+        self.misses += 1
+        try:
+            claims = self.verify_signature(token, now)
+        except InvalidToken:
+            self.failures += 1
+            raise
+        self._verified[token] = claims
+        if len(self._verified) > self.max_cached:
+            self._verified.popitem(last=False)
+        return claims
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._verified),
+            "max_cached": self.max_cached,
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def get_token_signer(connection: HTTPConnection) -> TokenSigner:
+    return connection.app.state.tokens
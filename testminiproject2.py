@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import miniproject2
+from miniproject2 import app, encode_cursor
+
+
+HEADERS = {"Authorization": "Bearer test"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(miniproject2, "DB_PATH", str(tmp_path / "users.db"))
+    with TestClient(app) as client:
+        for index, name in enumerate(["carol", "alice", "dave", "bob", "erin"]):
+            user = {
+                "name": name,
+                "year": 1990 + index,
+                "password": "password123",
+                "hobbies": [{"name": f"{name}-1"}, {"name": f"{name}-2"}],
+            }
+            assert client.post("/users/", json=user).status_code == 200
+        yield client
+
+
+def test_get_users_pages_by_cursor(client):
+    pages = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/users/", params=params, headers=HEADERS)
+        assert response.status_code == 200
+        pages.append(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert [[user["name"] for user in page] for page in pages] == [["alice", "bob"], ["carol", "dave"], ["erin"]]
+    assert pages[0][0]["hobbies"] == [{"name": "alice-1"}, {"name": "alice-2"}]
+    assert pages[2][0]["year"] == 1994
+
+
+def test_get_users_last_full_page_has_no_cursor(client):
+    response = client.get("/users/", params={"limit": 5}, headers=HEADERS)
+    assert len(response.json()) == 5
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get("/users/", params={"cursor": encode_cursor("erin")}, headers=HEADERS)
+    assert response.json() == []
+
+
+def test_get_users_without_limit_returns_everyone(client):
+    response = client.get("/users/", headers=HEADERS)
+    assert [user["name"] for user in response.json()] == ["alice", "bob", "carol", "dave", "erin"]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get("/users/", params={"cursor": encode_cursor("bob")}, headers=HEADERS)
+    assert [user["name"] for user in response.json()] == ["carol", "dave", "erin"]
+
+
+def test_get_users_rejects_bad_cursor_and_limit(client):
+    for cursor in ("%%%", encode_cursor("alice")[:-1] + "!", "_w=="):
+        response = client.get("/users/", params={"cursor": cursor}, headers=HEADERS)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+    assert client.get("/users/", params={"limit": 0}, headers=HEADERS).status_code == 422
+    assert client.get("/users/", params={"limit": 1001}, headers=HEADERS).status_code == 422
+    assert client.get("/users/").status_code == 401
@@ -0,0 +1,822 @@
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers, UploadFile
+
+from miniproject3 import config, main, refresh_tokens
+from miniproject3.bus import MAX_MESSAGE, Broker, UnixSocketBus
+from miniproject3.chat import ChatHub
+from miniproject3.db import Database, PoolTimeout
+from miniproject3.facets import diff as facets_diff
+from miniproject3.history import SCHEMA as messages_schema, ChatHistory, fetch_recent, insert_messages
+from miniproject3.ratelimit import SlidingWindowLimiter
+from miniproject3.rooms import RoomRegistry, insert_rooms
+from miniproject3.tokens import TokenSigner
+from miniproject3.passwords import (
+    HasherOverloaded, PasswordHasher, calibrate_rounds, hash_password, hash_rounds,
+)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    db_name = str(tmp_path / "ads.db")
+    monkeypatch.setattr(config, "DB_NAME", db_name)
+    monkeypatch.setattr(config, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(config, "PASSWORD_HASH_ROUNDS", 4)
+    with TestClient(main.app) as client:
+        yield client
+
+
+def insert_ads(prices, category="books"):
+    with sqlite3.connect(config.DB_NAME) as conn:
+        conn.executemany(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            [(f"Ad {i}", "text", price, category, "uploads/x.jpg") for i, price in enumerate(prices)],
+        )
+
+
+def test_database_reuses_released_connection_and_rolls_back(tmp_path):
+    db = Database(str(tmp_path / "pool.db"), size=1, timeout=0.05)
+    try:
+        with db.connection() as first:
+            first.execute("CREATE TABLE t (x INTEGER)")
+            first.execute("INSERT INTO t VALUES (1)")
+            with pytest.raises(PoolTimeout):
+                with db.connection():
+                    pass
+        with db.connection() as second:
+            assert second is first
+            assert not second.in_transaction
+            assert second.execute("SELECT count(*) FROM t").fetchone() == (0,)
+            assert second.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        metrics = db.metrics()
+        assert metrics["checkouts"] == 2 and metrics["in_use"] == 0 and metrics["idle"] == 1
+    finally:
+        db.close()
+
+
+def test_database_runs_off_event_loop_and_counts_waits(tmp_path):
+    def whoami(conn):
+        return threading.get_ident(), threading.current_thread().name, conn.execute("SELECT 1").fetchone()
+
+    def hold(conn):
+        time.sleep(0.05)
+
+    async def scenario():
+        db = Database(str(tmp_path / "pool.db"), size=1, workers=2)
+        try:
+            ident, name, row = await db.run(whoami)
+            await asyncio.gather(db.run(hold), db.run(hold))
+            return threading.get_ident(), ident, name, row, db.metrics()
+        finally:
+            db.close()
+
+    loop_ident, ident, name, row, metrics = asyncio.run(scenario())
+    assert ident != loop_ident and name.startswith("sqlite")
+    assert row == (1,)
+    assert metrics["checkouts"] == 3
+    assert metrics["contended_checkouts"] == 1
+    assert metrics["wait_max_ms"] >= 30
+
+
+def test_db_metrics_endpoint_reports_pool(client):
+    client.get("/filters/")
+    metrics = client.get("/metrics/db").json()
+    assert metrics["size"] == config.DB_POOL_SIZE
+    assert metrics["checkouts"] >= 1
+    assert metrics["in_use"] == 0 and metrics["idle"] == config.DB_POOL_SIZE
+
+
+def test_filters_cursor_pagination(client):
+    insert_ads([5, 1, 3, 3, 2])
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "sort": "price"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/filters/", params=params)
+        assert response.status_code == 200
+        seen.extend((ad["price"], ad["id"]) for ad in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == sorted(seen)
+    assert len(seen) == 5
+
+
+def test_filters_rejects_bad_cursor(client):
+    response = client.get("/filters/", params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_search_ranks_and_highlights(client):
+    insert_ads([10, 20])
+    with sqlite3.connect(config.DB_NAME) as conn:
+        conn.execute(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            ("Red bicycle", "Almost new bicycle", 150, "sport", "uploads/x.jpg"),
+        )
+
+    response = client.get("/search/", params={"q": "bicycle"})
+    assert response.status_code == 200
+    hits = response.json()
+    assert [hit["title"] for hit in hits] == ["Red bicycle"]
+    assert "<mark>bicycle</mark>" in hits[0]["title_highlight"]
+
+    response = client.get("/search/", params={"q": "bicycle", "category": "books"})
+    assert response.json() == []
+
+
+def test_search_finds_old_filtered_match_and_pages_all(client):
+    with sqlite3.connect(config.DB_NAME) as conn:
+        conn.execute(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            ("Old lamp", "reading lamp", 5, "books", "uploads/x.jpg"),
+        )
+        conn.executemany(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            [(f"Lamp {i}", "desk lamp", i, "home", "uploads/x.jpg") for i in range(30)],
+        )
+
+    response = client.get("/search/", params={"q": "lamp", "category": "books"})
+    assert [hit["title"] for hit in response.json()] == ["Old lamp"]
+
+    first = client.get("/search/", params={"q": "lamp", "limit": 4})
+    with sqlite3.connect(config.DB_NAME) as conn:
+        conn.execute(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            ("New lamp", "added later", 1, "home", "uploads/x.jpg"),
+        )
+    hits, cursor = first.json(), first.headers.get("X-Next-Cursor")
+    while cursor is not None:
+        response = client.get("/search/", params={"q": "lamp", "limit": 4, "cursor": cursor})
+        hits.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+
+    ids = [hit["id"] for hit in hits]
+    assert sorted(ids) == list(range(1, 32))
+    scores = [hit["score"] for hit in hits]
+    assert scores == sorted(scores)
+
+
+def test_search_ranks_newest_filtered_candidates_only(client, monkeypatch):
+    monkeypatch.setattr(main, "SEARCH_MAX_CANDIDATES", 5)
+    with sqlite3.connect(config.DB_NAME) as conn:
+        conn.execute(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            ("Old lamp", "reading lamp", 5, "books", "uploads/x.jpg"),
+        )
+        conn.executemany(
+            "INSERT INTO ads (title, description, price, category, image_path) VALUES (?, ?, ?, ?, ?)",
+            [(f"Lamp {i}", "desk lamp", i, "home", "uploads/x.jpg") for i in range(12)],
+        )
+
+    # фільтр застосовується до обмеження, тож старий збіг з іншої категорії знаходиться
+    response = client.get("/search/", params={"q": "lamp", "category": "books"})
+    assert [hit["title"] for hit in response.json()] == ["Old lamp"]
+
+    hits, cursor = [], None
+    while True:
+        params = {"q": "lamp", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/search/", params=params)
+        hits.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert sorted(hit["id"] for hit in hits) == list(range(9, 14))
+
+
+def auth_headers(client):
+    client.post("/register/", json={"name": "Test", "email": "test@gmail.com", "password": "password123"})
+    response = client.post("/token", data={"username": "test@gmail.com", "password": "password123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_create_ad_deduplicates_images(client):
+    headers = auth_headers(client)
+    form = {"title": "Chair", "description": "Oak chair", "price": "10", "category": "home"}
+
+    first = client.post("/create/", data=form, files={"image": ("a.png", b"same bytes", "image/png")}, headers=headers)
+    second = client.post("/create/", data=form, files={"image": ("b.png", b"same bytes", "image/png")}, headers=headers)
+
+    assert first.status_code == second.status_code == 201
+    assert first.json()["image_path"] == second.json()["image_path"]
+    with sqlite3.connect(config.DB_NAME) as conn:
+        assert conn.execute("SELECT refcount FROM images").fetchall() == [(2,)]
+
+
+def test_create_ad_removes_stored_image_when_insert_fails(client):
+    headers = auth_headers(client)
+    form = {"title": "Chair", "description": "Oak chair", "price": "10", "category": "home"}
+    kept = client.post("/create/", data=form, files={"image": ("a.png", b"kept", "image/png")}, headers=headers).json()
+    with sqlite3.connect(config.DB_NAME) as conn:
+        conn.execute("CREATE TRIGGER fail_insert BEFORE INSERT ON ads BEGIN SELECT RAISE(ABORT, 'boom'); END")
+
+    for payload in (b"orphan", b"kept"):
+        with pytest.raises(sqlite3.IntegrityError):
+            client.post("/create/", data=form, files={"image": ("b.png", payload, "image/png")}, headers=headers)
+
+    storage = main.app.state.storage
+    assert not os.path.exists(storage.path_for(hashlib.sha256(b"orphan").hexdigest()))
+    assert os.path.exists(kept["image_path"])
+    with sqlite3.connect(config.DB_NAME) as conn:
+        assert conn.execute("SELECT refcount FROM images").fetchall() == [(1,)]
+
+
+def test_stored_image_is_reserved_until_discarded(client):
+    storage, db = main.app.state.storage, main.app.state.db
+
+    def upload(payload):
+        return UploadFile(io.BytesIO(payload), filename="a.png", headers=Headers({"content-type": "image/png"}))
+
+    def refcount(digest):
+        with sqlite3.connect(config.DB_NAME) as conn:
+            return conn.execute("SELECT refcount FROM images WHERE hash = ?", (digest,)).fetchone()
+
+    # A і B завантажили той самий файл; вставка оголошення A не вдалася раніше, ніж B дійшов до своєї
+    first = client.portal.call(storage.save, upload(b"shared"))
+    second = client.portal.call(storage.save, upload(b"shared"))
+    assert first == second and refcount(first.digest) == (2,)
+    client.portal.call(db.run, storage.discard, first)
+    assert os.path.exists(second.path) and refcount(second.digest) == (1,)
+
+    client.portal.call(db.run, storage.discard, second)
+    assert not os.path.exists(second.path) and refcount(second.digest) is None
+    assert os.listdir(os.path.join(storage.root, "tmp")) == []
+
+
+def test_get_image_supports_etag_and_range(client):
+    headers = auth_headers(client)
+    form = {"title": "Chair", "description": "Oak chair", "price": "10", "category": "home"}
+    ad = client.post("/create/", data=form, files={"image": ("a.png", b"0123456789", "image/png")}, headers=headers).json()
+
+    response = client.get(ad["image_url"], headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206
+    assert response.content == b"2345"
+
+    etag = response.headers["ETag"]
+    assert client.get(ad["image_url"], headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(ad["thumbnails"]["small"]).headers["Cache-Control"] == "no-cache"
+
+
+def test_thumbnails_generated_in_process_pool_and_served(client):
+    Image = pytest.importorskip("PIL.Image")
+    headers = auth_headers(client)
+    png = io.BytesIO()
+    Image.new("RGB", (800, 600), "red").save(png, "PNG")
+    form = {"title": "Chair", "description": "Oak chair", "price": "10", "category": "home"}
+    ad = client.post("/create/", data=form, files={"image": ("a.png", png.getvalue(), "image/png")}, headers=headers).json()
+    client.portal.call(main.app.state.thumbnails.wait)
+
+    webp = client.get(ad["thumbnails"]["small"], headers={"Accept": "image/webp"})
+    assert webp.headers["content-type"] == "image/webp"
+    assert max(Image.open(io.BytesIO(webp.content)).size) == config.THUMBNAIL_SIZES["small"]
+    jpeg = client.get(ad["thumbnails"]["medium"])
+    assert jpeg.headers["content-type"] == "image/jpeg"
+
+    cached = client.get(ad["thumbnails"]["small"], headers={"Accept": "image/webp", "If-None-Match": webp.headers["ETag"]})
+    assert cached.status_code == 304
+
+
+def test_filters_cache_invalidated_by_create(client):
+    insert_ads([5])
+    assert client.get("/filters/").headers["X-Cache"] == "MISS"
+    assert client.get("/filters/").headers["X-Cache"] == "HIT"
+
+    headers = auth_headers(client)
+    form = {"title": "Chair", "description": "Oak chair", "price": "10", "category": "home"}
+    client.post("/create/", data=form, files={"image": ("a.png", b"img", "image/png")}, headers=headers)
+
+    response = client.get("/filters/")
+    assert response.headers["X-Cache"] == "MISS"
+    assert len(response.json()) == 2
+    assert client.get("/metrics/cache").json()["hits"] == 1
+
+
+def test_facets_follow_inserts_updates_and_deletes(client):
+    insert_ads([50, 150, 700], category="books")
+    insert_ads([20000], category="auto")
+    with sqlite3.connect(config.DB_NAME) as conn:
+        conn.execute("UPDATE ads SET price = 60 WHERE price = 700")
+        conn.execute("DELETE FROM ads WHERE category = 'auto'")
+
+    facets = client.get("/facets/").json()
+    assert facets["total"] == 3
+    assert facets["categories"] == [{"category": "books", "count": 3}]
+    assert [bucket["count"] for bucket in facets["price_histogram"][:2]] == [2, 1]
+
+    with sqlite3.connect(config.DB_NAME) as conn:
+        assert facets_diff(conn) == []
+
+
+def test_import_ndjson_and_csv(client):
+    headers = auth_headers(client)
+    created = client.post(
+        "/create/",
+        data={"title": "Base", "description": "d", "price": "1", "category": "books"},
+        files={"image": ("a.png", b"image", "image/png")},
+        headers=headers,
+    ).json()
+    digest = created["image_path"].rsplit("/", 1)[-1]
+
+    ndjson = "\n".join([
+        f'{{"title": "Imported lamp", "description": "d", "price": 10, "category": "home", "image_hash": "{digest}"}}',
+        '{"title": "", "description": "d", "price": 10, "category": "home"}',
+        "not json",
+        f'{{"title": "Unknown", "description": "d", "price": 10, "category": "home", "image_hash": "{"0" * 64}"}}',
+    ])
+    response = client.post(
+        "/import/", content=ndjson, headers={**headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 1
+    assert [error["line"] for error in response.json()["errors"]] == [2, 3, 4]
+
+    csv_body = (
+        f'title,description,price,category,image_hash\n"Multi\nline",d,5,home,{digest}\n'
+        f'Bad,d,-1,home,{digest}\n'
+    )
+    response = client.post("/import/", content=csv_body, headers={**headers, "Content-Type": "text/csv"})
+    assert response.json()["inserted"] == 1
+    assert [error["line"] for error in response.json()["errors"]] == [4]
+
+    ndjson = json.dumps({"title": "By path", "description": "d", "price": 1, "category": "home",
+                         "image_path": created["image_path"]})
+    response = client.post("/import/", content=ndjson, headers={**headers, "Content-Type": "application/x-ndjson"})
+    assert response.json()["inserted"] == 1
+    assert client.post(
+        "/import/", content="title,bogus\n", headers={**headers, "Content-Type": "text/csv"}
+    ).status_code == 400
+
+    assert client.get("/search/", params={"q": "lamp"}).json()[0]["title"] == "Imported lamp"
+    assert client.get("/facets/").json()["total"] == 4
+    with sqlite3.connect(config.DB_NAME) as conn:
+        assert facets_diff(conn) == []
+        assert conn.execute("SELECT refcount FROM images").fetchall() == [(4,)]
+
+
+def test_export_streams_filtered_rows(client, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_CHUNK_SIZE", 2)
+    insert_ads([10, 20, 30], category="books")
+    insert_ads([40], category="auto")
+
+    ndjson = client.get("/export/", params={"category": "books", "min_price": 15})
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["price"] for line in ndjson.text.splitlines()] == [20, 30]
+
+    assert [ad["category"] for ad in client.get("/export/", params={"format": "json"}).json()] == [
+        "books", "books", "books", "auto"
+    ]
+    assert client.get("/export/", params={"format": "json", "category": "none"}).json() == []
+
+    compressed = client.get("/export/", params={"format": "csv", "gzip": "true"})
+    assert compressed.headers["content-disposition"] == 'attachment; filename="ads.csv.gz"'
+    rows = list(csv.reader(io.StringIO(gzip.decompress(compressed.content).decode())))
+    assert rows[0] == ["id", "title", "description", "price", "category", "image_path"]
+    assert len(rows) == 5
+
+
+def test_filters_fast_path_matches_response_model(client, monkeypatch):
+    insert_ads([10.5, 3])
+    validated = client.get("/filters/")
+    assert validated.headers["content-type"] == "application/json"
+    assert [main.Ad.model_validate(ad).model_dump() for ad in validated.json()] == validated.json()
+
+    monkeypatch.setattr(main.AD_LIST, "trusted", True)
+    main.app.state.list_cache.invalidate()
+    trusted = client.get("/filters/")
+    assert trusted.headers["X-Cache"] == "MISS"
+    assert trusted.content == validated.content
+
+    schema = client.get("/openapi.json").json()["paths"]["/filters/"]["get"]["responses"]["200"]
+    assert schema["content"]["application/json"]["schema"]["items"] == {"$ref": "#/components/schemas/Ad"}
+
+
+def test_password_hasher_rejects_when_queue_is_full():
+    async def scenario():
+        hasher = PasswordHasher(workers=1, max_queue=0, queue_timeout=1, rounds=4)
+        hashed = await hasher.hash("password123")
+        assert await hasher.verify("password123", hashed)
+
+        busy = asyncio.ensure_future(hasher._submit(time.sleep, 0.2))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HasherOverloaded) as exc:
+            await hasher.verify("password123", hashed)
+        await busy
+        hasher.close()
+        return exc.value, hasher.metrics()
+
+    error, metrics = asyncio.run(scenario())
+    assert error.status_code == 503 and "Retry-After" in error.headers
+    assert metrics["rejected"] == 1
+    assert metrics["completed"] == 3
+
+
+def test_signed_tokens_authorize_without_database(client):
+    headers = auth_headers(client)
+    assert client.get("/test/", headers=headers).json() == "hello"
+    assert client.get("/test/", headers=headers).json() == "hello"
+    assert client.get("/metrics/tokens").json()["hits"] >= 1
+
+    token = headers["Authorization"].removeprefix("Bearer ")
+    user_id, expires_at, signature = token.split(".")
+    forged = f"{int(user_id) + 1}.{expires_at}.{signature}"
+    response = client.get("/test/", headers={"Authorization": f"Bearer {forged}"})
+    assert response.status_code == 401
+    assert response.headers["www-authenticate"] == "Bearer"
+
+    signer = main.app.state.tokens
+    expired = signer.issue(int(user_id), now=0)
+    assert client.get("/test/", headers={"Authorization": f"Bearer {expired}"}).status_code == 401
+    assert client.post(
+        "/create/",
+        data={"title": "t", "description": "d", "price": "1", "category": "c"},
+        files={"image": ("a.png", b"x", "image/png")},
+        headers={"Authorization": "Bearer garbage"},
+    ).status_code == 401
+
+
+def test_startup_requires_token_secret_for_several_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DB_NAME", str(tmp_path / "ads.db"))
+    monkeypatch.setattr(config, "TOKEN_SECRET", b"")
+    monkeypatch.setattr(config, "WEB_CONCURRENCY", 4)
+    with pytest.raises(RuntimeError, match="TOKEN_SECRET"):
+        with TestClient(main.app):
+            pass
+
+    monkeypatch.setattr(config, "TOKEN_SECRET", b"shared secret")
+    monkeypatch.setattr(config, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(config, "PASSWORD_HASH_ROUNDS", 4)
+    other_worker = TokenSigner(b"shared secret")
+    with TestClient(main.app) as client:
+        assert client.app.state.tokens.verify(other_worker.issue(7)).user_id == 7
+
+
+def test_login_rehashes_password_with_current_cost(client):
+    headers = auth_headers(client)
+    with sqlite3.connect(config.DB_NAME) as conn:
+        conn.execute("UPDATE users SET password = ?", (hash_password("password123", rounds=6),))
+
+    response = client.post("/token", data={"username": "test@gmail.com", "password": "password123"})
+    assert response.status_code == 200
+    with sqlite3.connect(config.DB_NAME) as conn:
+        (stored,) = conn.execute("SELECT password FROM users").fetchone()
+    assert hash_rounds(stored) == 4
+    assert client.get("/metrics/passwords").json()["rehashed"] == 1
+    assert client.get("/test/", headers=headers).status_code == 200
+
+
+def test_calibrate_rounds_respects_target_and_floor():
+    fast = calibrate_rounds(target_ms=10_000, min_rounds=4, max_rounds=6)
+    assert fast["rounds"] == 6 and fast["within_target"]
+
+    slow = calibrate_rounds(target_ms=0.001, min_rounds=4, max_rounds=6)
+    assert slow["rounds"] == 4 and not slow["within_target"]
+
+
+def test_refresh_tokens_rotate_detect_reuse_and_purge(client):
+    auth_headers(client)
+    login = client.post("/token", data={"username": "test@gmail.com", "password": "password123"}).json()
+
+    refreshed = client.post("/token/refresh", json={"refresh_token": login["refresh_token"]})
+    assert refreshed.status_code == 200
+    rotated = refreshed.json()["refresh_token"]
+    assert rotated != login["refresh_token"]
+    assert client.get("/test/", headers={"Authorization": f"Bearer {refreshed.json()['access_token']}"}).status_code == 200
+
+    reused = client.post("/token/refresh", json={"refresh_token": login["refresh_token"]})
+    assert reused.status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": rotated}).status_code == 401
+
+    again = client.post("/token", data={"username": "test@gmail.com", "password": "password123"}).json()
+    assert client.post("/token/revoke", json={"refresh_token": again["refresh_token"]}).json() == {"revoked": 1}
+    assert client.post("/token/refresh", json={"refresh_token": again["refresh_token"]}).status_code == 401
+
+    with sqlite3.connect(config.DB_NAME) as conn:
+        for _ in range(5):
+            refresh_tokens.issue(conn, 1, ttl=-1)
+        assert refresh_tokens.purge_expired(conn, batch_size=2) == 2
+        assert refresh_tokens.purge_expired(conn, batch_size=10) == 3
+
+
+def test_login_limiter_rejects_before_bcrypt(client, monkeypatch):
+    auth_headers(client)
+    limiter = main.app.state.login_limiter
+    monkeypatch.setattr(limiter.per_account, "limit", 2)
+    verified = []
+    original_verify = main.app.state.hasher.verify
+
+    async def counting_verify(*args):
+        verified.append(args)
+        return await original_verify(*args)
+
+    monkeypatch.setattr(main.app.state.hasher, "verify", counting_verify)
+    bad = {"username": "test@gmail.com", "password": "wrong-password"}
+    assert [client.post("/token", data=bad).status_code for _ in range(3)] == [400, 400, 429]
+    assert len(verified) == 2
+
+    response = client.post("/token", data={**bad, "username": " TEST@gmail.com"})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["retry-after"]) <= 60
+
+
+def test_sliding_window_limiter_window_and_eviction():
+    limiter = SlidingWindowLimiter(limit=2, window=10, max_keys=2, shards=1)
+    assert limiter.hit("a", now=0) is None and limiter.hit("a", now=1) is None
+    assert limiter.hit("a", now=2) == 8
+    # у другому вікні попередні 2 спроби в момент 15 важать 2 * (1 - 5/10) = 1
+    assert limiter.hit("a", now=15) is None
+    assert limiter.hit("a", now=15) == 1
+    assert limiter.hit("a", now=16) is None
+
+    limiter.hit("b", now=16)
+    limiter.hit("c", now=16)
+    assert len(limiter) == 2 and limiter.evictions == 1
+
+
+def test_chat_broadcast_reaches_room_members(client):
+    with client.websocket_connect("/ws/lobby") as first, client.websocket_connect("/ws/lobby") as second:
+        first.send_text("hello")
+        assert first.receive_text() == "hello"
+        assert second.receive_text() == "hello"
+        assert client.get("/metrics/chat").json()["clients"] == 2
+
+
+class StalledSocket:
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.received = []
+        self.close_code = None
+
+    async def send_text(self, message):
+        if self.stalled:
+            await asyncio.sleep(3600)
+        self.received.append(message)
+
+    async def close(self, code=1000, reason=""):
+        self.close_code = code
+
+
+def test_chat_slow_client_does_not_block_room():
+    async def scenario(policy):
+        hub = ChatHub(max_queue=5, policy=policy, send_timeout=60)
+        healthy, stalled = StalledSocket(), StalledSocket(stalled=True)
+        healthy_client = hub.join("room", healthy)
+        stalled_client = hub.join("room", stalled)
+        for i in range(10):
+            hub.broadcast("room", str(i))
+            await asyncio.sleep(0.001)
+        metrics = hub.metrics()
+        await hub.leave("room", healthy_client)
+        await hub.leave("room", stalled_client)
+        return healthy, stalled, stalled_client, metrics
+
+    healthy, stalled, stalled_client, metrics = asyncio.run(scenario("drop-oldest"))
+    assert healthy.received == [str(i) for i in range(10)]
+    # "0" завис у send_text, у черзі останні 5, решта викинуті
+    assert metrics["queued_max"] == 5
+    assert stalled_client.dropped == 4 and metrics["dropped"] == 4
+
+    healthy, stalled, stalled_client, metrics = asyncio.run(scenario("disconnect"))
+    assert healthy.received == [str(i) for i in range(10)]
+    assert stalled.close_code == 1013
+    assert metrics["clients"] == 1 and metrics["disconnected"] == 1
+
+
+def test_chat_rooms_span_workers_through_unix_broker(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "chat.sock")
+        server = await Broker().serve(path)
+        first, second = ChatHub(bus=UnixSocketBus(path)), ChatHub(bus=UnixSocketBus(path))
+        await first.start()
+        await second.start()
+
+        here, there, elsewhere = StalledSocket(), StalledSocket(), StalledSocket()
+        clients = [first.join("room", here), second.join("room", there), second.join("other", elsewhere)]
+        await asyncio.sleep(0.05)
+        first.broadcast("room", "from first")
+        second.broadcast("room", "from second")
+        await asyncio.sleep(0.05)
+
+        for hub, client, room in zip((first, second, second), clients, ("room", "room", "other")):
+            await hub.leave(room, client)
+        await first.close()
+        await second.close()
+        server.close()
+        return here.received, there.received, elsewhere.received
+
+    here, there, elsewhere = asyncio.run(scenario())
+    assert here == ["from first", "from second"]
+    assert there == ["from second", "from first"]
+    assert elsewhere == []
+
+
+def test_unix_bus_survives_failing_callback_oversized_message_and_reconnect(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "chat.sock")
+        broker = Broker()
+        server = await broker.serve(path)
+        received = []
+
+        def on_message(room, message, message_id):
+            if message == "boom":
+                raise RuntimeError("closed client")
+            received.append((message, message_id))
+
+        listener, sender = UnixSocketBus(path, reconnect_delay=0.01), UnixSocketBus(path, reconnect_delay=0.01)
+        await listener.connect(on_message)
+        await sender.connect(lambda room, message, message_id: None)
+        listener.subscribe("room")
+        await asyncio.sleep(0.05)
+        for number, message in enumerate(("boom", "é" * MAX_MESSAGE * 2, "after")):
+            sender.publish("room", message, f"w1-{number}")
+        await asyncio.sleep(0.05)
+
+        old_writer = listener._writer
+        for subscriber in list(broker.rooms["room"]):
+            subscriber.close()
+        await asyncio.sleep(0.1)
+        sender.publish("room", "reconnected", "w1-3")
+        await asyncio.sleep(0.05)
+
+        metrics, sender_metrics = listener.metrics(), sender.metrics()
+        await listener.close()
+        await sender.close()
+        server.close()
+        return received, metrics, sender_metrics, old_writer.is_closing()
+
+    received, metrics, sender_metrics, old_writer_closed = asyncio.run(scenario())
+    assert received == [("after", "w1-2"), ("reconnected", "w1-3")]
+    assert metrics["failed"] == 1 and metrics["reconnects"] == 1
+    assert old_writer_closed
+    assert sender_metrics["oversized"] == 1 and sender_metrics["published"] == 3
+
+
+def test_room_registry_checks_memory_and_persists_new_rooms_in_background(tmp_path):
+    conn = sqlite3.connect(tmp_path / "rooms.db")
+    conn.execute("CREATE TABLE rooms (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL)")
+    conn.execute("INSERT INTO rooms (name) VALUES ('lobby')")
+    conn.commit()
+    calls = []
+    failing = {"insert": False}
+
+    async def run(fn, *args):
+        calls.append(fn.__name__)
+        if fn is insert_rooms and failing["insert"]:
+            raise sqlite3.OperationalError("database is locked")
+        return fn(conn, *args)
+
+    async def wait_for(condition):
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.005)
+        raise AssertionError("condition not reached")
+
+    async def scenario():
+        registry = RoomRegistry(run)
+        await registry.start()
+        registry.ensure("lobby")
+        assert calls == ["load_rooms"]
+
+        registry.ensure("new")
+        registry.ensure("new")
+        await wait_for(lambda: registry.written == 1)
+        assert calls == ["load_rooms", "insert_rooms"]
+
+        failing["insert"] = True
+        registry.ensure("broken")
+        await wait_for(lambda: calls.count("insert_rooms") == 2)
+        # невдалий запис повертається в чергу, кімната лишається відомою
+        assert registry.metrics()["pending"] == 1 and "broken" in registry.names
+        failing["insert"] = False
+        await registry.flush()
+        await registry.close()
+        return registry.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics == {"rooms": 3, "created": 2, "written": 2, "pending": 0}
+    assert {name for name, in conn.execute("SELECT name FROM rooms")} == {"lobby", "new", "broken"}
+
+
+def test_chat_history_replays_from_memory_and_after_restart(client, monkeypatch):
+    with client.websocket_connect("/ws/lobby") as first:
+        for text in ("one", "two", "three"):
+            first.send_text(text)
+            assert first.receive_text() == text
+    with client.websocket_connect("/ws/lobby") as late:
+        assert [late.receive_text() for _ in range(3)] == ["one", "two", "three"]
+    client.__exit__(None, None, None)
+
+    monkeypatch.setattr(config, "CHAT_HISTORY_REPLAY", 2)
+
+    with sqlite3.connect(config.DB_NAME) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages WHERE room = 'lobby'").fetchone()[0] == 3
+    with TestClient(main.app) as restarted, restarted.websocket_connect("/ws/lobby") as late:
+        assert [late.receive_text(), late.receive_text()] == ["two", "three"]
+        assert restarted.get("/metrics/chat").json()["history"]["replay_misses"] == 1
+
+
+def test_chat_history_cold_load_keeps_messages_arriving_meanwhile(tmp_path):
+    class GatedDatabase:
+        def __init__(self, path):
+            self.conn = sqlite3.connect(path)
+            self.conn.executescript(messages_schema)
+            self.gate = asyncio.Event()
+            self.fetches = 0
+
+        async def run(self, fn, *args):
+            if fn is fetch_recent:
+                self.fetches += 1
+                await self.gate.wait()
+            return fn(self.conn, *args)
+
+    async def scenario():
+        db = GatedDatabase(str(tmp_path / "chat.db"))
+        insert_messages(db.conn, [("lobby", "w0-0", "old", time.time())])
+        history = ChatHistory(db, replay_size=10, flush_interval=60)
+        history.record("lobby", "ok", "w1-0")
+        first = asyncio.create_task(history.recent("lobby"))
+        second = asyncio.create_task(history.recent("lobby"))
+        await asyncio.sleep(0)
+        history.record("lobby", "local", "w1-1")
+        # запис пакета не чекає на завантаження кімнати
+        await asyncio.wait_for(history.flush(), 1)
+        # інший воркер записав своє повідомлення й опублікував його в шину
+        insert_messages(db.conn, [("lobby", "w2-0", "remote", time.time())])
+        history.remember("lobby", "remote", "w2-0")
+        # той самий текст з іншим id - інше повідомлення, а не дубль
+        history.remember("lobby", "ok", "w2-1")
+        db.gate.set()
+        replays = await asyncio.gather(first, second)
+        history.remember("lobby", "late", "w2-2")
+        return replays, await history.recent("lobby"), db.fetches, history.metrics()
+
+    replays, warm, fetches, metrics = asyncio.run(scenario())
+    expected = ["old", "ok", "local", "remote", "ok"]
+    assert replays == [expected, expected]
+    assert warm == expected + ["late"]
+    assert fetches == 1
+    assert metrics["replay_misses"] == 1 and metrics["rooms_loading"] == 0
+
+
+def test_chat_history_keeps_rings_of_rooms_with_members(tmp_path):
+    class MemoryDatabase:
+        def __init__(self):
+            self.conn = sqlite3.connect(tmp_path / "chat.db")
+            self.conn.executescript(messages_schema)
+
+        async def run(self, fn, *args):
+            return fn(self.conn, *args)
+
+    async def scenario():
+        history = ChatHistory(MemoryDatabase(), max_rooms=1, flush_interval=60)
+        hub = ChatHub(history=history)
+        client = hub.join("busy", StalledSocket())
+        await history.recent("busy")
+        await history.recent("quiet")
+        hub.deliver("busy", "kept", "w2-0")
+        cached = history.metrics()["rooms_cached"]
+        busy = await history.recent("busy")
+        await hub.leave("busy", client)
+        await history.recent("other")
+        return cached, busy, history.metrics()
+
+    cached, busy, metrics = asyncio.run(scenario())
+    assert cached == 2 and busy == ["kept"]
+    assert metrics["rooms_cached"] == 1 and metrics["rooms_pinned"] == 0
+    assert metrics["replay_misses"] == 3
+
+
+def test_chat_coalesces_room_messages_into_one_frame():
+    async def scenario():
+        hub = ChatHub(coalesce_window=0.2)
+        batched, plain = StalledSocket(), StalledSocket()
+        clients = [hub.join("room", batched, batched=True), hub.join("room", plain)]
+        for text in ("a", "b", "c"):
+            hub.broadcast("room", text)
+        await asyncio.sleep(0.02)
+        before_window = list(batched.received), list(plain.received)
+        await asyncio.sleep(0.3)
+        for client in clients:
+            await hub.leave("room", client)
+        return before_window, batched.received, plain.received, hub.metrics()
+
+    before_window, batched, plain, metrics = asyncio.run(scenario())
+    assert before_window == ([], ["a", "b", "c"])
+    assert [json.loads(frame) for frame in batched] == [["a", "b", "c"]]
+    assert plain == ["a", "b", "c"]
+    assert metrics["batch_frames"] == 1 and metrics["batched_messages"] == 3